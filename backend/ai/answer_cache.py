@@ -0,0 +1,292 @@
+"""
+Кэш готовых ответов Татьяны.
+
+Многие вопросы к /ai/ask почти повторяют друг друга, а каждый стоит
+полного запроса к GigaChat. Ответ генератора зависит только от вопроса,
+найденных фрагментов законов и намерения, поэтому ключ кэша:
+
+    (отпечаток вопроса, intent, отпечаток контекста)
+
+- отпечаток вопроса — леммы нормализованного текста (регистр, «ё»,
+  сокращения кодексов и словоформы не влияют);
+- отпечаток контекста — sha1 по (document_id, текст фрагмента) в порядке
+  ранжирования. Если процитированный документ изменился, ретривер вернёт
+  новый текст, ключ не совпадёт, а старая запись для того же вопроса
+  удаляется при первом же обращении (счётчик invalidations).
+
+Опционально (LEGALAI_ANSWER_CACHE_SEMANTIC=1) вопрос кодируется
+эмбеддингом, и при промахе по точному ключу ищется запись с тем же
+контекстом и intent и косинусной близостью вопроса не ниже порога.
+Кодируется только сам вопрос пользователя: общие для всех запросов
+служебные правила (routers/ai.py) сделали бы любые вопросы «похожими».
+Остальной текст запроса (правила, текст вложений) для семантического
+попадания должен совпасть точно (отпечаток frame).
+Поиск и ранжирование выполняются всегда — кэш экономит только генерацию.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from .rag.dense import Embedder
+from .rag.retriever import (
+    TOKEN_RE,
+    lemmatize_tokens,
+    normalize_legal_abbreviations,
+    normalize_russian_query,
+)
+
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None
+
+ANSWER_CACHE_MAX_SIZE = int(os.getenv("LEGALAI_ANSWER_CACHE_MAX_SIZE", "512"))
+ANSWER_CACHE_TTL_SEC = float(os.getenv("LEGALAI_ANSWER_CACHE_TTL_SEC", "3600"))
+ANSWER_CACHE_SEMANTIC = os.getenv("LEGALAI_ANSWER_CACHE_SEMANTIC", "0") == "1"
+# Минимальная косинусная близость вопросов для семантического попадания.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("LEGALAI_ANSWER_CACHE_SIMILARITY", "0.95"))
+
+DocTuple = Tuple[Any, str]
+
+
+def query_fingerprint(query: str) -> str:
+    """Отпечаток вопроса: леммы нормализованного текста в исходном порядке."""
+    text = normalize_legal_abbreviations(normalize_russian_query(query))
+    lemmas = lemmatize_tokens(TOKEN_RE.findall(text))
+    return " ".join(lemmas)
+
+
+def context_fingerprint(docs: Sequence[DocTuple]) -> str:
+    """Отпечаток контекста генерации: id и тексты фрагментов."""
+    digest = hashlib.sha1()
+    for doc_id, text in docs:
+        digest.update(str(doc_id).encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update((text or "").encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+def frame_fingerprint(query: str, question: Optional[str]) -> str:
+    """Отпечаток запроса без самого вопроса (служебные правила, вложения)."""
+    frame = query.replace(question, "", 1) if question else ""
+    return hashlib.sha1(frame.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    # Сколько длилась исходная генерация — столько экономит каждое попадание.
+    generation_ms: float
+    expires_at: float
+    vector: Any = None
+    frame: str = ""
+
+
+class AnswerKey:
+    """Ключ записи кэша + вектор вопроса (если считался при lookup)."""
+
+    __slots__ = ("fingerprint", "intent", "context", "frame", "vector")
+
+    def __init__(
+        self,
+        fingerprint: str,
+        intent: Optional[str],
+        context: str,
+        frame: str = "",
+    ) -> None:
+        self.fingerprint = fingerprint
+        self.intent = intent
+        self.context = context
+        self.frame = frame
+        self.vector: Any = None
+
+    @property
+    def bucket(self) -> tuple:
+        return (self.fingerprint, self.intent)
+
+    @property
+    def tuple(self) -> tuple:
+        return (self.fingerprint, self.intent, self.context)
+
+
+class AnswerCache:
+    """
+    Потокобезопасный LRU-кэш ответов с TTL, семантическим поиском
+    и счётчиками для /ai/retriever/stats.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = ANSWER_CACHE_MAX_SIZE,
+        ttl: float = ANSWER_CACHE_TTL_SEC,
+        embedder: Optional[Embedder] = None,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.embedder = embedder if np is not None else None
+        self.similarity = similarity
+        self._data: "OrderedDict[tuple, CachedAnswer]" = OrderedDict()
+        # (fingerprint, intent) -> последний отпечаток контекста
+        self._contexts: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "embed_errors": 0,
+            "saved_ms_total": 0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def _embed(self, query: str) -> Any:
+        if self.embedder is None:
+            return None
+        try:
+            return self.embedder.embed([query])[0]
+        except Exception:
+            with self._lock:
+                self._stats["embed_errors"] += 1
+            return None
+
+    def _drop(self, key: tuple) -> None:
+        self._data.pop(key, None)
+        bucket = key[:2]
+        if self._contexts.get(bucket) == key[2]:
+            del self._contexts[bucket]
+
+    def _hit(self, key: tuple, entry: CachedAnswer, semantic: bool) -> str:
+        self._data.move_to_end(key)
+        self._stats["hits"] += 1
+        self._stats["semantic_hits"] += semantic
+        self._stats["saved_ms_total"] += entry.generation_ms
+        return entry.answer
+
+    def lookup(
+        self,
+        query: str,
+        intent: Optional[str],
+        docs: Sequence[DocTuple],
+        question: Optional[str] = None,
+    ) -> Tuple[Optional[str], AnswerKey]:
+        """
+        Ответ из кэша (или None) и ключ, по которому сохранять новый ответ.
+        question — вопрос пользователя внутри query; эмбеддинг считается
+        только по нему. Блокирующий вызов (эмбеддинг) — из async-кода
+        через пул потоков.
+        """
+        key = AnswerKey(
+            query_fingerprint(query),
+            intent,
+            context_fingerprint(docs),
+            frame_fingerprint(query, question),
+        )
+        if not self.enabled:
+            return None, key
+
+        now = time.monotonic()
+        with self._lock:
+            stale = self._contexts.get(key.bucket)
+            if stale is not None and stale != key.context:
+                # Процитированные нормы изменились — старый ответ больше не верен.
+                self._drop(key.bucket + (stale,))
+                self._stats["invalidations"] += 1
+
+            entry = self._data.get(key.tuple)
+            if entry is not None:
+                if entry.expires_at > now:
+                    return self._hit(key.tuple, entry, semantic=False), key
+                self._drop(key.tuple)
+                self._stats["expirations"] += 1
+
+        if self.embedder is not None:
+            key.vector = self._embed(question or query)
+            if key.vector is not None:
+                with self._lock:
+                    best, best_key = self.similarity, None
+                    for other, candidate in self._data.items():
+                        if other[1:] != (intent, key.context) or candidate.vector is None:
+                            continue
+                        if candidate.frame != key.frame:
+                            continue
+                        if candidate.expires_at <= now:
+                            continue
+                        score = float(np.dot(candidate.vector, key.vector))
+                        if score >= best:
+                            best, best_key = score, other
+                    if best_key is not None:
+                        return self._hit(best_key, self._data[best_key], semantic=True), key
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, key
+
+    def store(self, key: AnswerKey, answer: str, generation_ms: float) -> None:
+        if not self.enabled or not answer:
+            return
+        entry = CachedAnswer(
+            answer=answer,
+            generation_ms=generation_ms,
+            expires_at=time.monotonic() + self.ttl,
+            vector=key.vector,
+            frame=key.frame,
+        )
+        with self._lock:
+            stale = self._contexts.get(key.bucket)
+            if stale is not None and stale != key.context:
+                self._drop(key.bucket + (stale,))
+                self._stats["invalidations"] += 1
+            self._data[key.tuple] = entry
+            self._data.move_to_end(key.tuple)
+            self._contexts[key.bucket] = key.context
+            self._stats["stores"] += 1
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._contexts.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            size = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        saved = stats.pop("saved_ms_total")
+        data: Dict[str, Any] = {k: int(v) for k, v in stats.items()}
+        data.update(
+            {
+                "size": size,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "semantic": self.embedder is not None,
+                "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+                "saved_llm_ms": round(saved, 1),
+                "avg_saved_ms": round(saved / stats["hits"], 1) if stats["hits"] else 0.0,
+            }
+        )
+        return data
+
+
+def default_answer_cache(embedder: Optional[Embedder] = None) -> AnswerCache:
+    """AnswerCache по настройкам окружения (эмбеддер — только при SEMANTIC=1)."""
+    return AnswerCache(embedder=embedder if ANSWER_CACHE_SEMANTIC else None)
+
@@ -0,0 +1,205 @@
+"""
+Потоковый разбор ответа Татьяны с маркерами этапа 2.8.
+
+Ответ ядра в формате wrap_ai_response:
+    <<<MODE:EDIT>>>
+    <<<DRAFT>>>
+    ...черновик...
+    <<<END>>>
+приходит по кусочкам произвольной длины. AnswerStreamParser раскладывает
+их по каналам («answer» — текст в чат, «draft» — черновик для редактора)
+сразу, не дожидаясь конца ответа: строка придерживается только пока
+может оказаться маркером (начинается с «<<<»).
+
+Итоговая сборка ответа остаётся за routers/ai.py::_unwrap_answer —
+поток нужен для раннего показа текста, а финальное событие несёт
+полный ответ.
+
+SafetyGate — сторона ядра: текст генератора уходит клиенту только после
+проверки SafetyVerifier.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import Callable, List, Optional, Tuple
+
+MARKER_PREFIX = "<<<"
+
+# Граница, на которой проверяется накопленный ответ: конец предложения
+# (знак препинания перед пробелом) или строки.
+SENTENCE_END_RE = re.compile(r"[.!?…;:](?=\s)|\n")
+# Без границ (длинный перечень без точек) текст придерживается не дольше
+# этого числа символов и затем режется по последнему пробелу.
+STREAM_CHECK_MAX_CHARS = int(os.getenv("LEGALAI_STREAM_CHECK_MAX_CHARS", "300"))
+
+# (канал, дельта текста)
+StreamEvent = Tuple[str, str]
+
+
+class AnswerStreamParser:
+    """Инкрементальный разбор маркеров MODE / DRAFT / COMMENT / END."""
+
+    def __init__(self) -> None:
+        self.mode: Optional[str] = None
+        # NONE | MAIN | DRAFT | COMMENT, как в _unwrap_answer
+        self._state = "NONE"
+        self._line = ""          # придержанное начало текущей строки
+        self._line_open = False  # часть строки уже отдана: маркером она не станет
+        self._seen_start = False
+        self._started = {"answer": False, "draft": False}
+        self._pending_newlines = {"answer": 0, "draft": 0}
+        self._comment_started = False
+
+    def _channel(self) -> Optional[str]:
+        if self._state == "DRAFT":
+            return "draft"
+        if self._state in ("MAIN", "COMMENT"):
+            return "answer"
+        return None
+
+    def _emit(self, text: str, events: List[StreamEvent]) -> None:
+        channel = self._channel()
+        if channel is None or not text:
+            return
+        if self._state == "COMMENT" and not self._comment_started:
+            text = text.lstrip()
+            if not text:
+                return
+            self._comment_started = True
+            # COMMENT дописывается к тексту ответа через пустую строку.
+            if self._started["answer"]:
+                self._pending_newlines["answer"] = 2
+        if not self._started[channel]:
+            # ведущие пробелы канала срезаются (как strip() в _unwrap_answer)
+            text = text.lstrip()
+            if not text:
+                return
+            self._started[channel] = True
+        if self._pending_newlines[channel]:
+            text = "\n" * self._pending_newlines[channel] + text
+            self._pending_newlines[channel] = 0
+        events.append((channel, text))
+
+    def _end_line(self) -> None:
+        channel = self._channel()
+        # Переносы строк отдаём только вместе со следующим текстом канала,
+        # чтобы перед <<<END>>> не оставался хвостовой \n.
+        if channel is not None and self._started[channel]:
+            self._pending_newlines[channel] += 1
+
+    def _handle_marker(self, line: str) -> bool:
+        if line.startswith("<<<MODE:") and line.endswith(">>>"):
+            self.mode = line[len("<<<MODE:"):-3].strip().upper() or "ANSWER"
+            self._state = "MAIN"
+        elif line == "<<<DRAFT>>>":
+            self._state = "DRAFT"
+        elif line == "<<<COMMENT>>>":
+            self._state = "COMMENT"
+        elif line == "<<<END>>>":
+            self._state = "NONE"
+        else:
+            return False
+        return True
+
+    def feed(self, chunk: str) -> List[StreamEvent]:
+        """Принимает очередной кусок ответа, возвращает готовые дельты."""
+        events: List[StreamEvent] = []
+        if not self._seen_start:
+            head = (self._line + chunk).lstrip()
+            if not head:
+                self._line += chunk
+                return events
+            if len(head) < len(MARKER_PREFIX) and MARKER_PREFIX.startswith(head):
+                self._line += chunk
+                return events
+            self._seen_start = True
+            if not head.startswith(MARKER_PREFIX):
+                # Ответ без маркеров — весь текст идёт в чат.
+                self._state = "MAIN"
+                self.mode = "ANSWER"
+
+        buffer = self._line + chunk
+        self._line = ""
+        while buffer:
+            newline = buffer.find("\n")
+            if newline < 0:
+                if self._line_open:
+                    self._emit(buffer, events)
+                else:
+                    probe = buffer.lstrip()
+                    if probe.startswith(MARKER_PREFIX) or MARKER_PREFIX.startswith(probe):
+                        self._line = buffer
+                    else:
+                        self._emit(buffer, events)
+                        self._line_open = True
+                break
+
+            line, buffer = buffer[:newline], buffer[newline + 1:]
+            if self._line_open or not self._handle_marker(line.strip()):
+                self._emit(line, events)
+                self._end_line()
+            self._line_open = False
+        return events
+
+    def close(self) -> List[StreamEvent]:
+        """Досылает придержанный хвост в конце потока."""
+        events: List[StreamEvent] = []
+        if self._line:
+            line, self._line = self._line, ""
+            if not self._seen_start:
+                self._state, self.mode = "MAIN", "ANSWER"
+            if not self._handle_marker(line.strip()):
+                self._emit(line, events)
+        return events
+
+
+class SafetyGate:
+    """
+    Проверка безопасности потокового ответа до отправки клиенту.
+
+    Куски генератора придерживаются до границы предложения; перед
+    отправкой весь уже собранный ответ проходит verify. Проверки
+    SafetyVerifier монотонны по префиксу (длина, длинные числа), поэтому
+    небезопасный фрагмент до клиента не доходит, а число, разрезанное
+    между кусками, не проскакивает по частям. Цена — текст приходит
+    предложениями, а не токенами. Проверка готового ответа целиком
+    в ConsultantCore.ask_stream остаётся.
+    """
+
+    def __init__(
+        self,
+        verify: Callable[[str], bool],
+        max_pending: int = STREAM_CHECK_MAX_CHARS,
+    ) -> None:
+        self.verify = verify
+        self.max_pending = max_pending
+        self.text = ""      # проверенный и отданный текст
+        self._pending = ""
+        self.safe = True
+
+    def _release(self, ready: str) -> Optional[str]:
+        if not ready:
+            return ""
+        if not self.verify(self.text + ready):
+            self.safe = False
+            return None
+        self.text += ready
+        return ready
+
+    def feed(self, delta: str) -> Optional[str]:
+        """Текст, который можно отдать ("" — пока придержан; None — ответ небезопасен)."""
+        self._pending += delta
+        cut = 0
+        for match in SENTENCE_END_RE.finditer(self._pending):
+            cut = match.end()
+        if not cut and len(self._pending) > self.max_pending:
+            cut = max(self._pending.rfind(" "), self._pending.rfind("\t")) + 1
+        ready, self._pending = self._pending[:cut], self._pending[cut:]
+        return self._release(ready)
+
+    def close(self) -> Optional[str]:
+        """Проверяет и отдаёт остаток в конце потока."""
+        ready, self._pending = self._pending, ""
+        return self._release(ready)
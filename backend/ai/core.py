@@ -1,16 +1,30 @@
-from typing import Any, Dict, List, Sequence, Tuple
-
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .answer_cache import AnswerCache, AnswerKey, default_answer_cache
+from .answer_stream import SafetyGate
+from .metrics import observe_pipeline
+from .pipeline import Pipeline, Stage
 from .tatyana_profile import TATYANA_SYSTEM_PROMPT
-from .rag.retriever import DocumentRetriever
+from .rag.retriever import RETRIEVER_MODE, DocumentRetriever
+from .rag.hybrid import HybridRetriever
 from .rag.ranker import DocumentRanker
 from .rag.citation import CitationNormalizer
-from .generators.local_gen import LocalGenerator
+from .generators.local_gen import GenerationInterrupted, LocalGenerator
 from .verifiers.safety import SafetyVerifier
 from .verifiers.law_guard import LawGuard
 from .verifiers.risk_checker import RiskChecker
 from .router_rubert import RuBERTIntentClassifier
 
 
+# Сколько вопросов ask_many обрабатывает одновременно (ранжирование +
+# генерация): ограничивает параллельные запросы к GigaChat.
+ASK_BATCH_CONCURRENCY = int(os.getenv("LEGALAI_ASK_BATCH_CONCURRENCY", "4"))
+
+
 class ConsultantCore:
     """
     Оркестратор логики юридического консультанта.
@@ -30,16 +44,108 @@ class ConsultantCore:
         law_guard: LawGuard | None = None,
         risk_checker: RiskChecker | None = None,
         intent_classifier: RuBERTIntentClassifier | None = None,
+        answer_cache: AnswerCache | None = None,
     ) -> None:
         self.system_prompt = system_prompt
-        self.retriever = retriever or DocumentRetriever()
-        self.ranker = ranker or DocumentRanker()
+        if retriever is None:
+            retriever = (
+                HybridRetriever() if RETRIEVER_MODE == "hybrid" else DocumentRetriever()
+            )
+        self.retriever = retriever
+        self.ranker = ranker or DocumentRanker(pool=getattr(retriever, "pool", None))
         self.citation_normalizer = citation_normalizer or CitationNormalizer()
         self.generator = generator or LocalGenerator(system_prompt=system_prompt)
         self.safety = safety or SafetyVerifier()
         self.law_guard = law_guard or LawGuard()
         self.risk_checker = risk_checker or RiskChecker()
         self.intent_classifier = intent_classifier or RuBERTIntentClassifier()
+        self.answer_cache = answer_cache or default_answer_cache(
+            embedder=getattr(retriever, "embedder", None)
+        )
+
+    async def _cached_answer(
+        self,
+        query: str,
+        intent: str | None,
+        docs: Sequence[Tuple[str, str]],
+        question: str | None = None,
+    ) -> Tuple[Optional[str], AnswerKey]:
+        """
+        Ответ из кэша; эмбеддинг вопроса (семантический режим, только
+        question без служебных правил) — в пуле потоков.
+        """
+        if self.answer_cache.embedder is None:
+            return self.answer_cache.lookup(query, intent, docs, question)
+        return await self.retriever.executor.run(
+            self.answer_cache.lookup, query, intent, docs, question
+        )
+
+    def _generation_engine(
+        self,
+        answer: str,
+        query: str,
+        intent: str | None,
+        docs: Sequence[Tuple[str, str]],
+    ) -> str:
+        """Кто сформулировал ответ: gigachat или локальный fallback генератора."""
+        if answer == self.generator.fallback_answer(query, docs, intent):
+            return "fallback"
+        return "gigachat"
+
+    def _context_stages(
+        self,
+        query: str,
+        intent: str | None,
+        context: Dict[str, Any] | None,
+        intent_text: str | None,
+        documents: Sequence[Tuple[str, str]] | None = None,
+    ) -> List[Stage]:
+        """
+        Этапы до генерации. Поиск (в пуле потоков) и определение намерения
+        не зависят друг от друга и идут одновременно; LawGuard нужен только
+        список цитат, поэтому он не ждёт генерацию. documents — уже
+        найденные фрагменты (ask_many), тогда поиск не выполняется.
+        """
+
+        def retrieve(_: Dict[str, Any]):
+            if documents is not None:
+                return list(documents)
+            return self.retriever.aretrieve(query, top_k=8)
+
+        def detect_intent(_: Dict[str, Any]) -> str:
+            # Контекстный режим редактирования фрагмента
+            if context and isinstance(context, dict) and context.get("mode") == "edit_fragment":
+                return "template"
+            # /ai/ask передаёт готовый intent (classify_intent в роутере) —
+            # второй раз его не определяем. Классификатор ядра — только для
+            # вызовов без intent, по тексту вопроса без служебных инструкций.
+            return intent or self.intent_classifier.classify(intent_text or query)
+
+        def validate_citations(r: Dict[str, Any]) -> List[Dict[str, Any]]:
+            # Проверка ссылок на нормы (мягкий режим)
+            try:
+                return self.law_guard.validate_references(r["citations"])
+            except Exception:
+                return r["citations"]
+
+        return [
+            Stage("retrieve", retrieve),
+            Stage("intent", detect_intent),
+            # Метаданные актов для ранжирования тоже читаются из SQLite.
+            # Признаки ранжирования — по вопросу, а не по служебным правилам.
+            Stage(
+                "rank",
+                lambda r: self.ranker.rank(intent_text or query, r["retrieve"]),
+                deps=("retrieve",),
+                blocking=True,
+            ),
+            Stage(
+                "citations",
+                lambda r: self.citation_normalizer.normalize(r["rank"]),
+                deps=("rank",),
+            ),
+            Stage("law_guard", validate_citations, deps=("citations",)),
+        ]
 
     async def ask(
         self,
@@ -47,9 +153,15 @@ class ConsultantCore:
         *,
         intent: str | None = None,
         context: Dict[str, Any] | None = None,
+        intent_text: str | None = None,
+        documents: Sequence[Tuple[str, str]] | None = None,
     ) -> Dict[str, Any]:
         """
         Основной режим: получить ответ Татьяны с цитатами и анализом рисков.
+
+        intent_text — сам вопрос, если query содержит служебные инструкции
+        (routers/ai.py): по нему определяется намерение и ранжируются нормы;
+        documents — уже найденные фрагменты (ask_many). В debug — время этапов.
         """
         clean_query = query.strip()
         if not clean_query:
@@ -57,70 +169,277 @@ class ConsultantCore:
                 "Пустой запрос. Пожалуйста, сформулируйте ваш вопрос или ситуацию."
             )
 
-        # 1. Определяем намерение пользователя (можно форсировать извне)
-        if intent is None:
-            intent = self.intent_classifier.classify(clean_query)
-
-        # Контекстный режим редактирования фрагмента
-        if context and isinstance(context, dict) and context.get("mode") == "edit_fragment":
-            intent = "template"
+        async def generate(r: Dict[str, Any]) -> Tuple[str, AnswerKey | None]:
+            # Готовый ответ для того же вопроса и тех же норм берём из кэша.
+            answer, key = await self._cached_answer(
+                clean_query, r["intent"], r["rank"], intent_text
+            )
+            if answer is not None:
+                return answer, None
+            answer = await self.generator.generate(
+                query=clean_query,
+                context_docs=r["rank"],
+                intent=r["intent"],
+            )
+            return answer, key
 
-        # 2. Ищем документы (СИНХРОННЫЙ вызов, без await!)
-        docs: Sequence[Tuple[str, str]] = self.retriever.retrieve(
-            clean_query, top_k=8
+        # === ТЗ 5.4: явная ссылка на использованные вложения ===
+        stages = self._context_stages(clean_query, intent, context, intent_text, documents) + [
+            Stage("generate", generate, deps=("rank", "intent")),
+            # Проверки готового ответа независимы друг от друга и идут
+            # одновременно в пуле потоков, не занимая event loop.
+            Stage(
+                "safety",
+                lambda r: self.safety.verify(r["generate"][0]),
+                deps=("generate",),
+                blocking=True,
+            ),
+            Stage(
+                "risk",
+                lambda r: self.risk_checker.analyze(r["generate"][0]),
+                deps=("generate",),
+                blocking=True,
+            ),
+        ]
+        results = await Pipeline(stages, executor=self.retriever.executor).run()
+
+        answer, answer_key = results["generate"]
+        intent = results["intent"]
+        engine = (
+            "cache"
+            if answer_key is None
+            else self._generation_engine(answer, clean_query, intent, results["rank"])
         )
+        observe_pipeline(results["debug"], intent, engine)
+        if not results["safety"]:
+            raise ValueError(
+                "AI-ответ не прошёл проверку безопасности. Попробуйте переформулировать вопрос."
+            )
+        # Локальные откаты не кэшируются: GigaChat может вернуться.
+        if engine == "gigachat":
+            self.answer_cache.store(
+                answer_key,
+                answer,
+                results["debug"]["stages"]["generate"]["ms"],
+            )
 
-        # 3. Ранжируем документы
-        ranked_docs = self.ranker.rank(clean_query, docs)
-
-        # 4. Преобразуем документы в список цитат
-        citations = self.citation_normalizer.normalize(ranked_docs)
+        # --- ЭТАП 2.8: строгий формат ответа (MODE / DRAFT) ---
+        mode = _answer_mode(intent)
 
-        # 5. Генерируем ответ
-        answer = self.generator.generate(
-            query=clean_query,
-            context_docs=ranked_docs,
-            intent=intent,
+        answer_wrapped = wrap_ai_response(
+            mode=mode,
+            main_text=answer,
+            comment=EDIT_COMMENT if mode == "EDIT" else None,
         )
-        # === ТЗ 5.4: явная ссылка на использованные вложения ===
 
-        # 6. Проверка безопасности
-        if not self.safety.verify(answer):
-            raise ValueError(
-                "AI-ответ не прошёл проверку безопасности. Попробуйте переформулировать вопрос."
-            )
+        return {
+            "answer": answer_wrapped,
+            "citations": results["law_guard"],
+            "intent": intent,
+            "risk_info": results["risk"],
+            "debug": results["debug"],
+        }
 
-        # 7. Проверка ссылок на нормы (мягкий режим)
+    async def ask_many(
+        self,
+        requests: Sequence[str | Dict[str, Any]],
+        *,
+        concurrency: int = ASK_BATCH_CONCURRENCY,
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any] | Exception]]:
+        """
+        Пакетный ask: пары (индекс вопроса, результат ask или исключение)
+        в порядке готовности.
+
+        Элемент requests — строка или словарь с ключами query и, по желанию,
+        intent / context / intent_text (как аргументы ask). Одинаковые вопросы
+        обрабатываются один раз, результат отдаётся под каждым индексом.
+        Поиск по всем вопросам (по intent_text, если задан) — одно задание
+        пула потоков, генерация —
+        не более concurrency вопросов одновременно.
+        """
+        specs: List[Dict[str, Any]] = []
+        groups: List[List[int]] = []
+        seen: Dict[str, int] = {}
+        for index, item in enumerate(requests):
+            spec = {"query": item} if isinstance(item, str) else dict(item)
+            spec["query"] = str(spec.get("query") or "").strip()
+            key = json.dumps(
+                [spec["query"], spec.get("intent"), spec.get("intent_text"), spec.get("context")],
+                sort_keys=True,
+                ensure_ascii=False,
+                default=str,
+            )
+            if key not in seen:
+                seen[key] = len(specs)
+                specs.append(spec)
+                groups.append([])
+            groups[seen[key]].append(index)
+
+        # Поиск — по самому вопросу (intent_text), без служебных инструкций
+        # и вложений: одинаковые вопросы ищутся один раз.
+        search: Dict[str, int] = {}
+        for spec in specs:
+            search.setdefault(spec.get("intent_text") or spec["query"], len(search))
+        found = await self.retriever.executor.run(self.retriever.retrieve_many, list(search), 8)
+        documents = [found[search[spec.get("intent_text") or spec["query"]]] for spec in specs]
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def answer(n: int) -> Tuple[int, Dict[str, Any] | Exception]:
+            spec = specs[n]
+            async with semaphore:
+                try:
+                    return n, await self.ask(
+                        spec["query"],
+                        intent=spec.get("intent"),
+                        context=spec.get("context"),
+                        intent_text=spec.get("intent_text"),
+                        documents=documents[n],
+                    )
+                except Exception as exc:  # noqa: BLE001
+                    return n, exc
+
+        tasks = [asyncio.ensure_future(answer(n)) for n in range(len(specs))]
         try:
-            validated_citations = self.law_guard.validate_references(citations)
-        except Exception:
-            validated_citations = citations
-
-        # 8. Анализ рисков
-        risk_info = self.risk_checker.analyze(answer)
+            for done in asyncio.as_completed(tasks):
+                n, result = await done
+                for index in groups[n]:
+                    yield index, result
+        finally:
+            # Клиент отключился — незавершённые вопросы больше не нужны.
+            for task in tasks:
+                task.cancel()
+
+    async def ask_stream(
+        self,
+        query: str,
+        *,
+        intent: str | None = None,
+        context: Dict[str, Any] | None = None,
+        intent_text: str | None = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковый вариант ask: события по мере готовности.
+
+          {"event": "citations", "citations", "intent"} — сразу после поиска;
+          {"event": "chunk", "text"} — куски ответа в формате wrap_ai_response
+              (маркеры MODE / DRAFT / END приходят тоже кусками);
+          {"event": "done", "answer", "citations", "intent", "risk_info", "debug"} —
+              то же, что возвращает ask;
+          {"event": "error", "detail"} — ответ не прошёл проверку безопасности
+              (куски генератора проверяются до отправки, по предложениям);
+          {"event": "error", "detail", "truncated": True} — генерация оборвалась
+              посреди ответа; такой ответ не кэшируется.
+        """
+        clean_query = query.strip()
+        if not clean_query:
+            raise ValueError(
+                "Пустой запрос. Пожалуйста, сформулируйте ваш вопрос или ситуацию."
+            )
 
-        # --- ЭТАП 2.8: строгий формат ответа (MODE / DRAFT) ---
-        mode = "ANSWER"
-        if intent == "template":
-            mode = "EDIT"
-        elif intent in ("analysis", "risk_check"):
-            mode = "ANALYSIS"
+        origin = time.perf_counter()
+        results = await Pipeline(
+            self._context_stages(clean_query, intent, context, intent_text),
+            executor=self.retriever.executor,
+        ).run()
+        intent = results["intent"]
+        ranked_docs = results["rank"]
+        validated_citations = results["law_guard"]
+
+        # Цитаты известны до генерации — отдаём их первым событием.
+        yield {"event": "citations", "citations": validated_citations, "intent": intent}
+
+        mode = _answer_mode(intent)
+        header = "<<<MODE:EDIT>>>\n<<<DRAFT>>>\n" if mode == "EDIT" else f"<<<MODE:{mode}>>>\n"
+        yield {"event": "chunk", "text": header}
+
+        started = time.perf_counter()
+        answer, answer_key = await self._cached_answer(
+            clean_query, intent, ranked_docs, intent_text
+        )
+        from_cache = answer is not None
+        if from_cache:
+            # Готовый ответ отдаём одним куском.
+            answer = answer.strip()
+            yield {"event": "chunk", "text": answer}
+        else:
+            # Текст уходит клиенту предложениями, уже проверенным
+            # SafetyVerifier (см. SafetyGate), а не после всего ответа.
+            gate = SafetyGate(self.safety.verify)
+            stream = self.generator.generate_stream(
+                query=clean_query,
+                context_docs=ranked_docs,
+                intent=intent,
+            )
+            try:
+                async for delta in stream:
+                    ready = gate.feed(delta)
+                    if ready is None:
+                        break
+                    if ready:
+                        yield {"event": "chunk", "text": ready}
+                else:
+                    ready = gate.close()
+                    if ready:
+                        yield {"event": "chunk", "text": ready}
+            except GenerationInterrupted:
+                yield {
+                    "event": "error",
+                    "detail": "Ответ прервался на середине. Повторите запрос.",
+                    "truncated": True,
+                }
+                return
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            if not gate.safe:
+                # Небезопасное предложение и всё после него клиенту не ушли.
+                yield {
+                    "event": "error",
+                    "detail": "AI-ответ не прошёл проверку безопасности. Попробуйте переформулировать вопрос.",
+                }
+                return
+            answer = gate.text.strip()
+        generated = time.perf_counter()
+
+        checks = await Pipeline(
+            [
+                Stage("safety", lambda r: self.safety.verify(answer), blocking=True),
+                Stage("risk", lambda r: self.risk_checker.analyze(answer), blocking=True),
+            ],
+            executor=self.retriever.executor,
+        ).run()
+        debug = _merge_debug(origin, results["debug"], (started, generated), checks["debug"])
+        engine = (
+            "cache"
+            if from_cache
+            else self._generation_engine(answer, clean_query, intent, ranked_docs)
+        )
+        observe_pipeline(debug, intent, engine)
+        if not checks["safety"]:
+            yield {
+                "event": "error",
+                "detail": "AI-ответ не прошёл проверку безопасности. Попробуйте переформулировать вопрос.",
+            }
+            return
+        if engine == "gigachat":
+            self.answer_cache.store(answer_key, answer, debug["stages"]["generate"]["ms"])
 
         answer_wrapped = wrap_ai_response(
             mode=mode,
             main_text=answer,
-            comment=(
-                "Предложена правка/текст для применения к выбранному фрагменту."
-                if mode == "EDIT"
-                else None
-            ),
+            comment=EDIT_COMMENT if mode == "EDIT" else None,
         )
+        # Хвост контракта: <<<END>>> и (для EDIT) блок COMMENT.
+        yield {"event": "chunk", "text": answer_wrapped[len(header) + len(answer):]}
 
-        return {
+        yield {
+            "event": "done",
             "answer": answer_wrapped,
             "citations": validated_citations,
             "intent": intent,
-            "risk_info": risk_info,
+            "risk_info": checks["risk"],
+            "debug": debug,
         }
 
     async def check(self, query: str) -> Dict[str, Any]:
@@ -133,22 +452,14 @@ class ConsultantCore:
                 "Пустой запрос. Пожалуйста, сформулируйте ваш вопрос или ситуацию."
             )
 
-        intent = self.intent_classifier.classify(clean_query)
-
-        docs: Sequence[Tuple[str, str]] = self.retriever.retrieve(
-            clean_query, top_k=8
-        )
-        ranked_docs = self.ranker.rank(clean_query, docs)
-        citations = self.citation_normalizer.normalize(ranked_docs)
-
-        try:
-            validated_citations = self.law_guard.validate_references(citations)
-        except Exception:
-            validated_citations = citations
+        results = await Pipeline(
+            self._context_stages(clean_query, None, None, None),
+            executor=self.retriever.executor,
+        ).run()
 
         return {
-            "intent": intent,
-            "citations": validated_citations,
+            "intent": results["intent"],
+            "citations": results["law_guard"],
         }
 
     async def suggest(self, query: str) -> Dict[str, Any]:
@@ -196,6 +507,40 @@ class ConsultantCore:
         }
 
 
+EDIT_COMMENT = "Предложена правка/текст для применения к выбранному фрагменту."
+
+
+def _merge_debug(
+    origin: float,
+    before: Dict[str, Any],
+    generation: Tuple[float, float],
+    after: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    debug потокового ответа: этапы до генерации, генерация и проверки
+    на одной шкале времени (от origin — начала обработки запроса).
+    """
+    generation_started, generation_done = generation
+    stages = dict(before["stages"])
+    stages["generate"] = {
+        "start_ms": round((generation_started - origin) * 1000, 3),
+        "ms": round((generation_done - generation_started) * 1000, 3),
+    }
+    offset = (generation_done - origin) * 1000
+    for name, timing in after["stages"].items():
+        stages[name] = {"start_ms": round(offset + timing["start_ms"], 3), "ms": timing["ms"]}
+    return {"stages": stages, "total_ms": round(offset + after["total_ms"], 3)}
+
+
+def _answer_mode(intent: str | None) -> str:
+    """Режим контракта ответа (этап 2.8) по намерению."""
+    if intent == "template":
+        return "EDIT"
+    if intent in ("analysis", "risk_check"):
+        return "ANALYSIS"
+    return "ANSWER"
+
+
 def wrap_ai_response(mode: str, main_text: str, comment: str | None = None) -> str:
     """
     Этап 2.8 — строгий контракт ответа ИИ (MODE / DRAFT).
@@ -1,8 +1,12 @@
+import asyncio
 import base64  # пока оставим, хотя сейчас не используем
+import json
+import logging
 import os
+import random
 import time
 import uuid
-from typing import Dict, List, Optional, Union
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 
 from dotenv import load_dotenv
 
@@ -10,6 +14,34 @@ load_dotenv()
 
 import httpx
 
+from ..metrics import GIGACHAT_REQUEST_SECONDS
+from .token_store import GIGACHAT_TOKEN_CACHE, TokenStore, token_key
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # type: ignore  # noqa: F401  (нужен httpx для HTTP/2)
+except Exception:
+    h2 = None
+
+
+# Параметры долгоживущего HTTP-клиента (один на процесс / адаптер).
+GIGACHAT_HTTP2 = os.getenv("GIGACHAT_HTTP2", "1") == "1"
+GIGACHAT_MAX_CONNECTIONS = int(os.getenv("GIGACHAT_MAX_CONNECTIONS", "20"))
+GIGACHAT_MAX_KEEPALIVE = int(os.getenv("GIGACHAT_MAX_KEEPALIVE", "10"))
+GIGACHAT_KEEPALIVE_EXPIRY = float(os.getenv("GIGACHAT_KEEPALIVE_EXPIRY", "60"))
+GIGACHAT_CONNECT_TIMEOUT = float(os.getenv("GIGACHAT_CONNECT_TIMEOUT", "5"))
+GIGACHAT_POOL_TIMEOUT = float(os.getenv("GIGACHAT_POOL_TIMEOUT", "10"))
+GIGACHAT_AUTH_TIMEOUT = float(os.getenv("GIGACHAT_AUTH_TIMEOUT", "20"))
+GIGACHAT_CHAT_TIMEOUT = float(os.getenv("GIGACHAT_CHAT_TIMEOUT", "60"))
+
+# Токен считается истёкшим за TOKEN_MARGIN сек до срока; фоновое обновление
+# запускается за RENEW_BEFORE сек (минус случайный сдвиг, чтобы воркеры
+# не просыпались одновременно).
+GIGACHAT_TOKEN_MARGIN = float(os.getenv("GIGACHAT_TOKEN_MARGIN", "30"))
+GIGACHAT_TOKEN_RENEW_BEFORE = float(os.getenv("GIGACHAT_TOKEN_RENEW_BEFORE", "300"))
+GIGACHAT_TOKEN_RENEW_JITTER = float(os.getenv("GIGACHAT_TOKEN_RENEW_JITTER", "30"))
+
 
 class GigaChatConfigError(Exception):
     """Ошибка конфигурации GigaChat (нет client_id / client_secret)."""
@@ -24,6 +56,11 @@ class GigaChatAdapter:
     - получение и кеширование access_token;
     - вызов /chat/completions;
     - спокойная обработка ошибок (fallback).
+
+    Все запросы асинхронные и идут через один httpx.AsyncClient
+    (keep-alive, HTTP/2 если установлен h2), поэтому TCP+TLS не
+    устанавливается заново на каждый вызов, а медленный ответ модели
+    не блокирует event loop.
     """
 
     def __init__(
@@ -35,6 +72,10 @@ class GigaChatAdapter:
         chat_url: str = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions",
         verify: Union[bool, str] = False,
         model: str = "GigaChat",
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        token_store: Optional[TokenStore] = None,
+        renew_before: float = GIGACHAT_TOKEN_RENEW_BEFORE,
+        renew_jitter: float = GIGACHAT_TOKEN_RENEW_JITTER,
     ) -> None:
         # client_id сейчас почти не используется, но оставляем для совместимости
         self.client_id = client_id
@@ -48,6 +89,67 @@ class GigaChatAdapter:
 
         self._access_token: Optional[str] = None
         self._expires_at: float = 0.0
+        self.token_margin = GIGACHAT_TOKEN_MARGIN
+        self.renew_before = renew_before
+        self.renew_jitter = renew_jitter
+        # Общий кэш токена между процессами (None — только память процесса)
+        self.token_store = token_store
+        self._token_key = token_key(auth_url, scope, client_secret)
+        self.token_stats: Dict[str, int] = {
+            "oauth_requests": 0,
+            "from_store": 0,
+            "renewals": 0,
+        }
+
+        # transport — для тестов (httpx.MockTransport / локальная заглушка)
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        # Привязаны к event loop, пересоздаются вместе с клиентом.
+        self._token_lock: Optional[asyncio.Lock] = None
+        self._renew_task: Optional["asyncio.Task[None]"] = None
+
+    # -------------------------------------------------------------------------
+    # HTTP-КЛИЕНТ
+    # -------------------------------------------------------------------------
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Общий AsyncClient адаптера. Соединения пула привязаны к event loop,
+        поэтому при смене loop (тесты, скрипты с asyncio.run) клиент
+        создаётся заново.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                http2=GIGACHAT_HTTP2 and h2 is not None,
+                verify=self.verify,
+                transport=self.transport,
+                limits=httpx.Limits(
+                    max_connections=GIGACHAT_MAX_CONNECTIONS,
+                    max_keepalive_connections=GIGACHAT_MAX_KEEPALIVE,
+                    keepalive_expiry=GIGACHAT_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    GIGACHAT_CHAT_TIMEOUT,
+                    connect=GIGACHAT_CONNECT_TIMEOUT,
+                    pool=GIGACHAT_POOL_TIMEOUT,
+                ),
+            )
+            self._client_loop = loop
+            self._token_lock = asyncio.Lock()
+            self._renew_task = None
+        return self._client
+
+    async def aclose(self) -> None:
+        """Закрывает соединения пула (при остановке приложения)."""
+        if self._renew_task is not None and not self._renew_task.done():
+            self._renew_task.cancel()
+        self._renew_task = None
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
 
     # -------------------------------------------------------------------------
     # ИНИЦИАЛИЗАЦИЯ ИЗ ОКРУЖЕНИЯ
@@ -85,18 +187,86 @@ class GigaChatAdapter:
             auth_url=auth_url,
             chat_url=chat_url,
             verify=verify,
+            token_store=TokenStore(GIGACHAT_TOKEN_CACHE) if GIGACHAT_TOKEN_CACHE else None,
         )
 
     # -------------------------------------------------------------------------
     # ПОЛУЧЕНИЕ ТОКЕНА
     # -------------------------------------------------------------------------
 
-    def _get_access_token(self) -> str:
-        now = time.time()
+    async def _get_access_token(self) -> str:
+        """
+        Действующий токен. Обновление single-flight: при истёкшем токене
+        в OAuth идёт одна корутина, остальные ждут её результата.
+        """
         # если токен ещё живой — используем его
-        if self._access_token and now < self._expires_at - 30:
+        if self._access_token and time.time() < self._expires_at - self.token_margin:
             return self._access_token
 
+        self._get_client()
+        async with self._token_lock:
+            # пока ждали блокировку, токен мог обновить кто-то другой
+            if not (self._access_token and time.time() < self._expires_at - self.token_margin):
+                await self._refresh_token(valid_until=time.time() + self.token_margin)
+        self._ensure_renewal()
+        return self._access_token
+
+    async def _refresh_token(self, valid_until: float) -> None:
+        """
+        Получает токен, действующий дольше valid_until: сначала из общего
+        кэша процессов, иначе из OAuth (под lease, чтобы флот воркеров
+        не ходил туда одновременно).
+        """
+        store = self.token_store
+        if store is None:
+            await self._fetch_token()
+            return
+
+        if await self._adopt_from_store(valid_until):
+            return
+
+        try:
+            leased = await asyncio.to_thread(store.try_lease, self._token_key, GIGACHAT_AUTH_TIMEOUT)
+        except Exception as exc:
+            logger.debug("GigaChat token store unavailable: %s", exc)
+            await self._fetch_token()
+            return
+
+        if not leased:
+            # Другой воркер уже обновляет токен — ждём его запись.
+            deadline = time.time() + GIGACHAT_AUTH_TIMEOUT
+            while time.time() < deadline:
+                await asyncio.sleep(0.2)
+                if await self._adopt_from_store(valid_until):
+                    return
+
+        try:
+            token, expires_at = await self._fetch_token()
+        except Exception:
+            if leased:
+                await asyncio.to_thread(store.release, self._token_key)
+            raise
+        try:
+            await asyncio.to_thread(store.save, self._token_key, token, expires_at)
+        except Exception as exc:
+            logger.debug("GigaChat token store unavailable: %s", exc)
+
+    async def _adopt_from_store(self, valid_until: float) -> bool:
+        try:
+            cached = await asyncio.to_thread(self.token_store.load, self._token_key)
+        except Exception as exc:
+            logger.debug("GigaChat token store unavailable: %s", exc)
+            return False
+        if cached and cached[1] > valid_until and cached[1] > self._expires_at:
+            self._access_token, self._expires_at = cached
+            self.token_stats["from_store"] += 1
+            return True
+        return False
+
+    async def _fetch_token(self) -> Tuple[str, float]:
+        """Запрос нового токена в OAuth."""
+        now = time.time()
+
         # ВАЖНО:
         # GIGACHAT_CLIENT_SECRET = Authorization key из кабинета
         # Он уже в нужном base64-формате, НИЧЕГО не кодируем повторно.
@@ -111,12 +281,13 @@ class GigaChatAdapter:
 
         data = {"scope": self.scope}
 
-        response = httpx.post(
+        self.token_stats["oauth_requests"] += 1
+        response = await self._post(
+            "oauth",
             self.auth_url,
             headers=headers,
             data=data,
-            verify=self.verify,
-            timeout=20.0,
+            timeout=httpx.Timeout(GIGACHAT_AUTH_TIMEOUT, connect=GIGACHAT_CONNECT_TIMEOUT),
         )
         response.raise_for_status()
 
@@ -129,19 +300,46 @@ class GigaChatAdapter:
         self._access_token = access_token
         self._expires_at = now + expires_in
 
-        return access_token
+        return access_token, self._expires_at
+
+    def _ensure_renewal(self) -> None:
+        """Запускает фоновое обновление токена (одна задача на event loop)."""
+        if self.renew_before <= 0:
+            return
+        if self._renew_task is None or self._renew_task.done():
+            self._renew_task = asyncio.get_running_loop().create_task(self._renew_loop())
+
+    async def _renew_loop(self) -> None:
+        """Обновляет токен заранее, чтобы запросы не ждали OAuth."""
+        while True:
+            planned = self._expires_at
+            lifetime = planned - time.time()
+            # Короткоживущий токен обновляем на середине срока, а не в цикле.
+            lead = min(self.renew_before + random.uniform(0, self.renew_jitter), lifetime / 2)
+            await asyncio.sleep(max(lifetime - lead, 0.0))
+            try:
+                async with self._token_lock:
+                    # Токен не обновили по ходу запросов — обновляем сами.
+                    if self._expires_at == planned:
+                        await self._refresh_token(valid_until=time.time() + self.token_margin)
+                        self.token_stats["renewals"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("GigaChat: фоновое обновление токена не удалось: %s", exc)
+                await asyncio.sleep(min(30.0, max(self.renew_before / 4, 1.0)))
 
     # -------------------------------------------------------------------------
     # ВЫЗОВ CHAT / COMPLETIONS
     # -------------------------------------------------------------------------
 
-    def chat(
+    async def chat(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.2,
         max_tokens: int = 800,
     ) -> str:
-        token = self._get_access_token()
+        token = await self._get_access_token()
 
         headers = {
             "Authorization": f"Bearer {token}",
@@ -155,12 +353,11 @@ class GigaChatAdapter:
             "max_tokens": max_tokens,
         }
 
-        response = httpx.post(
+        response = await self._post(
+            "chat",
             self.chat_url,
             headers=headers,
             json=payload,
-            verify=self.verify,
-            timeout=60.0,
         )
         response.raise_for_status()
         data = response.json()
@@ -172,3 +369,73 @@ class GigaChatAdapter:
                 f"GigaChat: неожиданный формат ответа: {exc}"
             ) from exc
 
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        max_tokens: int = 800,
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый chat/completions (stream=true, SSE): отдаёт фрагменты
+        текста по мере генерации.
+        """
+        token = await self._get_access_token()
+
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+        }
+
+        payload: Dict[str, object] = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+
+        # Время потока — до последнего фрагмента, а не до заголовков ответа.
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with self._get_client().stream(
+                "POST",
+                self.chat_url,
+                headers=headers,
+                json=payload,
+            ) as response:
+                status = str(response.status_code)
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    line = line.strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    except Exception as exc:  # noqa: BLE001
+                        raise RuntimeError(
+                            f"GigaChat: неожиданный формат потока: {exc}"
+                        ) from exc
+                    if delta:
+                        yield delta
+        finally:
+            GIGACHAT_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, call="chat_stream", status=status
+            )
+
+    async def _post(self, call: str, url: str, **kwargs) -> httpx.Response:
+        """POST через общий клиент с замером в legalai_gigachat_request_seconds."""
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self._get_client().post(url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            GIGACHAT_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, call=call, status=status
+            )
@@ -1,5 +1,5 @@
 
-from typing import List, Optional, Sequence, Tuple, Union
+from typing import AsyncIterator, List, Optional, Sequence, Tuple, Union
 
 import logging
 logger = logging.getLogger("uvicorn.error")
@@ -10,6 +10,17 @@ from .gigachat_adapter import GigaChatAdapter, GigaChatConfigError
 DocTuple = Tuple[Union[int, str], str]
 
 
+class GenerationInterrupted(Exception):
+    """
+    GigaChat оборвал поток после того, как часть ответа уже отдана.
+    Недописанный ответ нельзя ни подменить fallback-ом, ни кэшировать.
+    """
+
+    def __init__(self, sent: int) -> None:
+        super().__init__(f"GigaChat stream interrupted after {sent} chars")
+        self.sent = sent
+
+
 class LocalGenerator:
     """
     Генератор ответа для Татьяны.
@@ -54,7 +65,7 @@ class LocalGenerator:
                 self.gigachat = None
 
     # Этот метод вызывает ConsultantCore
-    def generate(
+    async def generate(
         self,
         query: str,
         documents: Optional[Sequence[DocTuple]] = None,
@@ -77,17 +88,9 @@ class LocalGenerator:
             else (documents or [])
         )
 
-        if not docs_source:
-            return (
-                "Сейчас я не вижу в базе подходящих норм, чтобы дать точный ответ. "
-                "Попробуйте сформулировать вопрос более конкретно или уточнить ситуацию. "
-                "При серьёзных рисках лучше дополнительно обратиться к юристу."
-            )
-
-        context = self._build_context(docs_source)
-        fallback_answer = self._build_fallback_answer(query, context, intent)
-        # Если GigaChat не настроен — сразу отдаём fallback.
-        if not self.gigachat:
+        fallback_answer = self.fallback_answer(query, docs_source, intent)
+        # Нет документов или GigaChat не настроен — сразу отдаём fallback.
+        if not docs_source or not self.gigachat:
             logger.info("GEN=fallback")
             return fallback_answer
 
@@ -95,11 +98,11 @@ class LocalGenerator:
         try:
             messages = self._build_messages_for_gigachat(
                 query=query,
-                context=context,
+                context=self._build_context(docs_source),
                 intent=intent,
             )
             logger.info("GEN=gigachat")
-            answer = self.gigachat.chat(messages)
+            answer = await self.gigachat.chat(messages)
             if not answer:
                 return fallback_answer
             return answer[: self.max_answer_len]
@@ -107,6 +110,72 @@ class LocalGenerator:
             # Любая ошибка GigaChat → тихий откат на локальный ответ.
             return fallback_answer
 
+    async def generate_stream(
+        self,
+        query: str,
+        context_docs: Optional[Sequence[DocTuple]] = None,
+        intent: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Потоковая версия generate: фрагменты ответа по мере генерации.
+
+        Без GigaChat (или при ошибке до первого фрагмента) отдаёт
+        fallback-ответ одним куском. Ошибка посреди потока поднимает
+        GenerationInterrupted: уже отправленный текст — обрывок ответа.
+        """
+        docs_source: Sequence[DocTuple] = context_docs or []
+        if not docs_source or not self.gigachat:
+            yield await self.generate(query, context_docs=docs_source, intent=intent)
+            return
+
+        context = self._build_context(docs_source)
+        sent = 0
+        try:
+            messages = self._build_messages_for_gigachat(
+                query=query,
+                context=context,
+                intent=intent,
+            )
+            logger.info("GEN=gigachat stream")
+            async for delta in self.gigachat.chat_stream(messages):
+                delta = delta[: self.max_answer_len - sent]
+                if not delta:
+                    break
+                sent += len(delta)
+                yield delta
+        except Exception as exc:
+            if sent:
+                logger.warning("GigaChat stream interrupted after %d chars", sent)
+                raise GenerationInterrupted(sent) from exc
+
+        if not sent:
+            # Любая ошибка GigaChat или пустой ответ → локальный ответ.
+            logger.info("GEN=fallback")
+            yield self._build_fallback_answer(query, context, intent)
+
+    def fallback_answer(
+        self,
+        query: str,
+        context_docs: Optional[Sequence[DocTuple]] = None,
+        intent: Optional[str] = None,
+    ) -> str:
+        """
+        Локальный ответ, который generate отдаёт без GigaChat.
+        ConsultantCore сравнивает с ним результат, чтобы не кэшировать откаты.
+        """
+        if not context_docs:
+            return (
+                "Сейчас я не вижу в базе подходящих норм, чтобы дать точный ответ. "
+                "Попробуйте сформулировать вопрос более конкретно или уточнить ситуацию. "
+                "При серьёзных рисках лучше дополнительно обратиться к юристу."
+            )
+        return self._build_fallback_answer(query, self._build_context(context_docs), intent)
+
+    async def aclose(self) -> None:
+        """Закрывает HTTP-клиент GigaChat (вызывается при остановке приложения)."""
+        if self.gigachat is not None:
+            await self.gigachat.aclose()
+
     # ---------------- Вспомогательные методы ----------------
 
     def _build_context(self, documents: Sequence[DocTuple]) -> str:
@@ -0,0 +1,132 @@
+"""
+Общий для всех воркеров кэш access_token GigaChat (SQLite-файл).
+
+Каждый процесс uvicorn держит свой GigaChatAdapter. Без общего кэша при
+старте флота и при каждом истечении токена все воркеры одновременно идут
+в OAuth. Здесь токен хранится в маленькой SQLite-базе рядом с данными,
+а «аренда» (lease) обновления гарантирует, что за новым токеном в каждый
+момент ходит только один процесс — остальные ждут, пока он его запишет.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GIGACHAT_TOKEN_CACHE = os.getenv(
+    "GIGACHAT_TOKEN_CACHE",
+    "/srv/legal-ai/data/gigachat_token.db",
+)
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS gigachat_tokens (
+    key TEXT PRIMARY KEY,
+    token TEXT,
+    expires_at REAL NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+def token_key(auth_url: str, scope: str, auth_key: str) -> str:
+    """Ключ записи: сам Authorization key в файл не пишется."""
+    raw = f"{auth_url}|{scope}|{auth_key}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class TokenStore:
+    """
+    Токены по ключу (auth_url, scope, ключ авторизации) + lease на обновление.
+
+    Методы синхронные и быстрые (локальный файл); из async-кода вызываются
+    через asyncio.to_thread. Любая ошибка файла не фатальна: адаптер
+    просто работает со своим токеном в памяти.
+    """
+
+    def __init__(self, path: str = GIGACHAT_TOKEN_CACHE, timeout: float = 5.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA_SQL)
+            try:
+                # В файле лежит действующий токен — только для владельца.
+                os.chmod(self.path, 0o600)
+            except OSError:
+                pass
+            self._ready = True
+        return conn
+
+    def load(self, key: str) -> Optional[Tuple[str, float]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT token, expires_at FROM gigachat_tokens WHERE key = ?",
+                (key,),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row and row[0]:
+            return row[0], float(row[1])
+        return None
+
+    def save(self, key: str, token: str, expires_at: float) -> None:
+        """Записывает токен и снимает lease."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                INSERT INTO gigachat_tokens (key, token, expires_at, lease_until)
+                VALUES (?, ?, ?, 0)
+                ON CONFLICT(key) DO UPDATE SET
+                    token = excluded.token,
+                    expires_at = excluded.expires_at,
+                    lease_until = 0
+                """,
+                (key, token, expires_at),
+            )
+        finally:
+            conn.close()
+
+    def try_lease(self, key: str, ttl: float) -> bool:
+        """
+        Пытается захватить право обновить токен на ttl секунд.
+        True — этот процесс идёт в OAuth; False — кто-то уже обновляет.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO gigachat_tokens (key) VALUES (?)",
+                (key,),
+            )
+            cur = conn.execute(
+                """
+                UPDATE gigachat_tokens SET lease_until = ?
+                WHERE key = ? AND lease_until < ?
+                """,
+                (now + ttl, key, now),
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def release(self, key: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE gigachat_tokens SET lease_until = 0 WHERE key = ?",
+                (key,),
+            )
+        finally:
+            conn.close()
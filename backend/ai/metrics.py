@@ -0,0 +1,183 @@
+"""
+Гистограммы задержек конвейера ИИ в формате Prometheus.
+
+Без внешних зависимостей: несколько гистограмм в памяти процесса
+и рендер в текстовый формат экспозиции (text/plain; version=0.0.4),
+который отдаёт GET /metrics (app/main.py).
+
+Что меряется:
+  legalai_ai_stage_seconds{stage, intent, engine} — этапы ConsultantCore
+      (retrieve, intent, rank, citations, law_guard, generate, safety, risk);
+  legalai_ai_request_seconds{intent, engine} — весь ask / ask_stream;
+  legalai_rag_search_seconds{branch} — ветки поиска ретривера:
+      exact, passages, dense, fts, trigram, like;
+  legalai_gigachat_request_seconds{call, status} — HTTP-запросы к GigaChat
+      (oauth, chat, chat_stream).
+
+engine — кто ответил: gigachat, fallback (локальный ответ) или cache.
+Метрики у каждого воркера uvicorn свои; при нескольких воркерах их
+нужно собирать с каждого процесса отдельно.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Границы корзин (секунды): от миллисекунд поиска до десятков секунд LLM.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# Значения intent, которые попадают в метки как есть; остальные — "other",
+# чтобы произвольный intent от фронта не плодил временные ряды.
+KNOWN_INTENTS = frozenset(
+    {"consultation", "law_search", "document_draft", "template", "risk_check", "analysis"}
+)
+
+
+def intent_label(intent: str | None) -> str:
+    return intent if intent in KNOWN_INTENTS else "other"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class Histogram:
+    """Гистограмма с метками: накопленные корзины, сумма и количество."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        # значения меток -> [счётчики по корзинам..., сумма]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получены {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def observe(self, seconds: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0.0] * (len(self.buckets) + 1)
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += seconds
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Замер блока кода: with HISTOGRAM.time(branch="fts"): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key in sorted(series):
+            values = series[key]
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _format_labels(pairs + [("le", _format_bound(bound))])
+                lines.append(f"{self.name}_bucket{labels} {int(cumulative)}")
+            labels = _format_labels(pairs)
+            lines.append(f"{self.name}_sum{labels} {values[-1]!r}")
+            lines.append(f"{self.name}_count{labels} {int(cumulative)}")
+        return lines
+
+    def counts(self) -> Dict[Tuple[str, ...], int]:
+        """Число наблюдений по значениям меток (для бенчмарков и тестов)."""
+        with self._lock:
+            return {key: int(sum(values[:-1])) for key, values in self._series.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[Histogram] = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+AI_STAGE_SECONDS = REGISTRY.histogram(
+    "legalai_ai_stage_seconds",
+    "Длительность этапов ConsultantCore",
+    ("stage", "intent", "engine"),
+)
+AI_REQUEST_SECONDS = REGISTRY.histogram(
+    "legalai_ai_request_seconds",
+    "Полное время обработки запроса ConsultantCore",
+    ("intent", "engine"),
+)
+RAG_SEARCH_SECONDS = REGISTRY.histogram(
+    "legalai_rag_search_seconds",
+    "Длительность веток поиска ретривера",
+    ("branch",),
+)
+GIGACHAT_REQUEST_SECONDS = REGISTRY.histogram(
+    "legalai_gigachat_request_seconds",
+    "HTTP-запросы к GigaChat",
+    ("call", "status"),
+)
+
+
+def observe_pipeline(debug: Dict, intent: str | None, engine: str) -> None:
+    """Переносит debug конвейера ядра (ms по этапам) в гистограммы."""
+    label = intent_label(intent)
+    for stage, timing in debug.get("stages", {}).items():
+        AI_STAGE_SECONDS.observe(timing["ms"] / 1000, stage=stage, intent=label, engine=engine)
+    AI_REQUEST_SECONDS.observe(debug.get("total_ms", 0.0) / 1000, intent=label, engine=engine)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,90 @@
+"""
+Маленький исполнитель DAG для этапов ConsultantCore.
+
+Этап — функция от словаря уже готовых результатов. Каждый этап
+стартует, как только готовы его зависимости, поэтому независимые ветки
+(намерение и поиск, проверки ответа) идут одновременно. Для каждого этапа
+запоминается время старта от начала конвейера и длительность — их ядро
+отдаёт в поле debug ответа.
+
+Синхронные этапы выполняются прямо в event loop (они быстрые: регулярки,
+словари); блокирующие — с blocking=True — уходят в пул потоков поиска.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+from .rag.executor import RetrievalExecutor
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+    deps: Sequence[str] = ()
+    blocking: bool = False
+
+
+class Pipeline:
+    """Запуск набора этапов с учётом зависимостей и замером времени."""
+
+    def __init__(self, stages: Iterable[Stage], executor: Optional[RetrievalExecutor] = None) -> None:
+        self.stages = list(stages)
+        self.executor = executor
+        names = set()
+        for stage in self.stages:
+            missing = [d for d in stage.deps if d not in names]
+            if missing:
+                # Этапы перечисляются в топологическом порядке.
+                raise ValueError(f"Этап {stage.name} зависит от ещё не объявленных: {missing}")
+            names.add(stage.name)
+
+    async def run(self, results: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        """
+        Выполняет этапы и возвращает results, дополненный результатами этапов
+        и ключом "debug": {"stages": {имя: {"start_ms", "ms"}}, "total_ms"}.
+        Первая ошибка любого этапа отменяет остальные и пробрасывается.
+        """
+        results = dict(results or {})
+        timings: Dict[str, Dict[str, float]] = {}
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: Stage) -> None:
+            if stage.deps:
+                await asyncio.gather(*(tasks[d] for d in stage.deps))
+            begin = time.perf_counter()
+            if stage.blocking and self.executor is not None:
+                value = await self.executor.run(stage.fn, results)
+            else:
+                value = stage.fn(results)
+                if inspect.isawaitable(value):
+                    value = await value
+            end = time.perf_counter()
+            results[stage.name] = value
+            timings[stage.name] = {
+                "start_ms": round((begin - started) * 1000, 3),
+                "ms": round((end - begin) * 1000, 3),
+            }
+
+        for stage in self.stages:
+            tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        results["debug"] = {
+            "stages": timings,
+            "total_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        return results
@@ -0,0 +1,185 @@
+"""
+Кэш результатов RAG-поиска.
+
+Одни и те же вопросы («ст. 81 ТК увольнение», «неустойка по ГК») приходят
+постоянно, поэтому результат DocumentRetriever кэшируется в памяти воркера:
+LRU по размеру + TTL. Когда другой процесс (cron update_laws, sync,
+reindex) меняет базу законов, он увеличивает счётчик generation в таблице
+rag_index_state, и воркеры сбрасывают свой кэш.
+
+В той же таблице tasks/reindex_laws.py отмечает FTS-индексы, которые он
+полностью перестроил (ключи reindexed:<таблица>). Ретривер ищет только
+по отмеченным индексам: таблица, созданная миграцией схемы, но ещё не
+заполненная, равна отсутствующей.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, Optional, Tuple
+
+CACHE_MAX_SIZE = int(os.getenv("LEGALAI_RAG_CACHE_MAX_SIZE", "1024"))
+CACHE_TTL_SEC = float(os.getenv("LEGALAI_RAG_CACHE_TTL_SEC", "600"))
+# Как часто (сек) воркер сверяет generation с базой.
+CACHE_GENERATION_CHECK_SEC = float(os.getenv("LEGALAI_RAG_CACHE_CHECK_SEC", "5"))
+
+# SQL общий для sqlite3 и SQLAlchemy (app/laws/sync.py).
+GENERATION_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS rag_index_state "
+    "(key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+)
+GENERATION_BUMP_SQL = (
+    "INSERT INTO rag_index_state (key, value) VALUES ('generation', 1) "
+    "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+)
+GENERATION_READ_SQL = "SELECT value FROM rag_index_state WHERE key = 'generation'"
+REINDEXED_PREFIX = "reindexed:"
+REINDEXED_UPSERT_SQL = (
+    "INSERT INTO rag_index_state (key, value) VALUES (?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET value = excluded.value"
+)
+REINDEXED_CLEAR_SQL = "DELETE FROM rag_index_state WHERE key LIKE 'reindexed:%'"
+REINDEXED_READ_SQL = "SELECT key FROM rag_index_state WHERE key LIKE 'reindexed:%'"
+
+_MISSING = object()
+
+
+def bump_generation(conn: sqlite3.Connection, *, commit: bool = True) -> None:
+    """Сообщает всем воркерам, что база законов изменилась."""
+    conn.execute(GENERATION_TABLE_SQL)
+    conn.execute(GENERATION_BUMP_SQL)
+    if commit:
+        conn.commit()
+
+
+def read_generation(conn: sqlite3.Connection) -> int:
+    """Текущее значение generation (0, если таблицы ещё нет)."""
+    try:
+        row = conn.execute(GENERATION_READ_SQL).fetchone()
+    except sqlite3.Error:
+        return 0
+    return int(row[0]) if row else 0
+
+
+def mark_reindexed(
+    conn: sqlite3.Connection,
+    tables: Iterable[str],
+    *,
+    commit: bool = True,
+) -> None:
+    """Отмечает индексы tables как полностью перестроенные."""
+    conn.execute(GENERATION_TABLE_SQL)
+    now = int(time.time())
+    conn.executemany(REINDEXED_UPSERT_SQL, [(REINDEXED_PREFIX + t, now) for t in tables])
+    if commit:
+        conn.commit()
+
+
+def clear_reindexed(conn: sqlite3.Connection, *, commit: bool = True) -> None:
+    """Снимает отметки перед массовой переиндексацией."""
+    conn.execute(GENERATION_TABLE_SQL)
+    conn.execute(REINDEXED_CLEAR_SQL)
+    if commit:
+        conn.commit()
+
+
+def read_reindexed(conn: sqlite3.Connection) -> FrozenSet[str]:
+    """Индексы, заполненные переиндексацией (пусто, если её не было)."""
+    try:
+        rows = conn.execute(REINDEXED_READ_SQL).fetchall()
+    except sqlite3.Error:
+        return frozenset()
+    return frozenset(row[0][len(REINDEXED_PREFIX):] for row in rows)
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш с TTL и счётчиками для мониторинга.
+    """
+
+    def __init__(self, maxsize: int = CACHE_MAX_SIZE, ttl: float = CACHE_TTL_SEC) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self._stats["misses"] += 1
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data: Dict[str, Any] = dict(self._stats)
+            data["size"] = len(self._data)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 4) if lookups else 0.0
+        data["maxsize"] = self.maxsize
+        data["ttl"] = self.ttl
+        return data
+
+
+class RetrievalCache(TTLCache):
+    """
+    TTLCache, который сбрасывается при изменении generation в базе законов.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = CACHE_MAX_SIZE,
+        ttl: float = CACHE_TTL_SEC,
+        check_interval: float = CACHE_GENERATION_CHECK_SEC,
+    ) -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.check_interval = check_interval
+        self.generation: Optional[int] = None
+        self._checked_at = 0.0
+
+    def sync_generation(self, conn: sqlite3.Connection) -> None:
+        """Сверяет generation с базой не чаще, чем раз в check_interval."""
+        now = time.monotonic()
+        if self.generation is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        generation = read_generation(conn)
+        if self.generation is not None and generation != self.generation:
+            self.clear()
+        self.generation = generation
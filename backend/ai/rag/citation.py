@@ -20,10 +20,15 @@ class CitationNormalizer:
 
         Returns:
             Normalized citations with consistent fields. Each citation dict contains
-            at minimum an `id` field referencing the source document.
+            at minimum an `id` field referencing the source document. Several
+            passages of one document collapse into a single citation.
         """
         normalized: List[Dict[str, Any]] = []
+        seen = set()
         for doc_id, _ in citations:
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
             normalized.append({"id": doc_id})
         return normalized
 
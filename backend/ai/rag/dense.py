@@ -0,0 +1,236 @@
+"""
+Dense (embedding-based) retrieval for law passages.
+
+Офлайн (tasks/build_dense_index.py) каждый фрагмент law_passages
+кодируется RuBERT-эмбеддингом, вектора складываются в NumPy-матрицу
+на диске (float16 или int8). В воркере индекс открывается лениво через
+np.load(mmap_mode="r"), поэтому старт процесса не платит за загрузку
+всей матрицы: страницы подтягиваются ОС по мере поиска.
+
+Поиск — brute-force косинусная близость блоками (вектора нормированы),
+для сотен тысяч фрагментов на CPU это единицы-десятки миллисекунд.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DENSE_INDEX_DIR = os.getenv(
+    "LEGALAI_RAG_DENSE_DIR",
+    "/srv/legal-ai/data/dense_index",
+)
+
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+META_FILE = "meta.json"
+
+# Нормированные вектора лежат в [-1, 1]; для int8 хватает общего масштаба.
+INT8_SCALE = 127.0
+# Сколько строк матрицы умножать за раз (ограничивает пиковую память).
+SEARCH_BLOCK_ROWS = 65536
+
+
+class Embedder(Protocol):
+    """Кодирует тексты в L2-нормированные вектора (n, dim) float32."""
+
+    name: str
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        ...
+
+
+class RuBERTEmbedder:
+    """
+    Эмбеддинги RuBERT (та же модель, что в ai/nlp/rubert_intent.py):
+    mean pooling по токенам с учётом attention mask, CPU, без градиентов.
+    """
+
+    name = "DeepPavlov/rubert-base-cased"
+
+    def __init__(self, max_length: int = 256) -> None:
+        self.max_length = max_length
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        if np is None:
+            raise RuntimeError("numpy не установлен: dense-поиск недоступен")
+
+        from ai.nlp.rubert_intent import _load_model
+        import torch  # type: ignore
+
+        tokenizer, model = _load_model()
+        if tokenizer is None or model is None:
+            raise RuntimeError("RuBERT недоступен: dense-поиск выключен")
+
+        batch = tokenizer(
+            list(texts),
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="pt",
+        )
+        with torch.no_grad():
+            hidden = model(**batch).last_hidden_state
+        mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        vectors = pooled.cpu().numpy().astype(np.float32)
+        return _l2_normalize(vectors)
+
+
+def _l2_normalize(vectors: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class DenseIndex:
+    """
+    Memory-mapped матрица эмбеддингов фрагментов + их passage_id.
+
+    Файлы в index_dir: vectors.npy (float16 | int8), ids.npy (int64),
+    meta.json (dim, dtype, model, count).
+    """
+
+    def __init__(self, index_dir: str = DENSE_INDEX_DIR) -> None:
+        self.index_dir = Path(index_dir)
+        self._lock = threading.Lock()
+        self._vectors: Optional["np.ndarray"] = None
+        self._ids: Optional["np.ndarray"] = None
+        self.meta: Dict[str, Any] = {}
+
+    def available(self) -> bool:
+        return np is not None and (self.index_dir / META_FILE).exists()
+
+    def _load(self) -> None:
+        if self._vectors is not None:
+            return
+        with self._lock:
+            if self._vectors is not None:
+                return
+            if np is None:
+                raise RuntimeError("numpy не установлен: dense-поиск недоступен")
+            self.meta = json.loads((self.index_dir / META_FILE).read_text(encoding="utf-8"))
+            # count может быть меньше числа строк файла, если во время
+            # построения часть фрагментов удалили — хвост не используется.
+            count = int(self.meta.get("count", 0))
+            self._ids = np.load(self.index_dir / IDS_FILE, mmap_mode="r")[:count]
+            self._vectors = np.load(self.index_dir / VECTORS_FILE, mmap_mode="r")[:count]
+            logger.info(
+                "Dense index loaded (mmap): %s rows, dim=%s, dtype=%s",
+                self.meta.get("count"),
+                self.meta.get("dim"),
+                self.meta.get("dtype"),
+            )
+
+    def search(self, query_vector: "np.ndarray", top_k: int = 8) -> List[Tuple[int, float]]:
+        """Top-k (passage_id, cosine) для одного нормированного вектора запроса."""
+        self._load()
+        vectors, ids = self._vectors, self._ids
+        if vectors is None or ids is None or len(ids) == 0:
+            return []
+
+        q = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        scale = INT8_SCALE if self.meta.get("dtype") == "int8" else 1.0
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for start in range(0, len(ids), SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores = block @ q / scale
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+
+        order = np.argsort(-best_scores)
+        return [(int(ids[best_rows[i]]), float(best_scores[i])) for i in order]
+
+
+def build_dense_index(
+    conn: sqlite3.Connection,
+    embedder: Embedder,
+    index_dir: str = DENSE_INDEX_DIR,
+    *,
+    dtype: str = "float16",
+    batch_size: int = 64,
+) -> int:
+    """
+    Кодирует все фрагменты law_passages и пишет индекс в index_dir.
+    Матрица пишется потоково (open_memmap), в память целиком не грузится.
+    Возвращает количество закодированных фрагментов.
+    """
+    if np is None:
+        raise RuntimeError("numpy не установлен: dense-индекс не построить")
+    if dtype not in ("float16", "int8"):
+        raise ValueError("dtype должен быть float16 или int8")
+
+    out = Path(index_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    count = conn.execute("SELECT COUNT(*) FROM law_passages").fetchone()[0]
+    ids = np.lib.format.open_memmap(
+        out / (IDS_FILE + ".tmp"), mode="w+", dtype=np.int64, shape=(count,)
+    )
+
+    vectors = None
+    dim = 0
+    written = 0
+    cursor = conn.execute("SELECT id, text FROM law_passages ORDER BY id")
+    while written < count:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        emb = embedder.embed([text for _, text in rows])
+        if vectors is None:
+            dim = int(emb.shape[1])
+            vectors = np.lib.format.open_memmap(
+                out / (VECTORS_FILE + ".tmp"),
+                mode="w+",
+                dtype=np.int8 if dtype == "int8" else np.float16,
+                shape=(count, dim),
+            )
+        n = min(len(rows), count - written)
+        if dtype == "int8":
+            vectors[written:written + n] = np.clip(np.rint(emb[:n] * INT8_SCALE), -127, 127)
+        else:
+            vectors[written:written + n] = emb[:n]
+        ids[written:written + n] = [pid for pid, _ in rows[:n]]
+        written += n
+
+    if vectors is None:
+        raise RuntimeError("law_passages пуста: сначала запустите tasks.reindex_laws")
+
+    vectors.flush()
+    ids.flush()
+    del vectors, ids
+    # Переименование в конце: воркеры никогда не увидят наполовину записанный индекс.
+    os.replace(out / (VECTORS_FILE + ".tmp"), out / VECTORS_FILE)
+    os.replace(out / (IDS_FILE + ".tmp"), out / IDS_FILE)
+    (out / META_FILE).write_text(
+        json.dumps(
+            {
+                "count": written,
+                "dim": dim,
+                "dtype": dtype,
+                "model": getattr(embedder, "name", type(embedder).__name__),
+            },
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+    return written
@@ -0,0 +1,97 @@
+"""
+Пул потоков для блокирующего RAG-поиска из async-кода.
+
+ConsultantCore.ask / check — корутины, а поиск (SQLite, pymorphy2, numpy)
+синхронный. Вызовы уходят в ограниченный ThreadPoolExecutor, поэтому
+event loop uvicorn не блокируется, а число одновременных запросов к базе
+законов не превышает LEGALAI_RAG_WORKERS. Остальные ждут в очереди;
+её глубина и время ожидания видны в /ai/retriever/stats.
+
+Пул соединений SQLiteConnectionPool держит по соединению на поток,
+поэтому рабочие потоки переиспользуют свои соединения.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+RETRIEVAL_WORKERS = int(os.getenv("LEGALAI_RAG_WORKERS", "8"))
+
+
+class RetrievalExecutor:
+    """Ограниченный пул потоков с метриками очереди."""
+
+    def __init__(self, max_workers: int = RETRIEVAL_WORKERS) -> None:
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="rag-retrieve",
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._stats: Dict[str, float] = {
+            "submitted": 0,
+            "completed": 0,
+            "errors": 0,
+            "max_queue_depth": 0,
+            "wait_ms_total": 0.0,
+            "run_ms_total": 0.0,
+        }
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Выполняет fn(*args, **kwargs) в пуле и ждёт результат без блокировки loop."""
+        submitted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+            self._stats["submitted"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queued)
+
+        def task() -> T:
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._stats["wait_ms_total"] += (started - submitted) * 1000
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._stats["completed"] += 1
+                    self._stats["errors"] += failed
+                    self._stats["run_ms_total"] += (time.perf_counter() - started) * 1000
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            queued, active = self._queued, self._active
+        completed = stats["completed"]
+        return {
+            "max_workers": self.max_workers,
+            "queue_depth": queued,
+            "active": active,
+            "max_queue_depth": int(stats["max_queue_depth"]),
+            "submitted": int(stats["submitted"]),
+            "completed": int(completed),
+            "errors": int(stats["errors"]),
+            "avg_wait_ms": round(stats["wait_ms_total"] / completed, 3) if completed else 0.0,
+            "avg_run_ms": round(stats["run_ms_total"] / completed, 3) if completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
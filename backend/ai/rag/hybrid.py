@@ -0,0 +1,145 @@
+"""
+Hybrid retrieval: FTS5 bm25 + dense, fused into one ranked list.
+
+Обе ветки (лексическая по law_passages и dense по эмбеддингам) запускаются
+параллельно в пуле потоков, результаты сливаются через reciprocal rank
+fusion (RRF) или взвешенную сумму нормированных скоров и дедуплицируются
+по passage_id. Глубину кандидатов каждой ветки можно настраивать, чтобы
+менять латентность на полноту.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from .retriever import DocumentRetriever, NormalizedQuery
+
+logger = logging.getLogger(__name__)
+
+HYBRID_LEXICAL_DEPTH = int(os.getenv("LEGALAI_RAG_HYBRID_LEXICAL_DEPTH", "50"))
+HYBRID_DENSE_DEPTH = int(os.getenv("LEGALAI_RAG_HYBRID_DENSE_DEPTH", "50"))
+# rrf | weighted
+HYBRID_FUSION = os.getenv("LEGALAI_RAG_HYBRID_FUSION", "rrf")
+HYBRID_RRF_K = int(os.getenv("LEGALAI_RAG_HYBRID_RRF_K", "60"))
+# Вес dense-ветки для fusion=weighted (лексическая получает 1 - вес).
+HYBRID_DENSE_WEIGHT = float(os.getenv("LEGALAI_RAG_HYBRID_DENSE_WEIGHT", "0.5"))
+
+
+def _min_max(scores: List[float]) -> List[float]:
+    if not scores:
+        return []
+    lo, hi = min(scores), max(scores)
+    if hi - lo <= 1e-12:
+        return [1.0 for _ in scores]
+    return [(s - lo) / (hi - lo) for s in scores]
+
+
+class HybridRetriever(DocumentRetriever):
+    """
+    DocumentRetriever с режимом mode="hybrid" (по умолчанию).
+
+    retrieve() в hybrid-режиме возвращает тот же формат (document_id, text),
+    что и обычный ретривер, поэтому ConsultantCore / DocumentRanker
+    не знают, какие ветки участвовали в поиске.
+    """
+
+    def __init__(
+        self,
+        *args,
+        lexical_depth: int = HYBRID_LEXICAL_DEPTH,
+        dense_depth: int = HYBRID_DENSE_DEPTH,
+        fusion: str = HYBRID_FUSION,
+        rrf_k: int = HYBRID_RRF_K,
+        dense_weight: float = HYBRID_DENSE_WEIGHT,
+        **kwargs,
+    ) -> None:
+        kwargs["mode"] = kwargs.get("mode") or "hybrid"
+        super().__init__(*args, **kwargs)
+        self.lexical_depth = lexical_depth
+        self.dense_depth = dense_depth
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.dense_weight = dense_weight
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("LEGALAI_RAG_HYBRID_WORKERS", "8")),
+            thread_name_prefix="rag-hybrid",
+        )
+
+    def _fuse(self, lexical: List[dict], dense: List[dict]) -> List[dict]:
+        fused: Dict[int, dict] = {}
+
+        def add(branch: str, items: List[dict], contributions: List[float]) -> None:
+            for rank, (item, contribution) in enumerate(zip(items, contributions), start=1):
+                entry = fused.get(item["passage_id"])
+                if entry is None:
+                    entry = {**item, "score": 0.0, "ranks": {}}
+                    fused[item["passage_id"]] = entry
+                entry["score"] += contribution
+                entry["ranks"][branch] = rank
+
+        if self.fusion == "weighted":
+            add(
+                "lexical",
+                lexical,
+                [(1.0 - self.dense_weight) * s for s in _min_max([p["score"] for p in lexical])],
+            )
+            add(
+                "dense",
+                dense,
+                [self.dense_weight * s for s in _min_max([p["score"] for p in dense])],
+            )
+        else:
+            add("lexical", lexical, [1.0 / (self.rrf_k + r) for r in range(1, len(lexical) + 1)])
+            add("dense", dense, [1.0 / (self.rrf_k + r) for r in range(1, len(dense) + 1)])
+
+        return sorted(fused.values(), key=lambda p: p["score"], reverse=True)
+
+    def retrieve_hybrid(
+        self,
+        query: str,
+        top_k: int = 8,
+        normalized: NormalizedQuery | None = None,
+    ) -> List[dict]:
+        """
+        Слитый список фрагментов: поля retrieve_passages + score (fused)
+        и ranks — место фрагмента в каждой из веток.
+        """
+        if not query or not query.strip():
+            return []
+
+        normalized = self._normalize(query, normalized)
+        lexical_future = self._executor.submit(
+            self.retrieve_passages, query, max(top_k, self.lexical_depth), normalized
+        )
+        dense_future = self._executor.submit(
+            self.retrieve_dense, query, max(top_k, self.dense_depth), normalized
+        )
+
+        lexical = lexical_future.result()
+        try:
+            dense = dense_future.result()
+        except Exception as exc:
+            logger.warning("Hybrid: dense branch failed: %s", exc)
+            dense = []
+
+        return self._fuse(lexical, dense)[:top_k]
+
+    def _retrieve_chain(
+        self,
+        query: str,
+        top_k: int,
+        mode: str | None,
+        normalized: NormalizedQuery | None = None,
+    ) -> List[Tuple[int, str]]:
+        if (mode or self.mode) != "hybrid":
+            return super()._retrieve_chain(query, top_k, mode, normalized)
+
+        normalized = self._normalize(query, normalized)
+        passages = self.retrieve_hybrid(query, top_k=top_k, normalized=normalized)
+        if passages:
+            return [(p["document_id"], p["text"]) for p in passages]
+        # Ни фрагментов, ни dense-индекса — поиск по целым документам.
+        return super()._retrieve_chain(query, top_k, "documents", normalized)
@@ -0,0 +1,394 @@
+"""
+Ingest-этап для RAG: подготовка law_documents к поиску.
+
+Модуль вызывается при записи нового документа (app/services/laws_common.py)
+и при полной переиндексации (tasks/reindex_laws.py):
+  - один раз переводит HTML документа в нормализованный простой текст
+    (law_documents.content_text, FTS5-индекс law_documents_text_fts);
+  - режет текст на фрагменты уровня статья / часть / пункт;
+  - сохраняет фрагменты в law_passages (FTS5-индекс law_passages_fts
+    обновляется триггерами);
+  - считает леммы текста (content_lemmas / law_passages.lemmas) для
+    лемматизированных индексов *_lemma_fts;
+  - заполняет точный индекс ссылок law_article_index
+    (кодекс, статья, часть, пункт) -> фрагмент.
+"""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+from bs4 import BeautifulSoup
+
+from .cache import clear_reindexed, mark_reindexed
+from .retriever import ARTICLE_RE, PART_RE, POINT_RE, detect_code, parse_lemma
+
+SQL_DIR = Path(__file__).resolve().parents[2] / "sql"
+# Порядок применения схемы: таблицы -> новые колонки -> индексы и триггеры
+# (триггеры ссылаются на колонки, добавленные через ALTER TABLE).
+RAG_TABLE_FILES = (
+    "2025_legalai_law_documents.sql",
+    "2025_legalai_law_passages.sql",
+    "2025_legalai_law_article_index.sql",
+)
+RAG_COLUMNS = (
+    ("law_documents", "content_text", "TEXT"),
+    ("law_documents", "content_lemmas", "TEXT"),
+    ("law_passages", "lemmas", "TEXT"),
+)
+RAG_INDEX_FILES = (
+    "2025_legalai_law_documents_text.sql",
+    "2025_legalai_law_lemmas.sql",
+    "2025_legalai_law_trigram.sql",
+)
+
+# Максимальная длина одного фрагмента; длинные статьи режутся по строкам.
+MAX_PASSAGE_CHARS = 1500
+
+# Те же шаблоны, что и в extract_legal_refs, но привязанные к началу строки:
+# в тексте закона заголовок статьи / части / пункта всегда начинает строку,
+# а упоминания «в соответствии со ст. 81» внутри абзаца границей не являются.
+ARTICLE_LINE_RE = re.compile(
+    rf"^[ \t]*{ARTICLE_RE.pattern}", re.IGNORECASE | re.MULTILINE
+)
+PART_LINE_RE = re.compile(
+    rf"^[ \t]*(?:{PART_RE.pattern}\.?|(\d+)\.(?!\d))(?=\s)", re.IGNORECASE | re.MULTILINE
+)
+POINT_LINE_RE = re.compile(
+    rf"^[ \t]*(?:{POINT_RE.pattern}\.?|(\d+)\))(?=\s)", re.IGNORECASE | re.MULTILINE
+)
+
+
+@dataclass
+class Passage:
+    """Фрагмент документа с координатами в plain-text версии."""
+
+    start: int
+    end: int
+    text: str
+    article: Optional[str] = None
+    part: Optional[str] = None
+    point: Optional[str] = None
+
+
+# ---------------- Текст ----------------
+
+
+_INLINE_WS_RE = re.compile(r"[^\S\n]+")
+
+
+def html_to_text(html: str) -> str:
+    """
+    HTML документа -> нормализованный простой текст.
+
+    Теги убираются, HTML-сущности раскодируются, ё -> е, пробелы внутри
+    строки схлопываются, пустые строки выбрасываются. Переносы строк
+    сохраняются — по ним режутся статьи / части / пункты.
+    """
+    soup = BeautifulSoup(html or "", "html.parser")
+    text = unicodedata.normalize("NFC", soup.get_text(separator="\n"))
+    text = text.replace("ё", "е").replace("Ё", "Е")
+    lines = [_INLINE_WS_RE.sub(" ", line).strip() for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+_WORD_RE = re.compile(r"[0-9a-zа-яё]+")
+
+
+# Отдельный (больший) кэш для ingest, чтобы массовая переиндексация
+# не вытесняла леммы частых запросов из кэша lemmatize_word.
+@lru_cache(maxsize=200_000)
+def _lemma(word: str) -> str:
+    return parse_lemma(word)
+
+
+def lemmatize_text(text: str) -> str:
+    """
+    Текст -> строка лемм через пробел (для *_lemma_fts).
+
+    Используется тот же parse_lemma, что и для запроса, поэтому обе
+    стороны поиска совпадают по леммам (а без pymorphy2 — по словоформам).
+    """
+    words = _WORD_RE.findall((text or "").lower().replace("ё", "е"))
+    return " ".join(_lemma(w) for w in words)
+
+
+# ---------------- Разбиение на фрагменты ----------------
+
+
+def _mark_number(match: re.Match) -> str:
+    return next(g for g in match.groups() if g)
+
+
+def _split_level(
+    text: str, start: int, end: int, pattern: Pattern[str]
+) -> List[Tuple[int, int, Optional[str]]]:
+    """
+    Делит отрезок [start, end) по строкам-заголовкам pattern.
+    Текст до первого заголовка приклеивается к первому куску,
+    чтобы заголовок статьи не терялся отдельно от её первой части.
+    """
+    marks = list(pattern.finditer(text, start, end))
+    if not marks:
+        return [(start, end, None)]
+
+    pieces: List[Tuple[int, int, Optional[str]]] = []
+    for i, m in enumerate(marks):
+        piece_start = start if i == 0 else m.start()
+        piece_end = marks[i + 1].start() if i + 1 < len(marks) else end
+        pieces.append((piece_start, piece_end, _mark_number(m)))
+    return pieces
+
+
+def _window(text: str, start: int, end: int, max_chars: int) -> Iterable[Tuple[int, int]]:
+    """Режет слишком длинный отрезок на окна по границам строк."""
+    while end - start > max_chars:
+        cut = text.rfind("\n", start, start + max_chars)
+        if cut <= start:
+            cut = start + max_chars
+        yield start, cut
+        start = cut
+    yield start, end
+
+
+def split_into_passages(text: str, max_chars: int = MAX_PASSAGE_CHARS) -> List[Passage]:
+    """
+    Режет plain-text закона на фрагменты уровня статья / часть / пункт.
+
+    Преамбула до первой статьи становится отдельным фрагментом без номера.
+    """
+    passages: List[Passage] = []
+    if not text:
+        return passages
+
+    articles = list(ARTICLE_LINE_RE.finditer(text))
+    segments: List[Tuple[int, int, Optional[str]]] = []
+    if not articles or articles[0].start() > 0:
+        segments.append((0, articles[0].start() if articles else len(text), None))
+    for i, m in enumerate(articles):
+        seg_end = articles[i + 1].start() if i + 1 < len(articles) else len(text)
+        segments.append((m.start(), seg_end, m.group(1)))
+
+    for a_start, a_end, article in segments:
+        parts = (
+            _split_level(text, a_start, a_end, PART_LINE_RE)
+            if article
+            else [(a_start, a_end, None)]
+        )
+        for p_start, p_end, part in parts:
+            points = (
+                _split_level(text, p_start, p_end, POINT_LINE_RE)
+                if article
+                else [(p_start, p_end, None)]
+            )
+            for s_start, s_end, point in points:
+                for w_start, w_end in _window(text, s_start, s_end, max_chars):
+                    chunk = text[w_start:w_end]
+                    stripped = chunk.strip()
+                    if not stripped:
+                        continue
+                    lead = len(chunk) - len(chunk.lstrip())
+                    begin = w_start + lead
+                    passages.append(
+                        Passage(
+                            start=begin,
+                            end=begin + len(stripped),
+                            text=stripped,
+                            article=article,
+                            part=part,
+                            point=point,
+                        )
+                    )
+    return passages
+
+
+# ---------------- Запись в БД ----------------
+
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if columns and column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    """
+    Создаёт таблицы и колонки RAG без FTS-индексов по law_documents
+    (идемпотентно). Достаточно для записи новых документов (cron):
+    пустые индексы, созданные без переиндексации, только прятали бы
+    результаты поиска.
+    """
+    for name in RAG_TABLE_FILES:
+        conn.executescript((SQL_DIR / name).read_text(encoding="utf-8"))
+    for table, column, decl in RAG_COLUMNS:
+        _ensure_column(conn, table, column, decl)
+    conn.commit()
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """
+    Создаёт таблицы, колонки и индексы RAG (идемпотентно).
+    Индексы заполняет только tasks/reindex_laws.py (rebuild_fts).
+    """
+    ensure_tables(conn)
+    for name in RAG_INDEX_FILES:
+        conn.executescript((SQL_DIR / name).read_text(encoding="utf-8"))
+    conn.commit()
+
+
+# Название кодекса стоит в заголовке акта или в первых строках текста.
+CODE_TITLE_CHARS = 500
+
+
+def document_code(conn: sqlite3.Connection, document_id: int, text: str) -> Optional[str]:
+    """Кодекс документа: по названию акта (legal_acts), иначе по началу текста."""
+    try:
+        row = conn.execute(
+            """
+            SELECT a.title
+            FROM law_documents AS d
+            JOIN legal_acts AS a ON a.id = d.act_id
+            WHERE d.id = ?
+            """,
+            (document_id,),
+        ).fetchone()
+    except sqlite3.Error:
+        row = None
+    if row and row[0]:
+        code = detect_code(row[0].lower())
+        if code:
+            return code
+    return detect_code((text or "")[:CODE_TITLE_CHARS].lower())
+
+
+def index_document_passages(
+    conn: sqlite3.Connection,
+    document_id: int,
+    text: str,
+    *,
+    commit: bool = True,
+) -> int:
+    """
+    Перестраивает фрагменты одного документа law_documents
+    по его plain-text версии (content_text) и его строки в law_article_index.
+    Возвращает количество сохранённых фрагментов.
+    """
+    passages = split_into_passages(text)
+
+    conn.execute("DELETE FROM law_article_index WHERE document_id = ?", (document_id,))
+    conn.execute("DELETE FROM law_passages WHERE document_id = ?", (document_id,))
+    conn.executemany(
+        """
+        INSERT INTO law_passages (
+            document_id, passage_index, article, part, point,
+            start_offset, end_offset, text, lemmas
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                document_id, idx, p.article, p.part, p.point,
+                p.start, p.end, p.text, lemmatize_text(p.text),
+            )
+            for idx, p in enumerate(passages)
+        ],
+    )
+
+    code = document_code(conn, document_id, text)
+    if code:
+        conn.execute(
+            """
+            INSERT INTO law_article_index (
+                code, article, part, point, passage_id, document_id
+            )
+            SELECT ?, article, COALESCE(part, ''), COALESCE(point, ''), id, document_id
+            FROM law_passages
+            WHERE document_id = ? AND article IS NOT NULL
+            """,
+            (code, document_id),
+        )
+    if commit:
+        conn.commit()
+    return len(passages)
+
+
+def index_document(
+    conn: sqlite3.Connection,
+    document_id: int,
+    html: str,
+    *,
+    commit: bool = True,
+) -> int:
+    """
+    Полная индексация одного документа: content_text, леммы, фрагменты.
+    Возвращает количество фрагментов.
+    """
+    text = html_to_text(html)
+    conn.execute(
+        "UPDATE law_documents SET content_text = ?, content_lemmas = ? WHERE id = ?",
+        (text, lemmatize_text(text), document_id),
+    )
+    return index_document_passages(conn, document_id, text, commit=commit)
+
+
+# FTS5-таблицы с external content, которые надо перестраивать целиком
+# после массовой переиндексации (триггеры обслуживают только точечные правки).
+RAG_FTS_TABLES = (
+    "law_documents_text_fts",
+    "law_documents_lemma_fts",
+    "law_documents_trigram_fts",
+    "law_passages_fts",
+    "law_passages_lemma_fts",
+)
+RAG_FTS_TRIGGERS = (
+    "law_documents_text_ai",
+    "law_documents_text_ad",
+    "law_documents_text_au",
+    "law_documents_lemma_ai",
+    "law_documents_lemma_ad",
+    "law_documents_lemma_au",
+    "law_documents_trigram_ai",
+    "law_documents_trigram_ad",
+    "law_documents_trigram_au",
+    "law_passages_ai",
+    "law_passages_ad",
+    "law_passages_au",
+    "law_passages_lemma_ai",
+    "law_passages_lemma_ad",
+    "law_passages_lemma_au",
+)
+
+
+def drop_fts(conn: sqlite3.Connection) -> None:
+    """
+    Удаляет FTS5-индексы RAG и их триггеры перед массовой переиндексацией.
+
+    Триггер 'delete' для external-content FTS5 требует, чтобы старая строка
+    была проиндексирована; для документов, записанных до миграции схемы,
+    это не так, поэтому массовый пересчёт идёт без триггеров, а индексы
+    затем создаются заново (ensure_schema) и перестраиваются (rebuild_fts).
+    """
+    for trigger in RAG_FTS_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for table in RAG_FTS_TABLES:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    clear_reindexed(conn, commit=False)
+    conn.commit()
+
+
+def rebuild_fts(conn: sqlite3.Connection) -> None:
+    """
+    Полная перестройка FTS5-индексов RAG по текущему содержимому таблиц.
+    Перестроенные индексы отмечаются в rag_index_state: ретривер ищет
+    только по ним.
+    """
+    for table in RAG_FTS_TABLES:
+        conn.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+    mark_reindexed(conn, RAG_FTS_TABLES, commit=False)
+    conn.commit()
@@ -0,0 +1,231 @@
+"""
+Pool of long-lived SQLite connections for the RAG retriever.
+
+Каждый поток (воркер uvicorn / threadpool FastAPI) получает своё
+read-only соединение и переиспользует его между запросами, вместо того
+чтобы открывать новое sqlite3.connect() на каждый вызов retrieve().
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+# Значения по умолчанию можно переопределить через окружение.
+POOL_MMAP_SIZE = _env_int("LEGALAI_RAG_MMAP_SIZE", 256 * 1024 * 1024)
+# Отрицательное значение — размер в КиБ (см. PRAGMA cache_size).
+POOL_CACHE_SIZE = _env_int("LEGALAI_RAG_CACHE_SIZE", -64 * 1024)
+POOL_HEALTH_CHECK_INTERVAL = float(_env_int("LEGALAI_RAG_HEALTH_CHECK_SEC", 30))
+
+
+class SQLiteConnectionPool:
+    """
+    Потокобезопасный пул read-only соединений с базой законов.
+
+    - одно соединение на поток (threading.local), переиспользуется;
+    - PRAGMA mmap_size / cache_size / query_only выставляются один раз;
+    - база один раз переводится в WAL, чтобы читатели не блокировали
+      запись законов (cron update_laws / sync); пул никогда не создаёт
+      файл базы — неверный путь сразу даёт ошибку;
+    - перед выдачей давно простаивающего соединения выполняется SELECT 1,
+      битое соединение пересоздаётся;
+    - соединения завершившихся потоков закрываются при открытии
+      следующего соединения и в close_all.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        read_only: bool = True,
+        wal: bool = True,
+        mmap_size: int = POOL_MMAP_SIZE,
+        cache_size: int = POOL_CACHE_SIZE,
+        health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+    ) -> None:
+        self.db_path = db_path
+        self.read_only = read_only
+        self.wal = wal
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.health_check_interval = health_check_interval
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # ident потока -> (поток, его соединение)
+        self._connections: Dict[int, Tuple[threading.Thread, sqlite3.Connection]] = {}
+        self._wal_checked = False
+
+        self._stats: Dict[str, int] = {
+            "created": 0,
+            "reused": 0,
+            "health_checks": 0,
+            "health_failures": 0,
+            "closed": 0,
+        }
+
+    # ---------------- Открытие соединений ----------------
+
+    def _connect(self, mode: str) -> sqlite3.Connection:
+        """Соединение к существующей базе: mode=ro / rw не создаёт файл."""
+        try:
+            return sqlite3.connect(
+                f"file:{self.db_path}?mode={mode}",
+                uri=True,
+                check_same_thread=False,
+            )
+        except sqlite3.OperationalError as exc:
+            raise sqlite3.OperationalError(
+                f"RAG pool: cannot open database {self.db_path}: {exc}"
+            ) from exc
+
+    def _ensure_wal(self) -> None:
+        """Переводит базу в WAL (однократно, через короткое rw-соединение)."""
+        if not self.wal or self._wal_checked:
+            return
+        if not os.path.exists(self.db_path):
+            raise sqlite3.OperationalError(f"RAG pool: database not found: {self.db_path}")
+        try:
+            conn = self._connect("rw")
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+        except sqlite3.Error as exc:
+            # Например, база на read-only разделе — просто работаем без WAL.
+            logger.warning("RAG pool: cannot enable WAL for %s: %s", self.db_path, exc)
+        self._wal_checked = True
+
+    def _prune(self) -> List[sqlite3.Connection]:
+        """Забирает (под self._lock) соединения потоков, которые уже завершились."""
+        dead = [ident for ident, (thread, _) in self._connections.items() if not thread.is_alive()]
+        conns = [self._connections.pop(ident)[1] for ident in dead]
+        self._stats["closed"] += len(conns)
+        return conns
+
+    @staticmethod
+    def _close(conns: List[sqlite3.Connection]) -> None:
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _open(self) -> sqlite3.Connection:
+        with self._lock:
+            self._ensure_wal()
+            stale = self._prune()
+        self._close(stale)
+
+        if self.read_only:
+            conn = self._connect("ro")
+            conn.execute("PRAGMA query_only=1")
+        else:
+            conn = self._connect("rw")
+
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+
+        with self._lock:
+            self._connections[threading.get_ident()] = (threading.current_thread(), conn)
+            self._stats["created"] += 1
+        return conn
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        with self._lock:
+            self._stats["health_checks"] += 1
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            with self._lock:
+                self._stats["health_failures"] += 1
+            return False
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self._connections.pop(threading.get_ident(), None)
+            self._stats["closed"] += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    # ---------------- Публичный API ----------------
+
+    def acquire(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока (создаёт при необходимости)."""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        now = time.monotonic()
+
+        if conn is not None:
+            last_used = getattr(self._local, "last_used", now)
+            if now - last_used >= self.health_check_interval and not self._is_healthy(conn):
+                self._discard(conn)
+                conn = None
+            else:
+                with self._lock:
+                    self._stats["reused"] += 1
+
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+
+        self._local.last_used = now
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Контекстный менеджер для запроса.
+
+        Соединение не закрывается на выходе. Если запрос упал, а соединение
+        после этого не проходит SELECT 1, оно выбрасывается из пула.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except sqlite3.Error:
+            if not self._is_healthy(conn):
+                self._local.conn = None
+                self._discard(conn)
+            raise
+
+    def close_all(self) -> None:
+        """Закрывает все соединения пула (например, при shutdown)."""
+        with self._lock:
+            conns = [conn for _, conn in self._connections.values()]
+            self._connections.clear()
+            self._stats["closed"] += len(conns)
+        self._close(conns)
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика пула для мониторинга."""
+        with self._lock:
+            data: Dict[str, Any] = dict(self._stats)
+            data["open_connections"] = len(self._connections)
+        data.update(
+            {
+                "db_path": self.db_path,
+                "read_only": self.read_only,
+                "mmap_size": self.mmap_size,
+                "cache_size": self.cache_size,
+            }
+        )
+        return data
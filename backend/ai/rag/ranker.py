@@ -1,34 +1,464 @@
 """
 Module for ranking retrieved documents.
 
-This module defines a DocumentRanker class that orders retrieved
-documents based on relevance scores computed from embeddings and
-domain heuristics.
+Второй этап поиска: кандидаты ретривера (десятки фрагментов / документов)
+переупорядочиваются по дешёвым признакам и, если подключён, по
+кросс-энкодеру:
+  - bm25 по самим кандидатам: леммы вопроса пользователя против лемм
+    текста, посчитанных при ingest (law_documents.content_lemmas,
+    law_passages.lemmas); текст без сохранённых лемм лемматизируется,
+    только пока не исчерпан бюджет;
+  - позиция в выдаче ретривера;
+  - точное совпадение номера статьи из запроса (extract_legal_refs);
+  - вид акта (legal_acts.kind через law_documents.act_id);
+  - свежесть редакции (legal_acts.date_adopted).
+
+Признаки и кросс-энкодер делят один бюджет времени. Кросс-энкодер
+считает все пары (вопрос, кандидат) одним батчем; если не уложился —
+остаётся порядок по признакам.
 """
 
-from typing import List, Tuple, Any
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import date
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from .cache import TTLCache
+from .ingest import lemmatize_text
+from .pool import SQLiteConnectionPool
+from .retriever import ARTICLE_RE, QueryNormalizer, extract_legal_refs
+
+logger = logging.getLogger(__name__)
+
+# Модель кросс-энкодера (HuggingFace); пусто — только признаки.
+CROSS_ENCODER_MODEL = os.getenv("LEGALAI_RAG_CROSS_ENCODER", "")
+# Бюджет на весь этап ранжирования, миллисекунды.
+RANK_BUDGET_MS = float(os.getenv("LEGALAI_RAG_RANK_BUDGET_MS", "150"))
+# Период полураспада признака свежести, лет.
+RECENCY_HALF_LIFE_YEARS = float(os.getenv("LEGALAI_RAG_RECENCY_HALF_LIFE", "5"))
+
+# Вес признаков в итоговом скоре (признаки нормированы в [0, 1]).
+FEATURE_WEIGHTS: Dict[str, float] = {
+    "bm25": 1.0,
+    "position": 0.5,
+    "article": 1.5,
+    "law_type": 0.3,
+    "recency": 0.2,
+    "cross_encoder": 2.0,
+}
+
+# Значимость вида акта: кодексы и федеральные законы выше подзаконных актов.
+LAW_TYPE_WEIGHTS: Dict[str, float] = {
+    "code": 1.0,
+    "federal_law": 1.0,
+    "federal_parliament": 1.0,
+    "presidential_decree": 0.8,
+    "government_resolution": 0.7,
+    "court_ruling": 0.6,
+    "ministerial_order": 0.5,
+    "international_treaty": 0.5,
+    "general": 0.5,
+}
+DEFAULT_LAW_TYPE_WEIGHT = 0.5
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class PairScorer(Protocol):
+    """Оценивает релевантность текстов запросу одним батчем."""
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        ...
+
+
+class CrossEncoderScorer:
+    """
+    Кросс-энкодер на CPU (AutoModelForSequenceClassification).
+    Модель грузится лениво при первом вызове; все пары — один forward.
+    """
+
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL, max_length: int = 384) -> None:
+        self.model_name = model_name
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from transformers import (  # type: ignore
+                        AutoModelForSequenceClassification,
+                        AutoTokenizer,
+                    )
+
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                    model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+                    model.eval()
+                    self._model = model
+        return self._tokenizer, self._model
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        import torch  # type: ignore
+
+        tokenizer, model = self._load()
+        batch = tokenizer(
+            [query] * len(texts),
+            list(texts),
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="pt",
+        )
+        with torch.no_grad():
+            logits = model(**batch).logits
+        # Одна колонка — скор релевантности; две — берём класс «релевантно».
+        column = logits[:, -1] if logits.shape[-1] > 1 else logits[:, 0]
+        return column.float().cpu().tolist()
+
+
+def _min_max(values: Sequence[float]) -> List[float]:
+    if not values:
+        return []
+    lo, hi = min(values), max(values)
+    if hi - lo <= 1e-12:
+        return [1.0 if hi > 0 else 0.0 for _ in values]
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
 
 class DocumentRanker:
     """
     Ranks documents according to their relevance to a query.
     """
 
-    def __init__(self) -> None:
-        """Initialize the ranker."""
-        pass
+    def __init__(
+        self,
+        pool: SQLiteConnectionPool | None = None,
+        cross_encoder: PairScorer | None = None,
+        budget_ms: float = RANK_BUDGET_MS,
+        weights: Dict[str, float] | None = None,
+    ) -> None:
+        """
+        Args:
+            pool: соединения к базе законов для признаков вида акта и
+                свежести; без пула эти признаки равны нулю.
+            cross_encoder: батчевый скорер пар; по умолчанию включается,
+                если задан LEGALAI_RAG_CROSS_ENCODER.
+            budget_ms: бюджет времени на ранжирование.
+        """
+        self.pool = pool
+        if cross_encoder is None and CROSS_ENCODER_MODEL:
+            cross_encoder = CrossEncoderScorer()
+        self.cross_encoder = cross_encoder
+        self.budget_ms = budget_ms
+        self.weights = {**FEATURE_WEIGHTS, **(weights or {})}
+        self.normalizer = QueryNormalizer()
+        # Метаданные актов меняются редко: кэшируем по document_id.
+        self._meta_cache = TTLCache(maxsize=4096, ttl=3600)
+        # Леммы кандидатов: (document_id, hash текста) -> Counter.
+        self._lemma_cache = TTLCache(maxsize=4096, ttl=3600)
+        # Один поток: батчи кросс-энкодера не конкурируют за CPU.
+        self._executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-rerank")
+            if cross_encoder is not None
+            else None
+        )
+        self._lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "calls": 0,
+            "cross_encoder": 0,
+            "budget_exceeded": 0,
+            "cross_encoder_errors": 0,
+            "bm25_skipped": 0,
+            "total_ms": 0.0,
+        }
+
+    # ---------------- Признаки ----------------
+
+    @staticmethod
+    def _bm25(tokens: List[str], docs: Sequence[Optional[Counter]]) -> List[float]:
+        """
+        bm25 термов запроса по самим кандидатам (idf считается по ним же).
+        Кандидат без лемм (None) получает 0 и в статистику не входит.
+        """
+        known = [d for d in docs if d is not None]
+        if not known:
+            return [0.0] * len(docs)
+        lengths = [sum(d.values()) if d is not None else 0 for d in docs]
+        avg_len = (sum(lengths) / len(known)) or 1.0
+        n = len(known)
+        scores = [0.0] * len(docs)
+        for term in set(tokens):
+            df = sum(1 for d in known if term in d)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i, d in enumerate(docs):
+                tf = d.get(term, 0) if d is not None else 0
+                if tf:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[i] / avg_len)
+                    scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def _stored_lemmas(self, documents: Sequence[Tuple[Any, str]]) -> Dict[Tuple[Any, str], str]:
+        """
+        Леммы, посчитанные при ingest: строка law_passages (фрагмент) или
+        law_documents (документ целиком) с тем же document_id и текстом.
+        Выборка по индексу document_id (и длине текста), сам текст
+        сравнивается в Python: сравнение пар (id, text) в SQL — полный скан.
+        """
+        if self.pool is None or not documents:
+            return {}
+        wanted = set(documents)
+        doc_ids = list(dict.fromkeys(doc_id for doc_id, _ in documents))
+        lengths = list({len(text) for _, text in documents})
+        ids_ph = ",".join(["?"] * len(doc_ids))
+        len_ph = ",".join(["?"] * len(lengths))
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT document_id, text, lemmas FROM law_passages
+                    WHERE document_id IN ({ids_ph}) AND length(text) IN ({len_ph})
+                      AND lemmas IS NOT NULL
+                    UNION ALL
+                    SELECT id, content_text, content_lemmas FROM law_documents
+                    WHERE id IN ({ids_ph}) AND length(content_text) IN ({len_ph})
+                      AND content_lemmas IS NOT NULL
+                    """,
+                    doc_ids + lengths + doc_ids + lengths,
+                ).fetchall()
+        except Exception as exc:
+            # База без RAG-колонок (не переиндексирована).
+            logger.debug("Stored lemmas unavailable: %s", exc)
+            return {}
+        return {
+            (doc_id, text): lemmas
+            for doc_id, text, lemmas in rows
+            if (doc_id, text) in wanted
+        }
+
+    def _candidate_lemmas(
+        self,
+        documents: Sequence[Tuple[Any, str]],
+        deadline: float,
+    ) -> List[Optional[Counter]]:
+        """
+        Леммы каждого кандидата: кэш -> сохранённые при ingest -> лемматизация
+        на лету, пока не вышел бюджет (дальше — None, без bm25).
+        """
+        keys = [(doc_id, hash(text)) for doc_id, text in documents]
+        result: List[Optional[Counter]] = [self._lemma_cache.get(key) for key in keys]
+        missing = [i for i, lemmas in enumerate(result) if lemmas is None]
+        if not missing:
+            return result
+        if time.perf_counter() >= deadline:
+            self._bump("bm25_skipped", len(missing))
+            return result
+        stored = self._stored_lemmas([documents[i] for i in missing])
+        for i in missing:
+            lemmas = stored.get(documents[i])
+            if lemmas is None:
+                if time.perf_counter() >= deadline:
+                    self._bump("bm25_skipped")
+                    continue
+                lemmas = lemmatize_text(documents[i][1])
+            result[i] = Counter(lemmas.split())
+            self._lemma_cache.set(keys[i], result[i])
+        return result
+
+    @staticmethod
+    def _article_match(articles: List[str], text: str) -> float:
+        """1 — фрагмент и есть запрошенная статья, 0.5 — статья упомянута."""
+        if not articles:
+            return 0.0
+        head = ARTICLE_RE.match((text or "").lstrip())
+        if head and head.group(1) in articles:
+            return 1.0
+        if set(extract_legal_refs(text or "")["articles"]) & set(articles):
+            return 0.5
+        return 0.0
+
+    def _metadata(self, doc_ids: Sequence[Any]) -> Dict[Any, Tuple[Optional[str], Optional[date]]]:
+        """(вид акта, дата редакции) по document_id одним запросом."""
+        result: Dict[Any, Tuple[Optional[str], Optional[date]]] = {}
+        missing = []
+        for doc_id in dict.fromkeys(doc_ids):
+            cached = self._meta_cache.get(doc_id)
+            if cached is None:
+                missing.append(doc_id)
+            else:
+                result[doc_id] = cached
+        if not missing or self.pool is None:
+            return result
+
+        placeholders = ",".join(["?"] * len(missing))
+        try:
+            with self.pool.connection() as conn:
+                # Только индексируемые ключи базы законов: d.id и legal_acts.id.
+                rows = conn.execute(
+                    f"""
+                    SELECT d.id, a.kind, a.date_adopted
+                    FROM law_documents AS d
+                    LEFT JOIN legal_acts AS a ON a.id = d.act_id
+                    WHERE d.id IN ({placeholders})
+                    """,
+                    missing,
+                ).fetchall()
+        except Exception as exc:
+            logger.warning("Ranker metadata unavailable, law_type/recency disabled: %s", exc)
+            return result
+
+        for doc_id, kind, adopted in rows:
+            meta = (kind, _parse_date(adopted))
+            self._meta_cache.set(doc_id, meta)
+            result[doc_id] = meta
+        return result
+
+    def _recency(self, effective: Optional[date], today: date) -> float:
+        if effective is None:
+            return 0.0
+        # Не вступившая в силу редакция не продвигается.
+        if effective > today:
+            return 0.0
+        age_years = (today - effective).days / 365.25
+        return 0.5 ** (age_years / RECENCY_HALF_LIFE_YEARS)
+
+    def features(
+        self,
+        query: str,
+        documents: List[Tuple[Any, Any]],
+        deadline: Optional[float] = None,
+    ) -> List[Dict[str, float]]:
+        """
+        Нормированные признаки для каждого кандидата (без кросс-энкодера).
+        query — вопрос пользователя без служебных инструкций; deadline —
+        момент time.perf_counter(), после которого леммы не считаются.
+        """
+        if deadline is None:
+            deadline = time.perf_counter() + self.budget_ms / 1000
+        normalized = self.normalizer.normalize(query)
+        articles = list(dict.fromkeys(normalized.refs.get("articles", [])))
+        texts = [str(text or "") for _, text in documents]
+        n = len(documents)
+
+        lemmas = self._candidate_lemmas(
+            [(doc_id, text) for (doc_id, _), text in zip(documents, texts)], deadline
+        )
+        bm25 = _min_max(self._bm25(normalized.tokens, lemmas))
+        meta = self._metadata([doc_id for doc_id, _ in documents])
+        today = date.today()
+
+        features = []
+        for i, (doc_id, _) in enumerate(documents):
+            law_type, effective = meta.get(doc_id, (None, None))
+            features.append(
+                {
+                    "bm25": bm25[i],
+                    "position": 1.0 - i / n,
+                    "article": self._article_match(articles, texts[i]),
+                    "law_type": (
+                        LAW_TYPE_WEIGHTS.get(law_type, DEFAULT_LAW_TYPE_WEIGHT)
+                        if law_type
+                        else 0.0
+                    ),
+                    "recency": self._recency(effective, today),
+                }
+            )
+        return features
+
+    # ---------------- Ранжирование ----------------
+
+    def _cross_encoder_scores(self, query: str, texts: List[str], timeout: float) -> Optional[List[float]]:
+        if timeout <= 0:
+            self._bump("budget_exceeded")
+            return None
+        future = self._executor.submit(self.cross_encoder.score, query, texts)
+        try:
+            return _min_max(future.result(timeout=timeout))
+        except FutureTimeout:
+            # Ещё не начатый батч снимаем, начатый доработает вхолостую.
+            future.cancel()
+            self._bump("budget_exceeded")
+        except Exception as exc:
+            logger.warning("Cross-encoder failed: %s", exc)
+            self._bump("cross_encoder_errors")
+        return None
+
+    def _bump(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
 
     def rank(self, query: str, documents: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
         """
         Rank the retrieved documents.
 
-        For now, this simple ranker returns the documents as is. In future versions,
-        relevance scoring based on embeddings or domain heuristics should be applied.
-
         Args:
-            query: The original user query string.
+            query: The user's question (without service instructions).
             documents: A list of (document_id, document_content) tuples.
 
         Returns:
-            The ranked list of documents.
+            The ranked list of documents (same tuples, new order).
         """
-        return documents
+        documents = list(documents)
+        if len(documents) < 2:
+            return documents
+
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000
+        features = self.features(query, documents, deadline)
+
+        remaining = deadline - time.perf_counter()
+        ce_scores = None
+        if self.cross_encoder is not None:
+            ce_scores = self._cross_encoder_scores(
+                query, [str(text or "") for _, text in documents], remaining
+            )
+        if ce_scores is not None:
+            self._bump("cross_encoder")
+            for feats, ce in zip(features, ce_scores):
+                feats["cross_encoder"] = ce
+
+        scores = [
+            sum(self.weights.get(name, 0.0) * value for name, value in feats.items())
+            for feats in features
+        ]
+        # Стабильная сортировка: при равенстве сохраняется порядок ретривера.
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+
+        self._bump("calls")
+        self._bump("total_ms", (time.perf_counter() - started) * 1000)
+        return [documents[i] for i in order]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        calls = stats.pop("calls")
+        total_ms = stats.pop("total_ms")
+        return {
+            "calls": int(calls),
+            "avg_ms": round(total_ms / calls, 3) if calls else 0.0,
+            "cross_encoder": int(stats["cross_encoder"]),
+            "budget_exceeded": int(stats["budget_exceeded"]),
+            "cross_encoder_errors": int(stats["cross_encoder_errors"]),
+            "bm25_skipped": int(stats["bm25_skipped"]),
+            "budget_ms": self.budget_ms,
+        }
@@ -1,12 +1,26 @@
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 import sqlite3
+import logging
 import os
 import re
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
 try:
     import pymorphy2  # type: ignore
 except Exception:
     pymorphy2 = None
 
+from ..metrics import RAG_SEARCH_SECONDS
+
+from .cache import RetrievalCache, read_reindexed
+from .dense import DenseIndex, Embedder, RuBERTEmbedder
+from .executor import RetrievalExecutor
+from .pool import SQLiteConnectionPool
+
+logger = logging.getLogger(__name__)
+
 
 # --- C0+: Legal abbreviations normalization ---
 LEGAL_ABBR_MAP = {
@@ -28,9 +42,36 @@ LEGAL_ABBR_MAP = {
     "апк": "арбитражный процессуальный кодекс",
     "апкф": "арбитражный процессуальный кодекс",
 
+    "тк": "трудовой кодекс",
+    "тк рф": "трудовой кодекс",
+
+    "нк": "налоговый кодекс",
+    "нк рф": "налоговый кодекс",
+
+    "жк": "жилищный кодекс",
+    "жк рф": "жилищный кодекс",
+
+    "упк": "уголовно-процессуальный кодекс",
+    "упк рф": "уголовно-процессуальный кодекс",
+
     "фз": "федеральный закон",
 }
 
+# Одна скомпилированная альтернатива для всех сокращений вместо
+# re.sub на каждую запись словаря. Длинные ключи идут первыми,
+# чтобы «гк рф» не разбивалось на «гк» + « рф».
+LEGAL_ABBR_RE = re.compile(
+    r"\b(?:"
+    + "|".join(re.escape(k) for k in sorted(LEGAL_ABBR_MAP, key=len, reverse=True))
+    + r")\b"
+)
+WHITESPACE_RE = re.compile(r"\s+")
+TOKEN_RE = re.compile(r"[0-9a-za-яё]+", re.IGNORECASE)
+
+# Размер LRU-кэша лемм для запросов: словарь юридических вопросов
+# небольшой и сильно повторяется.
+LEMMA_CACHE_SIZE = int(os.getenv("LEGALAI_RAG_LEMMA_CACHE_SIZE", "50000"))
+
 MORPH = None
 if pymorphy2 is not None:
     try:
@@ -47,15 +88,17 @@ def normalize_russian_query(text: str) -> str:
     """
     t = (text or "").strip().lower()
     t = t.replace("ё", "е")
-    t = re.sub(r"\s+", " ", t)
+    t = WHITESPACE_RE.sub(" ", t)
     return t
 
 
 def normalize_legal_abbreviations(text: str) -> str:
-    t = text
-    for k, v in LEGAL_ABBR_MAP.items():
-        t = re.sub(rf"\b{k}\b", v, t)
-    return t
+    return LEGAL_ABBR_RE.sub(lambda m: LEGAL_ABBR_MAP[m.group(0)], text)
+
+
+def _py_lower(text: str | None) -> str | None:
+    """Нижний регистр для LIKE-скана: как у запроса (Unicode, ё -> е)."""
+    return text.lower().replace("ё", "е") if text is not None else None
 
 
 # --- C0+: legal references extraction (articles / parts / points) ---
@@ -72,57 +115,105 @@ def extract_legal_refs(text: str) -> dict:
     }
 
 
+# Кодексы для точного поиска по ссылке (code, article, part, point).
+# Порядок важен: процессуальные кодексы проверяются раньше материальных.
+CODE_PATTERNS = [
+    (code, re.compile(pattern, re.IGNORECASE))
+    for code, pattern in (
+        ("гпк", r"гражданск\w*\s+процессуальн\w*\s+кодекс"),
+        ("апк", r"арбитражн\w*\s+процессуальн\w*\s+кодекс"),
+        ("упк", r"уголовно-процессуальн\w*\s+кодекс"),
+        ("коап", r"кодекс\w*\s+(?:российской\s+федерации\s+)?об\s+административных\s+правонарушениях"),
+        ("гк", r"гражданск\w*\s+кодекс"),
+        ("тк", r"трудов\w*\s+кодекс"),
+        ("ук", r"уголовн\w*\s+кодекс"),
+        ("нк", r"налогов\w*\s+кодекс"),
+        ("жк", r"жилищн\w*\s+кодекс"),
+        ("ск", r"семейн\w*\s+кодекс"),
+    )
+]
+
+
+def detect_code(text: str) -> str | None:
+    """Кодекс, о котором идёт речь в тексте (ключ CODE_PATTERNS) или None."""
+    for code, pattern in CODE_PATTERNS:
+        if pattern.search(text or ""):
+            return code
+    return None
+
+
+def parse_lemma(token: str) -> str:
+    """Лемма одного слова через pymorphy2 (без кэша)."""
+    if MORPH is None:
+        return token
+    try:
+        return MORPH.parse(token)[0].normal_form
+    except Exception:
+        return token
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize_word(token: str) -> str:
+    """Лемма слова с LRU-кэшем (MORPH.parse — самый дорогой этап запроса)."""
+    return parse_lemma(token)
+
+
 def lemmatize_tokens(tokens: list[str]) -> list[str]:
     if MORPH is None:
         return tokens
+    return [lemmatize_word(t) for t in tokens]
 
-    lemmas: list[str] = []
-    for t in tokens:
-        try:
-            p = MORPH.parse(t)[0]
-            lemmas.append(p.normal_form)
-        except Exception:
-            lemmas.append(t)
-    return lemmas
 
-DB_PATH = os.getenv(
-    "LEGALAI_LAWS_DB_PATH",
-    "/srv/legal-ai/data/legalai.db",
-)
+@dataclass
+class NormalizedQuery:
+    """Результат нормализации запроса."""
 
-USE_FTS = True
+    text: str
+    tokens: List[str]
+    refs: dict
+    # длительность этапов, микросекунды
+    timings: Dict[str, float] = field(default_factory=dict)
 
 
-class DocumentRetriever:
+class QueryNormalizer:
     """
-    SQLite-based RAG retriever for Tatiana.
+    Конвейер подготовки запроса к поиску:
+    normalize -> abbreviations -> refs -> tokenize -> lemmatize.
 
-    Returns list of (document_id, text_fragment)
-    from law_documents.content_html.
+    Накапливает время по этапам для мониторинга (/ai/retriever/stats).
     """
 
-    def __init__(self):
-        self.db_path = DB_PATH
+    STAGES = ("normalize", "abbreviations", "refs", "tokenize", "lemmatize")
+    MAX_TOKENS = 12
+    MIN_TOKEN_LEN = 4
 
-    def retrieve(self, query: str, top_k: int = 8) -> List[Tuple[int, str]]:
-        if not query or not query.strip():
-            return []
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._count = 0
+        self._totals: Dict[str, float] = {stage: 0.0 for stage in self.STAGES}
 
-        raw = normalize_legal_abbreviations(normalize_russian_query(query))
-        refs = extract_legal_refs(raw)
+    def normalize(self, query: str) -> NormalizedQuery:
+        timings: Dict[str, float] = {}
+        clock = time.perf_counter
 
-        parts = re.findall(r"[0-9a-za-яё]+", raw, flags=re.IGNORECASE)
+        t0 = clock()
+        raw = normalize_russian_query(query)
+        t1 = clock()
+        raw = normalize_legal_abbreviations(raw)
+        t2 = clock()
+        refs = extract_legal_refs(raw)
+        t3 = clock()
 
         tokens: List[str] = []
         seen = set()
-        for p in parts:
-            if len(p) < 4:
+        for p in TOKEN_RE.findall(raw):
+            if len(p) < self.MIN_TOKEN_LEN:
                 continue
             if p in seen:
                 continue
             seen.add(p)
             tokens.append(p)
-            if len(tokens) >= 12:
+            if len(tokens) >= self.MAX_TOKENS:
                 break
 
         if not tokens:
@@ -132,74 +223,576 @@ class DocumentRetriever:
         must_tokens = list(dict.fromkeys(refs.get("articles", [])))
         optional_tokens = tokens
         tokens = must_tokens + [t for t in optional_tokens if t not in must_tokens]
+        t4 = clock()
 
         # C0: lemmatize tokens to improve recall across word forms
         tokens = lemmatize_tokens(tokens)
+        t5 = clock()
+
+        for stage, (start, end) in zip(
+            self.STAGES, ((t0, t1), (t1, t2), (t2, t3), (t3, t4), (t4, t5))
+        ):
+            timings[stage] = (end - start) * 1e6
+
+        with self._lock:
+            self._count += 1
+            for stage, value in timings.items():
+                self._totals[stage] += value
+
+        return NormalizedQuery(text=raw, tokens=tokens, refs=refs, timings=timings)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._count
+            totals = dict(self._totals)
+        info = lemmatize_word.cache_info()
+        return {
+            "queries": count,
+            "avg_us": {
+                stage: round(total / count, 2) if count else 0.0
+                for stage, total in totals.items()
+            },
+            "lemma_cache": {
+                "hits": info.hits,
+                "misses": info.misses,
+                "size": info.currsize,
+                "maxsize": info.maxsize,
+            },
+        }
+
+DB_PATH = os.getenv(
+    "LEGALAI_LAWS_DB_PATH",
+    "/srv/legal-ai/data/legalai.db",
+)
+
+USE_FTS = True
+
+# Запасной поиск после промаха FTS: триграммный индекс law_documents_trigram_fts
+# (sql/2025_legalai_law_trigram.sql). Сначала ищутся слова запроса как
+# подстроки, затем — если пусто — документы с наибольшим числом общих
+# триграмм (устойчиво к опечаткам). LIKE-скан остаётся только для баз,
+# где этот индекс не заполнен переиндексацией.
+TRIGRAM_TABLE = "law_documents_trigram_fts"
+TRIGRAM_FUZZY = os.getenv("LEGALAI_RAG_TRIGRAM_FUZZY", "1") == "1"
+# Верхняя граница числа триграмм в нечётком запросе.
+TRIGRAM_MAX_GRAMS = int(os.getenv("LEGALAI_RAG_TRIGRAM_MAX_GRAMS", "48"))
+
+# Режим выдачи по умолчанию:
+#   documents — целые строки law_documents (как раньше);
+#   passages  — фрагменты статья / часть / пункт из law_passages;
+#   dense     — фрагменты по косинусной близости эмбеддингов (DenseIndex);
+#   hybrid    — passages + dense со слиянием рангов (ai/rag/hybrid.py).
+# В любом режиме явная ссылка «ст. 333 ГК» сначала ищется в точном
+# индексе law_article_index, FTS получает только остаток запроса.
+RETRIEVER_MODE = os.getenv("LEGALAI_RAG_MODE", "documents")
+
+
+class DocumentRetriever:
+    """
+    SQLite-based RAG retriever for Tatiana.
+
+    Returns list of (document_id, text_fragment)
+    from law_documents.content_text (mode="documents")
+    or from law_passages.text (mode="passages").
+
+    content_text — нормализованный plain-text, подготовленный при ingest.
+    Новые индексы (*_text_fts, *_lemma_fts, law_passages*_fts) используются,
+    только если tasks/reindex_laws.py отметил их как заполненные; иначе —
+    старый путь по content_html / law_documents_fts и LIKE. Отметки и
+    наличие таблиц перечитываются при смене generation.
+
+    Соединения с SQLite берутся из пула (одно long-lived соединение
+    на поток), а не открываются заново на каждый запрос.
+    """
+
+    def __init__(
+        self,
+        db_path: str | None = None,
+        pool: SQLiteConnectionPool | None = None,
+        mode: str | None = None,
+        cache: RetrievalCache | None = None,
+        dense_index: DenseIndex | None = None,
+        embedder: Embedder | None = None,
+        executor: RetrievalExecutor | None = None,
+    ):
+        self.db_path = db_path or DB_PATH
+        self.pool = pool or SQLiteConnectionPool(self.db_path)
+        self.mode = mode or RETRIEVER_MODE
+        self.cache = cache if cache is not None else RetrievalCache()
+        self.normalizer = QueryNormalizer()
+        # Dense-индекс и модель грузятся лениво, при первом dense-запросе.
+        self.dense_index = dense_index or DenseIndex()
+        self.embedder = embedder or RuBERTEmbedder()
+        # Пул потоков для aretrieve (вызовы из async-кода).
+        self.executor = executor or RetrievalExecutor()
+        self._tables: dict[str, bool] = {}
+        self._reindexed: frozenset | None = None
+        self._state_generation: int | None = None
+
+    def pool_stats(self) -> dict:
+        return self.pool.stats()
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats()
+
+    def executor_stats(self) -> dict:
+        return self.executor.stats()
+
+    def _cache_key(self, kind: str, tokens: List[str], top_k: int) -> tuple:
+        # Порядок термов не влияет на OR-запрос, поэтому ключ — множество.
+        return (kind, tuple(sorted(set(tokens))), top_k)
+
+    def _cache_get(self, key: tuple):
+        try:
+            with self.pool.connection() as conn:
+                self.cache.sync_generation(conn)
+        except Exception:
+            pass
+        self._sync_index_state()
+        return self.cache.get(key)
+
+    def _sync_index_state(self) -> None:
+        """База законов изменилась (generation) — таблицы и отметки перечитываются."""
+        if self.cache.generation != self._state_generation:
+            self._tables = {}
+            self._reindexed = None
+            self._state_generation = self.cache.generation
+
+    def _has_table(self, name: str) -> bool:
+        """Есть ли таблица в базе (кэшируется до смены generation)."""
+        if name not in self._tables:
+            with self.pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = ? LIMIT 1",
+                    (name,),
+                ).fetchone()
+            self._tables[name] = row is not None
+        return self._tables[name]
+
+    def _index_ready(self, name: str) -> bool:
+        """
+        Индекс заполнен переиндексацией (отметка в rag_index_state).
+        Пустая таблица, созданная миграцией схемы, считается отсутствующей.
+        """
+        if self._reindexed is None:
+            with self.pool.connection() as conn:
+                self._reindexed = read_reindexed(conn)
+        return name in self._reindexed
+
+    def normalizer_stats(self) -> dict:
+        return self.normalizer.stats()
+
+    def _normalize(
+        self, query: str, normalized: NormalizedQuery | None = None
+    ) -> NormalizedQuery:
+        """
+        Нормализованный запрос. retrieve() нормализует запрос один раз
+        и передаёт результат дальше по цепочке (resolve_refs, ветки поиска).
+        """
+        return normalized if normalized is not None else self.normalizer.normalize(query)
+
+    @staticmethod
+    def _fts_query(tokens: List[str]) -> str:
+        fts_terms = [t for t in tokens if t and len(t) >= 2]
+        return " OR ".join(fts_terms)
+
+    def retrieve_passages(
+        self,
+        query: str,
+        top_k: int = 8,
+        normalized: NormalizedQuery | None = None,
+    ) -> List[dict]:
+        """
+        Лучшие фрагменты law_passages по FTS5 (bm25).
+
+        Каждый элемент: passage_id, document_id, article, part, point,
+        start / end (смещения в plain-text документа), text,
+        score (-bm25, больше — лучше).
+        """
+        if not query or not query.strip():
+            return []
+
+        tokens = self._normalize(query, normalized).tokens
+        key = self._cache_key("passages", tokens, top_k)
+        cached = self._cache_get(key)
+        if cached is None:
+            with RAG_SEARCH_SECONDS.time(branch="passages"):
+                cached = self._search_passages(tokens, top_k)
+            self.cache.set(key, cached)
+        return [dict(p) for p in cached]
+
+    def _search_passages(self, tokens: List[str], top_k: int) -> List[dict]:
+        fts_query = self._fts_query(tokens)
+        if not fts_query:
+            return []
+
+        # Леммы запроса ищем по лемматизированному индексу, если он построен.
+        if self._index_ready("law_passages_lemma_fts"):
+            fts_table = "law_passages_lemma_fts"
+        elif self._index_ready("law_passages_fts"):
+            fts_table = "law_passages_fts"
+        else:
+            # Фрагменты не переиндексированы — поиск по целым документам.
+            return []
+
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT p.id, p.document_id, p.article, p.part, p.point,
+                           p.start_offset, p.end_offset, p.text,
+                           -bm25({fts_table})
+                    FROM {fts_table}
+                    JOIN law_passages p ON p.id = {fts_table}.rowid
+                    WHERE {fts_table} MATCH ?
+                    ORDER BY bm25({fts_table})
+                    LIMIT ?
+                    """,
+                    (fts_query, top_k),
+                ).fetchall()
+        except sqlite3.Error:
+            # Таблицы фрагментов ещё нет (не запускали reindex) — пусто.
+            return []
+
+        return [
+            {
+                "passage_id": pid,
+                "document_id": doc_id,
+                "article": article,
+                "part": part,
+                "point": point,
+                "start": start,
+                "end": end,
+                "text": text,
+                "score": score,
+            }
+            for pid, doc_id, article, part, point, start, end, text, score in rows
+        ]
+
+    def retrieve_dense(
+        self,
+        query: str,
+        top_k: int = 8,
+        normalized: NormalizedQuery | None = None,
+    ) -> List[dict]:
+        """
+        Лучшие фрагменты по косинусной близости эмбеддингов.
+
+        Поля как у retrieve_passages + score (cosine). Если dense-индекс
+        не построен или модель недоступна — пустой список.
+        """
+        if not query or not query.strip() or not self.dense_index.available():
+            return []
+
+        key = ("dense", self._normalize(query, normalized).text, top_k)
+        cached = self._cache_get(key)
+        if cached is None:
+            started = time.perf_counter()
+            try:
+                vector = self.embedder.embed([query.strip()])[0]
+                hits = self.dense_index.search(vector, top_k=top_k)
+            except Exception as exc:
+                logger.warning("Dense retrieval unavailable: %s", exc)
+                return []
+            by_id = self._fetch_passages([pid for pid, _ in hits])
+            RAG_SEARCH_SECONDS.observe(time.perf_counter() - started, branch="dense")
+            cached = []
+            for pid, score in hits:
+                if pid in by_id:
+                    cached.append({**by_id[pid], "score": score})
+            self.cache.set(key, cached)
+        return [dict(p) for p in cached]
+
+    def _fetch_passages(self, passage_ids: List[int]) -> Dict[int, dict]:
+        """Строки law_passages по списку id (один запрос)."""
+        if not passage_ids:
+            return {}
+        placeholders = ",".join(["?"] * len(passage_ids))
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT id, document_id, article, part, point,
+                       start_offset, end_offset, text
+                FROM law_passages
+                WHERE id IN ({placeholders})
+                """,
+                passage_ids,
+            ).fetchall()
+        return {
+            pid: {
+                "passage_id": pid,
+                "document_id": doc_id,
+                "article": article,
+                "part": part,
+                "point": point,
+                "start": start,
+                "end": end,
+                "text": text,
+            }
+            for pid, doc_id, article, part, point, start, end, text in rows
+        }
+
+    def resolve_refs(
+        self,
+        query: str,
+        top_k: int = 8,
+        normalized: NormalizedQuery | None = None,
+    ) -> Tuple[List[dict], str]:
+        """
+        Точный поиск явных ссылок на норму («ч. 1 ст. 333 ГК»).
+
+        Возвращает фрагменты из law_article_index и остаток запроса
+        без ссылок и названия кодекса (пустая строка, если остатка нет).
+        Без кодекса в запросе номер статьи неоднозначен — точный поиск
+        не выполняется.
+        """
+        normalized = self._normalize(query, normalized)
+        code = detect_code(normalized.text)
+        articles = list(dict.fromkeys(normalized.refs.get("articles", [])))
+        if not code or not articles or not self._has_table("law_article_index"):
+            return [], query
+
+        rest = normalized.text
+        for pattern in (dict(CODE_PATTERNS)[code], ARTICLE_RE, PART_RE, POINT_RE):
+            rest = pattern.sub(" ", rest)
+        rest = " ".join(
+            t for t in TOKEN_RE.findall(rest) if len(t) >= QueryNormalizer.MIN_TOKEN_LEN
+        )
+
+        # Часть / пункт уточняют статью, только если она в запросе одна.
+        part = normalized.refs["parts"][0] if len(articles) == 1 and normalized.refs["parts"] else None
+        point = normalized.refs["points"][0] if len(articles) == 1 and normalized.refs["points"] else None
+
+        passage_ids: List[int] = []
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as conn:
+                for article in articles:
+                    sql = (
+                        "SELECT passage_id FROM law_article_index "
+                        "WHERE code = ? AND article = ?"
+                    )
+                    params: list = [code, article]
+                    if part:
+                        sql += " AND part = ?"
+                        params.append(part)
+                    if point:
+                        sql += " AND point = ?"
+                        params.append(point)
+                    # Свежие документы (новые редакции) — первыми.
+                    sql += " ORDER BY document_id DESC, passage_id LIMIT ?"
+                    params.append(top_k)
+                    passage_ids.extend(row[0] for row in conn.execute(sql, params))
+        except sqlite3.Error as exc:
+            logger.warning("Article index lookup failed: %s", exc)
+            return [], query
+
+        by_id = self._fetch_passages(passage_ids)
+        exact = [by_id[pid] for pid in dict.fromkeys(passage_ids) if pid in by_id]
+        RAG_SEARCH_SECONDS.observe(time.perf_counter() - started, branch="exact")
+        return exact, rest
+
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 8,
+        mode: str | None = None,
+    ) -> List[Tuple[int, str]]:
+        if not query or not query.strip():
+            return []
+
+        # Запрос нормализуется один раз на всю цепочку; остаток после
+        # точных ссылок — другой текст, он нормализуется отдельно.
+        normalized = self.normalizer.normalize(query)
+        exact, rest = self.resolve_refs(query, top_k=top_k, normalized=normalized)
+        if not exact:
+            return self._retrieve_chain(query, top_k, mode, normalized)
+
+        docs = [(p["document_id"], p["text"]) for p in exact][:top_k]
+        if rest and len(docs) < top_k:
+            for doc in self._retrieve_chain(rest, top_k, mode):
+                if doc not in docs:
+                    docs.append(doc)
+        return docs[:top_k]
+
+    def retrieve_many(
+        self,
+        queries: List[str],
+        top_k: int = 8,
+        mode: str | None = None,
+    ) -> List[List[Tuple[int, str]]]:
+        """
+        retrieve() для списка запросов одним заданием пула потоков:
+        все запросы идут через соединение этого потока, без очереди
+        и переключения потоков на каждый вопрос (ConsultantCore.ask_many).
+        """
+        return [self.retrieve(query, top_k, mode) for query in queries]
+
+    async def aretrieve(
+        self,
+        query: str,
+        top_k: int = 8,
+        mode: str | None = None,
+    ) -> List[Tuple[int, str]]:
+        """retrieve() в пуле потоков: не блокирует event loop."""
+        return await self.executor.run(self.retrieve, query, top_k, mode)
+
+    def _retrieve_chain(
+        self,
+        query: str,
+        top_k: int,
+        mode: str | None,
+        normalized: NormalizedQuery | None = None,
+    ) -> List[Tuple[int, str]]:
+        mode = mode or self.mode
+        normalized = self._normalize(query, normalized)
+        if mode == "dense":
+            passages = self.retrieve_dense(query, top_k=top_k, normalized=normalized)
+            if passages:
+                return [(p["document_id"], p["text"]) for p in passages]
+            # Dense-индекса нет — откатываемся на лексический поиск фрагментов.
+            mode = "passages"
+
+        if mode == "passages":
+            passages = self.retrieve_passages(query, top_k=top_k, normalized=normalized)
+            if passages:
+                return [(p["document_id"], p["text"]) for p in passages]
+            # Фрагментов нет — откатываемся на поиск по целым документам.
+
+        tokens = normalized.tokens
+        key = self._cache_key("documents", tokens, top_k)
+        cached = self._cache_get(key)
+        if cached is None:
+            cached = self._search_documents(tokens, top_k)
+            self.cache.set(key, cached)
+        return list(cached)
+
+    def _search_documents(self, tokens: List[str], top_k: int) -> List[Tuple[int, str]]:
+        # Приоритет индексов: леммы -> plain-text -> старый индекс по HTML.
+        if self._index_ready("law_documents_lemma_fts"):
+            fts_table, text_column = "law_documents_lemma_fts", "content_text"
+        elif self._index_ready("law_documents_text_fts"):
+            fts_table, text_column = "law_documents_text_fts", "content_text"
+        else:
+            fts_table, text_column = "law_documents_fts", "content_html"
 
         # B1: FTS5 (bm25) first, fallback to B0 LIKE
         if USE_FTS:
+            started = time.perf_counter()
             try:
-                fts_terms = [t for t in tokens if t and len(t) >= 2]
-                if fts_terms:
-                    fts_query = " OR ".join(fts_terms)
-                    conn_fts = sqlite3.connect(self.db_path)
-                    try:
+                fts_query = self._fts_query(tokens)
+                if fts_query:
+                    with self.pool.connection() as conn_fts:
                         cur_fts = conn_fts.cursor()
                         cur_fts.execute(
-                            "SELECT rowid FROM law_documents_fts WHERE law_documents_fts MATCH ? ORDER BY bm25(law_documents_fts) LIMIT ?",
+                            f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH ? ORDER BY bm25({fts_table}) LIMIT ?",
                             (fts_query, top_k),
                         )
                         fts_ids = [r[0] for r in cur_fts.fetchall()]
                         if fts_ids:
                             placeholders = ",".join(["?"] * len(fts_ids))
                             cur_fts.execute(
-                                f"SELECT id, content_html FROM law_documents WHERE id IN ({placeholders})",
+                                f"SELECT id, {text_column} FROM law_documents WHERE id IN ({placeholders})",
                                 fts_ids,
                             )
-                            id_to_html = {row[0]: row[1] for row in cur_fts.fetchall()}
-                            fts_results = [(doc_id, id_to_html.get(doc_id) or "") for doc_id in fts_ids if doc_id in id_to_html]
+                            id_to_text = {row[0]: row[1] for row in cur_fts.fetchall()}
+                            fts_results = [(doc_id, id_to_text.get(doc_id) or "") for doc_id in fts_ids if doc_id in id_to_text]
                             if fts_results:
+                                RAG_SEARCH_SECONDS.observe(time.perf_counter() - started, branch="fts")
                                 return fts_results
-                    finally:
-                        conn_fts.close()
             except Exception:
                 pass
+            # Промах FTS тоже время: запасная ветка идёт после него.
+            RAG_SEARCH_SECONDS.observe(time.perf_counter() - started, branch="fts")
+
+        # Пустой триграммный индекс (таблица есть, переиндексации не было)
+        # ничего не найдёт — тогда остаётся LIKE.
+        if self._index_ready(TRIGRAM_TABLE):
+            started = time.perf_counter()
+            try:
+                results = self._search_trigram(tokens, top_k)
+            except sqlite3.Error:
+                results = None
+            RAG_SEARCH_SECONDS.observe(time.perf_counter() - started, branch="trigram")
+            # None — индекс не смог обработать запрос (ошибка, слова короче
+            # трёх символов): решает LIKE. Пустой список от заполненного
+            # индекса окончательный.
+            if results is not None:
+                return results
+
+        started = time.perf_counter()
+        results = self._search_like(tokens, top_k, text_column)
+        RAG_SEARCH_SECONDS.observe(time.perf_counter() - started, branch="like")
+        return results
 
+    @staticmethod
+    def _trigram_phrase(text: str) -> str:
+        return '"' + text.replace('"', '""') + '"'
 
-        like_items = ["content_html LIKE ?"] * len(tokens)
+    def _trigram_queries(self, tokens: List[str]) -> Tuple[str, str]:
+        """
+        MATCH-запросы к триграммному индексу: слова запроса как подстроки
+        и OR по их триграммам для нечёткого поиска. Слова короче трёх
+        символов триграммный индекс не ищет.
+        """
+        words = [t for t in dict.fromkeys(tokens) if len(t) >= 3]
+        substring = " OR ".join(self._trigram_phrase(w) for w in words)
+        grams = list(dict.fromkeys(w[i:i + 3] for w in words for i in range(len(w) - 2)))
+        fuzzy = " OR ".join(self._trigram_phrase(g) for g in grams[:TRIGRAM_MAX_GRAMS])
+        return substring, fuzzy
+
+    def _search_trigram(self, tokens: List[str], top_k: int) -> Optional[List[Tuple[int, str]]]:
+        substring, fuzzy = self._trigram_queries(tokens)
+        if not substring:
+            # Нет слов длиной от трёх символов — триграммам искать нечего.
+            return None
+        queries = [substring] + ([fuzzy] if TRIGRAM_FUZZY and fuzzy != substring else [])
+        sql = f"""
+        SELECT d.id, d.content_text
+        FROM {TRIGRAM_TABLE}
+        JOIN law_documents AS d ON d.id = {TRIGRAM_TABLE}.rowid
+        WHERE {TRIGRAM_TABLE} MATCH ?
+        ORDER BY bm25({TRIGRAM_TABLE})
+        LIMIT ?
+        """
+        with self.pool.connection() as conn:
+            for match in queries:
+                if not match:
+                    continue
+                rows = conn.execute(sql, (match, top_k)).fetchall()
+                if rows:
+                    return [(doc_id, content or "") for doc_id, content in rows]
+        return []
+
+    def _search_like(self, tokens: List[str], top_k: int, text_column: str) -> List[Tuple[int, str]]:
+        """
+        B0: полный скан LIKE для баз без триграммного индекса.
+        Число совпавших слов считается в SQL, наружу — только top_k строк.
+        LIKE в SQLite сворачивает регистр только для ASCII, поэтому обе
+        стороны приводятся к нижнему регистру в Python (py_lower).
+        """
+        if not tokens:
+            return []
+        like_items = [f"py_lower({text_column}) LIKE ?"] * len(tokens)
         like_clauses = " OR ".join(like_items)
+        like_score = " + ".join(f"({item})" for item in like_items)
 
         # IMPORTANT: must be f-string because we inject {like_clauses}
         sql = f"""
         SELECT
         id,
-        content_html
+        {text_column},
+        {like_score} AS score
         FROM law_documents
-        WHERE content_html IS NOT NULL
+        WHERE {text_column} IS NOT NULL
         AND ({like_clauses})
+        ORDER BY score DESC
         LIMIT ?
         """
 
-        params = ["%" + t + "%" for t in tokens]
-        candidate_k = max(top_k * 6, 50)
-        params.append(candidate_k)
-
-        # keep score internally, then return pairs (doc_id, html)
-        results_scored: List[Tuple[int, str, int]] = []
-
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, params)
-            for doc_id, html in cur.fetchall():
-                text = (html or "").lower()
-                score = sum(1 for t in tokens if t in text)
-                results_scored.append((doc_id, html, score))
-        finally:
-            conn.close()
-
-        # B0: rank candidates by token match count
-        results_scored.sort(key=lambda x: x[2], reverse=True)
-        results = [(doc_id, html) for (doc_id, html, _score) in results_scored[:top_k]]
-        return results
+        params = ["%" + t.lower() + "%" for t in tokens]
+        with self.pool.connection() as conn:
+            conn.create_function("py_lower", 1, _py_lower, deterministic=True)
+            rows = conn.execute(sql, params + params + [top_k]).fetchall()
+        return [(doc_id, content) for doc_id, content, _score in rows]
 
@@ -6,9 +6,20 @@
   - скачать страницу по ссылке;
   - вытащить текст и сохранить в БД.
 
+Страницы качаются параллельно через один httpx.AsyncClient
+(LAWS_FULLTEXT_CONCURRENCY запросов всего, LAWS_FULLTEXT_PER_HOST на хост
+с паузой LAWS_FULLTEXT_DELAY между запросами к хосту). Законы берутся
+порциями по LAWS_FULLTEXT_COMMIT_EVERY в порядке id; результаты порции
+пишутся одним коммитом вместе с курсором (последний обработанный id
+в таблице law_fetch_cursor), поэтому прерванный запуск продолжается
+с того же места. Временные ошибки (сеть, 429, 5xx) уходят в очередь
+повторов с экспоненциальной задержкой. Когда курсор доходит до конца,
+он сбрасывается: следующий проход заново попробует то, что не скачалось.
+Одновременно идёт только один запуск (flock на LAWS_FULLTEXT_LOCK).
+
 Запуск НА СЕРВЕРЕ (Ubuntu, прод):
   cd /srv/legal-ai/backend
-  .venv/bin/python -m app.laws.fetch_full_text
+  .venv/bin/python -m app.laws.fetch_full_text [--limit N | --all]
 
 Запуск локально (Termux, если нужно протестировать):
   cd ~/legal-ai/backend
@@ -17,17 +28,27 @@
 
 from __future__ import annotations
 
+import argparse
+import asyncio
+import fcntl
 import logging
+import os
 import sys
-from typing import Optional
-
-import requests
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
 from bs4 import BeautifulSoup
-from sqlalchemy import select
+from sqlalchemy import bindparam, select, text, update
 from sqlalchemy.orm import Session
 
 from app.db import SessionLocal
 from app.laws.models import Law
+from app.laws.sync import RETRY_STATUSES, USER_AGENT, HostLimiter
 
 # --- Настройка логирования ---
 
@@ -40,6 +61,34 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+# --- Настройки параллельной загрузки ---
+
+LAWS_FULLTEXT_CONCURRENCY = int(os.getenv("LAWS_FULLTEXT_CONCURRENCY", "8"))
+LAWS_FULLTEXT_PER_HOST = int(os.getenv("LAWS_FULLTEXT_PER_HOST", "4"))
+# Минимальный интервал (сек) между запросами к одному хосту.
+LAWS_FULLTEXT_DELAY = float(os.getenv("LAWS_FULLTEXT_DELAY", "0.1"))
+LAWS_FULLTEXT_TIMEOUT = float(os.getenv("LAWS_FULLTEXT_TIMEOUT", "15"))
+# Законов в одной порции = строк в одном коммите.
+LAWS_FULLTEXT_COMMIT_EVERY = int(os.getenv("LAWS_FULLTEXT_COMMIT_EVERY", "100"))
+LAWS_FULLTEXT_RETRIES = int(os.getenv("LAWS_FULLTEXT_RETRIES", "3"))
+LAWS_FULLTEXT_BACKOFF = float(os.getenv("LAWS_FULLTEXT_BACKOFF", "2.0"))
+# Файл блокировки: один запуск за раз (cron --all и /laws/fetch-full-text
+# иначе гоняются за одним курсором law_fetch_cursor).
+LAWS_FULLTEXT_LOCK = os.getenv(
+    "LAWS_FULLTEXT_LOCK", os.path.join(tempfile.gettempdir(), "legalai_laws_full_text.lock")
+)
+
+CURSOR_NAME = "full_text"
+CURSOR_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS law_fetch_cursor "
+    "(name TEXT PRIMARY KEY, last_id INTEGER NOT NULL, updated_at TEXT NOT NULL)"
+)
+CURSOR_READ_SQL = "SELECT last_id FROM law_fetch_cursor WHERE name = :name"
+CURSOR_WRITE_SQL = (
+    "INSERT INTO law_fetch_cursor (name, last_id, updated_at) VALUES (:name, :last_id, :updated_at) "
+    "ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id, updated_at = excluded.updated_at"
+)
+
 
 def _clean_text(text: str) -> str:
     """Минимальная очистка текста: убираем лишние пробелы и пустые строки."""
@@ -55,109 +104,261 @@ def _extract_text_from_html(html: str) -> str:
     return _clean_text(text)
 
 
-def fetch_full_text_for_law(law: Law, session: Session, timeout: int = 15) -> Optional[str]:
-    """Скачивает и возвращает полный текст для одного закона."""
-    if not law.link:
-        logger.warning("Law id=%s has no link, skipping", law.id)
-        return None
+# --- Параллельная дозагрузка ---
 
-    url = law.link
-    logger.info("Fetching full text for law id=%s url=%s", law.id, url)
 
-    try:
-        resp = requests.get(
-            url,
-            timeout=timeout,
-            headers={
-                "User-Agent": "LegalAI-bot/1.0 (contact: admin@legalai.su)",
-            },
+@dataclass
+class _Pending:
+    """Закон в очереди на скачивание."""
+
+    law_id: int
+    link: str
+    attempt: int = 0
+    # monotonic-время, раньше которого повтор не запускать
+    not_before: float = 0.0
+
+
+# Исход скачивания одной страницы.
+OK, SKIPPED, RETRY = "ok", "skipped", "retry"
+
+
+def _read_cursor(session: Session) -> int:
+    session.execute(text(CURSOR_TABLE_SQL))
+    value = session.execute(text(CURSOR_READ_SQL), {"name": CURSOR_NAME}).scalar()
+    return int(value or 0)
+
+
+def _write_cursor(session: Session, last_id: int) -> None:
+    session.execute(
+        text(CURSOR_WRITE_SQL),
+        {"name": CURSOR_NAME, "last_id": last_id, "updated_at": datetime.utcnow().isoformat()},
+    )
+
+
+def _next_laws(session: Session, after_id: int, limit: int) -> List[_Pending]:
+    stmt = (
+        select(Law.id, Law.link)
+        .where(
+            (Law.id > after_id)
+            & (Law.link.isnot(None))
+            & ((Law.full_text.is_(None)) | (Law.full_text == ""))
+        )
+        .order_by(Law.id.asc())
+        .limit(limit)
+    )
+    return [_Pending(law_id, link) for law_id, link in session.execute(stmt)]
+
+
+def _save_texts(session: Session, texts: List[Dict[str, object]], cursor: int) -> None:
+    """Одним коммитом: тексты порции (executemany) и курсор."""
+    if texts:
+        table = Law.__table__
+        session.execute(
+            update(table)
+            .where(table.c.id == bindparam("law_id"))
+            .values(full_text=bindparam("full_text"), updated_at=datetime.utcnow()),
+            texts,
         )
-    except requests.RequestException as exc:
-        logger.error("Request error for law id=%s: %s", law.id, exc)
-        return None
+    _write_cursor(session, cursor)
+    session.commit()
 
+
+async def _fetch_one(
+    client: httpx.AsyncClient,
+    limiter: HostLimiter,
+    slots: asyncio.Semaphore,
+    item: _Pending,
+) -> Tuple[str, Optional[str]]:
+    """(исход, текст) для одного закона."""
+    try:
+        async with slots:
+            resp = await limiter.run(item.link, lambda: client.get(item.link))
+    except httpx.TransportError as exc:
+        logger.warning("Request error for law id=%s: %s", item.law_id, exc)
+        return RETRY, None
+    except httpx.InvalidURL as exc:
+        logger.error("Invalid link for law id=%s: %s", item.law_id, exc)
+        return SKIPPED, None
+
+    if resp.status_code in RETRY_STATUSES:
+        logger.warning("Transient status for law id=%s: %s", item.law_id, resp.status_code)
+        return RETRY, None
     if resp.status_code != 200:
         logger.error(
             "Non-200 status for law id=%s: %s %s",
-            law.id,
+            item.law_id,
             resp.status_code,
-            resp.reason,
+            resp.reason_phrase,
         )
-        return None
+        return SKIPPED, None
 
     try:
-        full_text = _extract_text_from_html(resp.text)
+        # BeautifulSoup — CPU, не держим event loop
+        full_text = await asyncio.to_thread(_extract_text_from_html, resp.text)
     except Exception as exc:
-        logger.error("HTML parse error for law id=%s: %s", law.id, exc)
-        return None
+        logger.error("HTML parse error for law id=%s: %s", item.law_id, exc)
+        return SKIPPED, None
 
     if not full_text:
-        logger.warning("Empty full_text for law id=%s after parsing", law.id)
-        return None
-
-    return full_text
-
-
-def fetch_full_text_batch(limit: int = 200) -> None:
-    """Обрабатывает не более `limit` законов за один запуск.
+        logger.warning("Empty full_text for law id=%s after parsing", item.law_id)
+        return SKIPPED, None
+    return OK, full_text
+
+
+async def fetch_full_text_async(
+    limit: Optional[int] = 200,
+    *,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+    concurrency: int = LAWS_FULLTEXT_CONCURRENCY,
+    per_host: int = LAWS_FULLTEXT_PER_HOST,
+    delay: float = LAWS_FULLTEXT_DELAY,
+    commit_every: int = LAWS_FULLTEXT_COMMIT_EVERY,
+    retries: int = LAWS_FULLTEXT_RETRIES,
+    backoff: float = LAWS_FULLTEXT_BACKOFF,
+) -> Dict[str, int]:
+    """
+    Дозагружает полный текст не более чем для limit законов
+    (limit=None — пока не кончатся законы после курсора).
 
-    Выбирает записи, где full_text пустой, но есть link.
+    Каждая порция — новые законы после курсора плюс созревшие повторы,
+    скачанные параллельно; затем один коммит с текстами и курсором.
+    transport — для тестов (httpx.MockTransport).
     """
-    logger.info("Starting full-text batch for laws (limit=%s)", limit)
+    stats = {"processed": 0, "updated": 0, "skipped": 0, "retried": 0}
+    limiter = HostLimiter(per_host, delay)
+    slots = asyncio.Semaphore(max(1, concurrency))
+    retry_queue: List[_Pending] = []
+    budget = limit
+    drained = False
 
     with SessionLocal() as session:
-        stmt = (
-            select(Law)
-            .where(
-                (Law.link.isnot(None))
-                & ((Law.full_text.is_(None)) | (Law.full_text == ""))
-            )
-            .order_by(Law.id.asc())
-            .limit(limit)
-        )
-
-        laws_to_process = session.scalars(stmt).all()
-
-        if not laws_to_process:
-            logger.info("No laws found without full_text. Nothing to do.")
+        cursor = saved_cursor = _read_cursor(session)
+        session.commit()
+        async with httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(LAWS_FULLTEXT_TIMEOUT),
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+        ) as client:
+            while True:
+                now = time.monotonic()
+                due = [item for item in retry_queue if item.not_before <= now]
+                retry_queue = [item for item in retry_queue if item.not_before > now]
+
+                fresh: List[_Pending] = []
+                room = commit_every - len(due)
+                if budget is not None:
+                    room = min(room, budget)
+                if not drained and room > 0:
+                    fresh = await asyncio.to_thread(_next_laws, session, cursor, room)
+                    drained = len(fresh) < room
+                    if budget is not None:
+                        budget -= len(fresh)
+
+                batch = due + fresh
+                if not batch:
+                    if not retry_queue:
+                        if drained and saved_cursor:
+                            # очередь кончилась — следующий проход сначала
+                            await asyncio.to_thread(_save_texts, session, [], 0)
+                        break
+                    # только повторы, и они ещё не созрели
+                    await asyncio.sleep(min(item.not_before for item in retry_queue) - now)
+                    continue
+
+                outcomes = await asyncio.gather(
+                    *(_fetch_one(client, limiter, slots, item) for item in batch)
+                )
+
+                texts: List[Dict[str, object]] = []
+                for item, (outcome, full_text) in zip(batch, outcomes):
+                    if outcome == RETRY and item.attempt < retries:
+                        item.attempt += 1
+                        item.not_before = time.monotonic() + backoff * 2 ** (item.attempt - 1)
+                        retry_queue.append(item)
+                        stats["retried"] += 1
+                        continue
+                    stats["processed"] += 1
+                    if outcome == OK:
+                        texts.append({"law_id": item.law_id, "full_text": full_text})
+                        stats["updated"] += 1
+                    else:
+                        stats["skipped"] += 1
+
+                if fresh:
+                    cursor = fresh[-1].law_id
+                # Конец очереди — следующий проход начнётся сначала и
+                # повторит законы, которые так и не скачались.
+                next_cursor = 0 if drained and not retry_queue else cursor
+                try:
+                    await asyncio.to_thread(_save_texts, session, texts, next_cursor)
+                except Exception as exc:
+                    session.rollback()
+                    logger.error("DB error while saving %s texts: %s", len(texts), exc)
+                    raise
+                saved_cursor = next_cursor
+
+                logger.info(
+                    "Committed %s texts (cursor=%s, retry queue=%s)",
+                    len(texts),
+                    next_cursor,
+                    len(retry_queue),
+                )
+
+    return stats
+
+
+@contextmanager
+def _run_lock(path: Optional[str] = None) -> Iterator[bool]:
+    """Неблокирующий flock на файл; True — блокировка взята."""
+    with open(path or LAWS_FULLTEXT_LOCK, "a") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
             return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
 
-        logger.info("Found %s laws to process", len(laws_to_process))
-
-        processed = 0
-        updated = 0
-        skipped = 0
 
-        for law in laws_to_process:
-            processed += 1
-            text = fetch_full_text_for_law(law, session=session)
+def fetch_full_text_batch(limit: Optional[int] = 200) -> None:
+    """Обрабатывает не более `limit` законов за один запуск (None — все).
 
-            if not text:
-                skipped += 1
-                continue
-
-            law.full_text = text
-            updated += 1
+    Выбирает записи, где full_text пустой, но есть link, начиная
+    с сохранённого курсора. Если уже идёт другой запуск — ничего не делает.
+    """
+    with _run_lock() as locked:
+        if not locked:
+            logger.info("Another full-text run holds %s, skipping", LAWS_FULLTEXT_LOCK)
+            return
+        logger.info("Starting full-text batch for laws (limit=%s)", limit)
+        started = time.perf_counter()
+        stats = asyncio.run(fetch_full_text_async(limit))
 
-            try:
-                session.add(law)
-                session.commit()
-            except Exception as exc:
-                session.rollback()
-                logger.error("DB error while saving law id=%s: %s", law.id, exc)
-                skipped += 1
+    if not stats["processed"]:
+        logger.info("No laws found without full_text. Nothing to do.")
+        return
 
-        logger.info(
-            "Batch finished: processed=%s, updated=%s, skipped=%s",
-            processed,
-            updated,
-            skipped,
-        )
+    logger.info(
+        "Batch finished in %.1fs: processed=%s, updated=%s, skipped=%s, retried=%s",
+        time.perf_counter() - started,
+        stats["processed"],
+        stats["updated"],
+        stats["skipped"],
+        stats["retried"],
+    )
 
 
 def main() -> None:
     """CLI-точка входа."""
-    fetch_full_text_batch(limit=200)
+    parser = argparse.ArgumentParser(description="Дозагрузка полного текста законов")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--limit", type=int, default=200, help="законов за запуск")
+    group.add_argument("--all", action="store_true", help="работать, пока не кончится очередь")
+    args = parser.parse_args()
+    fetch_full_text_batch(limit=None if args.all else args.limit)
 
 
 if __name__ == "__main__":
@@ -1,21 +1,57 @@
 """
 Автоматическая загрузка законов в таблицу laws из официальных источников
 (Официальный интернет-портал правовой информации — publication.pravo.gov.ru).
+
+Все ленты (основная XML RSS, блоки API и LAWS_EXTRA_SOURCES) скачиваются
+одновременно через один httpx.AsyncClient: не больше
+LAWS_SYNC_PER_HOST_CONCURRENCY запросов на хост, пауза
+LAWS_SYNC_POLITENESS_DELAY между стартами запросов к одному хосту,
+повторы с экспоненциальной задержкой при сетевых ошибках, 429 и 5xx.
+Запросы условные: неизменившиеся с прошлого запуска ленты (304 или тот
+же хэш тела) не разбираются и не пишутся в базу. Для каждой ленты
+хранится high-water mark (app/services/sync_marks.py): разбор идёт до
+первого уже известного акта, а блоки API после первой синхронизации
+запрашиваются страницами по LAWS_SYNC_PAGE_SIZE и листаются дальше,
+только если вся страница новая.
+Разобранные элементы пишет в базу один писатель по очереди, поэтому
+синхронизация длится примерно столько, сколько самая медленная лента.
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 import re
+import time
+from dataclasses import dataclass
 from datetime import datetime, timezone, date
 from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
 
+import httpx
 import requests
 import xml.etree.ElementTree as ET
+from sqlalchemy import insert, select, text
 
+from ai.rag.cache import GENERATION_BUMP_SQL, GENERATION_TABLE_SQL
 from app.db import SessionLocal
 from app.laws.models import Law
+from app.services.http_validators import (
+    VALIDATORS_SELECT_SQL,
+    VALIDATORS_TABLE_SQL,
+    VALIDATORS_UPSERT_SQL,
+    Validators,
+    is_unchanged,
+    rows_to_validators,
+)
+from app.services.sync_marks import (
+    MARKS_SELECT_SQL,
+    MARKS_TABLE_SQL,
+    MARKS_UPSERT_SQL,
+    HighWaterMark,
+    rows_to_marks,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +86,56 @@ API_BLOCKS: List[Tuple[Optional[str], str]] = [
     ("international", "international_treaty"),
 ]
 
+# --- Настройки параллельной загрузки -------------------------------------------
+
+LAWS_SYNC_TIMEOUT = float(os.getenv("LAWS_SYNC_TIMEOUT", "30"))
+# Одновременных запросов к одному хосту (все блоки API — один хост).
+LAWS_SYNC_PER_HOST_CONCURRENCY = int(os.getenv("LAWS_SYNC_PER_HOST_CONCURRENCY", "4"))
+# Минимальный интервал (сек) между стартами запросов к одному хосту.
+LAWS_SYNC_POLITENESS_DELAY = float(os.getenv("LAWS_SYNC_POLITENESS_DELAY", "0.2"))
+LAWS_SYNC_RETRIES = int(os.getenv("LAWS_SYNC_RETRIES", "3"))
+# Задержка перед повтором: BACKOFF * 2**(попытка - 1), не больше BACKOFF_MAX.
+LAWS_SYNC_BACKOFF = float(os.getenv("LAWS_SYNC_BACKOFF", "1.0"))
+LAWS_SYNC_BACKOFF_MAX = float(os.getenv("LAWS_SYNC_BACKOFF_MAX", "30"))
+# Условные запросы (ETag / Last-Modified / хэш тела, app/services/http_validators.py).
+LAWS_SYNC_CONDITIONAL = os.getenv("LAWS_SYNC_CONDITIONAL", "1") == "1"
+# Инкрементальная синхронизация блоков API: размер страницы, параметр
+# номера страницы (с 1) и предел страниц за запуск при разрыве.
+LAWS_SYNC_PAGE_SIZE = int(os.getenv("LAWS_SYNC_PAGE_SIZE", "50"))
+LAWS_SYNC_PAGE_PARAM = os.getenv("LAWS_SYNC_PAGE_PARAM", "page")
+LAWS_SYNC_MAX_PAGES = int(os.getenv("LAWS_SYNC_MAX_PAGES", "20"))
+
+# Сколько external_id проверяется и вставляется одним запросом.
+LAWS_BULK_CHUNK_SIZE = int(os.getenv("LAWS_BULK_CHUNK_SIZE", "500"))
+
+USER_AGENT = "LegalAI-bot/1.0 (contact: admin@legalai.su)"
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass(frozen=True)
+class Feed:
+    """Одна лента синхронизации: откуда качать и как записать в laws."""
+
+    url: str
+    law_type: str
+    source: str = DEFAULT_SOURCE
+    # лента поддерживает pageSize / LAWS_SYNC_PAGE_PARAM (блоки API)
+    paged: bool = False
+
+
+@dataclass
+class FeedResult:
+    """Что загрузчик передаёт писателю по одной ленте."""
+
+    feed: Feed
+    # None — лента не изменилась, писать нечего
+    items: Optional[List[Dict[str, object]]]
+    # URL первой запрошенной страницы и его валидаторы
+    url: str
+    validators: Validators
+    mark: HighWaterMark
+
 
 # --- Вспомогательные функции --------------------------------------------------
 
@@ -83,8 +169,10 @@ def _fetch_xml(url: str) -> ET.Element:
 
 
 def fetch_laws_from_rss(url: str) -> List[Dict[str, object]]:
-    root = _fetch_xml(url)
+    return _parse_rss_items(_fetch_xml(url), url)
+
 
+def _parse_rss_items(root: ET.Element, url: str) -> List[Dict[str, object]]:
     items: List[Dict[str, object]] = []
     for item in root.findall(".//item"):
         title = (item.findtext("title") or "").strip()
@@ -119,6 +207,78 @@ def _to_date(value: Optional[datetime]) -> Optional[date]:
     return None
 
 
+def _insert_ignore(session):
+    """
+    INSERT в laws, пропускающий дубликаты по uq_laws_source_external_id
+    (ON CONFLICT DO NOTHING в SQLite / PostgreSQL) — на случай, если запись
+    появилась между проверкой и вставкой.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(Law.__table__)
+    return dialect_insert(Law.__table__).on_conflict_do_nothing()
+
+
+def _law_row(item: Dict[str, object], law_type: str, source: str) -> Dict[str, object]:
+    date_published = _to_date(item.get("date_published"))
+    return {
+        "source": source,
+        "external_id": str(item["external_id"]),
+        "number": item.get("number"),
+        "title": str(item["title"]),
+        "summary": None,
+        "law_type": law_type,
+        "country": "RU",
+        "language": "ru",
+        "date_published": date_published,
+        "date_effective": date_published,
+        "link": str(item["link"]),
+    }
+
+
+def _bulk_insert_items(
+    session,
+    items: List[Dict[str, object]],
+    law_type: str,
+    source: str,
+) -> Tuple[int, int]:
+    """
+    Вставляет новые акты пачками: по чанку LAWS_BULK_CHUNK_SIZE —
+    один SELECT уже известных external_id и один executemany INSERT.
+    Возвращает (вставлено, пропущено).
+    """
+    rows: Dict[str, Dict[str, object]] = {}
+    for item in items:
+        row = _law_row(item, law_type, source)
+        # повтор guid внутри одной ленты — тоже дубликат
+        rows.setdefault(row["external_id"], row)
+
+    keys = list(rows)
+    inserted = 0
+    stmt = _insert_ignore(session)
+    for i in range(0, len(keys), LAWS_BULK_CHUNK_SIZE):
+        chunk = keys[i:i + LAWS_BULK_CHUNK_SIZE]
+        known = set(
+            session.scalars(
+                select(Law.external_id).where(
+                    Law.source == source,
+                    Law.external_id.in_(chunk),
+                )
+            )
+        )
+        fresh = [rows[key] for key in chunk if key not in known]
+        if not fresh:
+            continue
+        result = session.execute(stmt, fresh)
+        inserted += result.rowcount if result.rowcount >= 0 else len(fresh)
+
+    return inserted, len(items) - inserted
+
+
 def _save_items_to_db(
     items: List[Dict[str, object]],
     law_type: str,
@@ -131,55 +291,26 @@ def _save_items_to_db(
     created = 0
 
     try:
-        for item in items:
-            external_id = str(item["external_id"])
-            link = str(item["link"])
-
-            existing = (
-                session.query(Law)
-                .filter(
-                    Law.source == source,
-                    Law.external_id == external_id,
-                )
-                .first()
-            )
-            if existing:
-                continue
-
-            title = str(item["title"])
-            number = item.get("number")
-            date_published_dt = item.get("date_published")
-            date_published = _to_date(date_published_dt)
-            date_effective = date_published
-
-            law = Law(
-                source=source,
-                external_id=external_id,
-                number=number,
-                title=title,
-                summary=None,
-                law_type=law_type,
-                country="RU",
-                language="ru",
-                date_published=date_published,
-                date_effective=date_effective,
-                link=link,
-            )
-
-            session.add(law)
-            created += 1
+        created, skipped = _bulk_insert_items(session, items, law_type, source)
 
         if created:
+            # сбрасываем кэш RAG-поиска в воркерах backend (та же транзакция)
+            session.execute(text(GENERATION_TABLE_SQL))
+            session.execute(text(GENERATION_BUMP_SQL))
             session.commit()
             logger.info(
-                "В таблицу laws добавлено %d новых записей (law_type=%s, source=%s)",
+                "В таблицу laws добавлено %d новых записей, пропущено %d "
+                "(law_type=%s, source=%s)",
                 created,
+                skipped,
                 law_type,
                 source,
             )
         else:
+            session.rollback()
             logger.info(
-                "Новых законов для добавления нет (law_type=%s, source=%s)",
+                "Новых законов для добавления нет, пропущено %d (law_type=%s, source=%s)",
+                skipped,
                 law_type,
                 source,
             )
@@ -194,77 +325,331 @@ def _save_items_to_db(
     return created
 
 
-# --- Публичные функции синхронизации -----------------------------------------
-
-
-def sync_xml_main() -> int:
-    if not LAWS_XML_RSS_MAIN:
-        logger.error("LAWS_XML_RSS_MAIN не задан.")
-        return 0
+def _load_feed_state(
+    feeds: List[Feed],
+) -> Tuple[Dict[str, Validators], Dict[str, HighWaterMark]]:
+    """Валидаторы HTTP и high-water marks лент одним заходом в базу."""
+    session = SessionLocal()
+    try:
+        session.execute(text(VALIDATORS_TABLE_SQL))
+        session.execute(text(MARKS_TABLE_SQL))
+        validator_rows = session.execute(text(VALIDATORS_SELECT_SQL)).fetchall()
+        mark_rows = session.execute(text(MARKS_SELECT_SQL)).fetchall()
+        session.commit()
+    finally:
+        session.close()
+    urls = [feed.url for feed in feeds]
+    page_urls = [_page_url(feed.url, 1) for feed in feeds if feed.paged]
+    return rows_to_validators(validator_rows, urls + page_urls), rows_to_marks(mark_rows, urls)
 
-    logger.info("Синхронизация из XML RSS (main): %s", LAWS_XML_RSS_MAIN)
 
+def _save_feed_state(result: FeedResult) -> None:
+    """Запоминает валидаторы и отметку ленты (после записи её элементов)."""
+    session = SessionLocal()
     try:
-        items = fetch_laws_from_rss(LAWS_XML_RSS_MAIN)
+        session.execute(text(VALIDATORS_TABLE_SQL))
+        session.execute(text(MARKS_TABLE_SQL))
+        session.execute(text(VALIDATORS_UPSERT_SQL), result.validators.params(result.url))
+        session.execute(text(MARKS_UPSERT_SQL), result.mark.params(result.feed.url, result.feed.source))
+        session.commit()
     except Exception:
-        logger.exception(
-            "Не удалось загрузить основную XML RSS (%s). "
-            "Продолжаем синхронизацию по другим источникам.",
-            LAWS_XML_RSS_MAIN,
-        )
-        return 0
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
-    return _save_items_to_db(items, law_type="general", source=DEFAULT_SOURCE)
 
+def _page_url(url: str, page: int, page_size: Optional[int] = None) -> str:
+    """URL страницы page блока API (по умолчанию LAWS_SYNC_PAGE_SIZE элементов)."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query["pageSize"] = str(page_size or LAWS_SYNC_PAGE_SIZE)
+    query.pop(LAWS_SYNC_PAGE_PARAM, None)
+    if page > 1:
+        query[LAWS_SYNC_PAGE_PARAM] = str(page)
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+# --- Параллельная загрузка лент -------------------------------------------------
+
+
+class HostLimiter:
+    """
+    Вежливость к источникам: семафор на хост и минимальный интервал
+    между стартами запросов к нему.
+    """
+
+    def __init__(self, concurrency: int, delay: float) -> None:
+        self.concurrency = max(1, concurrency)
+        self.delay = delay
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_start: Dict[str, float] = {}
+
+    def _host(self, url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    async def _wait_turn(self, host: str) -> None:
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            last = self._last_start.get(host)
+            if last is not None:
+                pause = last + self.delay - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+            self._last_start[host] = time.monotonic()
+
+    async def run(self, url: str, request):
+        """Выполняет request() в слоте хоста url."""
+        host = self._host(url)
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            await self._wait_turn(host)
+            return await request()
+
+
+def _retry_delay(resp: Optional[httpx.Response], attempt: int, backoff: float) -> float:
+    delay = min(backoff * 2 ** (attempt - 1), LAWS_SYNC_BACKOFF_MAX)
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            delay = min(float(retry_after), LAWS_SYNC_BACKOFF_MAX)
+    return delay
+
+
+async def _fetch_feed(
+    client: httpx.AsyncClient,
+    limiter: HostLimiter,
+    url: str,
+    stored: Optional[Validators] = None,
+    retries: int = LAWS_SYNC_RETRIES,
+    backoff: float = LAWS_SYNC_BACKOFF,
+) -> Tuple[Optional[List[Dict[str, object]]], Validators]:
+    """
+    Скачивает и разбирает одну ленту с повторами при временных ошибках.
+
+    Запрос условный (stored — валидаторы прошлой загрузки). Возвращает
+    (элементы, валидаторы ответа); элементы None, если лента не изменилась:
+    сервер ответил 304 или хэш тела совпал с сохранённым.
+    """
+    headers = stored.request_headers() if stored is not None else {}
+    attempt = 0
+    while True:
+        attempt += 1
+        resp: Optional[httpx.Response] = None
+        try:
+            logger.info("Загрузка XML RSS: %s", url)
+            resp = await limiter.run(url, lambda: client.get(url, headers=headers))
+            if resp.status_code == 304:
+                if stored is None:
+                    # Условных заголовков не было — 304 отдал кэш/прокси.
+                    # Сравнивать не с чем: считаем, что изменений нет.
+                    logger.warning("Лента %s: 304 без сохранённых валидаторов", url)
+                    return None, Validators()
+                return None, stored
+            if resp.status_code not in RETRY_STATUSES:
+                resp.raise_for_status()
+                fresh = Validators.from_response(resp.headers, resp.content)
+                if is_unchanged(stored, fresh):
+                    return None, fresh
+                return _parse_rss_items(ET.fromstring(resp.content), url), fresh
+            error: Exception = httpx.HTTPStatusError(
+                f"HTTP {resp.status_code}", request=resp.request, response=resp
+            )
+        except httpx.TransportError as exc:
+            error = exc
+        if attempt > retries:
+            raise error
+        delay = _retry_delay(resp, attempt, backoff)
+        logger.warning(
+            "Ошибка загрузки %s (%s), попытка %d/%d через %.1f с",
+            url, error, attempt, retries + 1, delay,
+        )
+        await asyncio.sleep(delay)
+
+
+async def sync_feeds(
+    feeds: List[Feed],
+    *,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+    per_host_concurrency: int = LAWS_SYNC_PER_HOST_CONCURRENCY,
+    politeness_delay: float = LAWS_SYNC_POLITENESS_DELAY,
+    retries: int = LAWS_SYNC_RETRIES,
+    backoff: float = LAWS_SYNC_BACKOFF,
+    force: bool = False,
+) -> int:
+    """
+    Параллельно скачивает ленты и записывает новые акты в laws.
+
+    Загрузчики кладут разобранные элементы в очередь, единственный писатель
+    сохраняет их по одной ленте (в пуле потоков — сессия SQLAlchemy
+    синхронная), затем валидаторы HTTP этой ленты. Неизменившиеся ленты
+    (304 / тот же хэш) не разбираются и не пишутся. Ошибка загрузки ленты
+    логируется и не мешает остальным; ошибка записи в базу прерывает
+    синхронизацию, как и раньше.
+    force=True — безусловные запросы без отметок (например, после очистки laws).
+    transport — для тестов (httpx.MockTransport).
+    """
+    if not feeds:
+        return 0
 
-def sync_api_blocks() -> int:
-    total_created = 0
+    limiter = HostLimiter(per_host_concurrency, politeness_delay)
+    stored: Dict[str, Validators] = {}
+    marks: Dict[str, HighWaterMark] = {}
+    if not force:
+        stored, marks = await asyncio.to_thread(_load_feed_state, feeds)
+        if not LAWS_SYNC_CONDITIONAL:
+            stored = {}
+    queue: "asyncio.Queue[Optional[FeedResult]]" = asyncio.Queue()
+
+    async def fetch(client: httpx.AsyncClient, url: str, previous: Optional[Validators]):
+        return await _fetch_feed(client, limiter, url, previous, retries=retries, backoff=backoff)
+
+    async def download_pages(client: httpx.AsyncClient, feed: Feed, mark: HighWaterMark) -> FeedResult:
+        """
+        Страницы блока API от новых к старым, пока не встретится известный
+        акт. Полностью новая страница означает разрыв — берём следующую.
+        Параметр page не документирован: если портал его не учитывает и
+        отдаёт ту же страницу (тот же первый guid или хэш тела), листание
+        прекращается, а новые акты берутся из ленты целиком (один запрос,
+        как при первой синхронизации) — иначе разрыв потерялся бы.
+        """
+        first_url = _page_url(feed.url, 1)
+        new_items: List[Dict[str, object]] = []
+        validators = Validators()
+        previous: Optional[Tuple[object, Optional[str]]] = None
+        for page in range(1, LAWS_SYNC_MAX_PAGES + 1):
+            url = _page_url(feed.url, page)
+            items, page_validators = await fetch(client, url, stored.get(url) if page == 1 else None)
+            if page == 1:
+                validators = page_validators
+                if items is None:
+                    return FeedResult(feed, None, first_url, validators, mark)
+            signature = ((items or [{}])[0].get("external_id"), page_validators.content_hash)
+            if previous is not None and any(
+                value is not None and value == seen for value, seen in zip(signature, previous)
+            ):
+                logger.warning(
+                    "Лента %s: страница %d повторяет предыдущую — параметр page не поддерживается",
+                    feed.url,
+                    page,
+                )
+                items, _ = await fetch(client, feed.url, None)
+                new_items, _ = mark.split(items or [])
+                break
+            previous = signature
+            fresh, reached = mark.split(items or [])
+            new_items.extend(fresh)
+            if reached or not items or len(items) < LAWS_SYNC_PAGE_SIZE:
+                break
+            logger.info("Разрыв в ленте %s: страница %d целиком новая, листаем дальше", feed.url, page)
+        else:
+            logger.warning(
+                "Лента %s: за %d страниц не дошли до известных актов", feed.url, LAWS_SYNC_MAX_PAGES
+            )
+        return FeedResult(feed, new_items, first_url, validators, mark)
 
-    for block, law_type in API_BLOCKS:
-        url = _build_api_url(block)
-        logger.info("Синхронизация из API RSS: %s (law_type=%s)", url, law_type)
+    async def download(client: httpx.AsyncClient, feed: Feed) -> None:
+        mark = marks.get(feed.url)
         try:
-            items = fetch_laws_from_rss(url)
+            if feed.paged and mark is not None:
+                result = await download_pages(client, feed, mark)
+            else:
+                # первая синхронизация ленты или лента без страниц
+                mark = mark or HighWaterMark()
+                items, validators = await fetch(client, feed.url, stored.get(feed.url))
+                if items is not None:
+                    items, _ = mark.split(items)
+                result = FeedResult(feed, items, feed.url, validators, mark)
         except Exception:
-            logger.exception("Ошибка при загрузке %s", url)
-            continue
+            logger.exception("Ошибка при загрузке %s (law_type=%s)", feed.url, feed.law_type)
+            return
+        if result.items is None:
+            logger.info("Лента не изменилась: %s (law_type=%s)", feed.url, feed.law_type)
+            if result.validators == stored.get(result.url):
+                return
+        await queue.put(result)
+
+    async def write() -> int:
+        created = 0
+        while True:
+            result = await queue.get()
+            if result is None:
+                return created
+            if result.items:
+                created += await asyncio.to_thread(
+                    _save_items_to_db, result.items, law_type=result.feed.law_type, source=result.feed.source
+                )
+                result.mark = result.mark.advance(result.items)
+            await asyncio.to_thread(_save_feed_state, result)
+
+    async with httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(LAWS_SYNC_TIMEOUT),
+        headers={"User-Agent": USER_AGENT},
+        follow_redirects=True,
+    ) as client:
+        writer = asyncio.ensure_future(write())
+        downloads = asyncio.gather(*(download(client, feed) for feed in feeds))
+        try:
+            # писатель падает раньше загрузчиков — не ждём их зря
+            await asyncio.wait({writer, downloads}, return_when=asyncio.FIRST_COMPLETED)
+            if writer.done():
+                writer.result()
+            await downloads
+            await queue.put(None)
+            return await writer
+        finally:
+            for task in (writer, downloads):
+                task.cancel()
+            await asyncio.gather(writer, downloads, return_exceptions=True)
 
-        created = _save_items_to_db(items, law_type=law_type, source=DEFAULT_SOURCE)
-        total_created += created
 
-    return total_created
+# --- Публичные функции синхронизации -----------------------------------------
 
 
-def sync_extra_sources() -> int:
-    total_created = 0
-    if not LAWS_EXTRA_SOURCES:
-        return 0
+def main_feeds() -> List[Feed]:
+    if not LAWS_XML_RSS_MAIN:
+        logger.error("LAWS_XML_RSS_MAIN не задан.")
+        return []
+    return [Feed(LAWS_XML_RSS_MAIN, law_type="general")]
 
-    for url in LAWS_EXTRA_SOURCES:
-        logger.info("Синхронизация из дополнительного источника: %s", url)
-        try:
-            items = fetch_laws_from_rss(url)
-        except Exception:
-            logger.exception("Ошибка при загрузке дополнительного источника %s", url)
-            continue
 
-        created = _save_items_to_db(items, law_type="extra", source=url)
-        total_created += created
+def api_feeds() -> List[Feed]:
+    return [Feed(_build_api_url(block), law_type=law_type, paged=True) for block, law_type in API_BLOCKS]
+
 
-    return total_created
+def extra_feeds() -> List[Feed]:
+    return [Feed(url, law_type="extra", source=url) for url in LAWS_EXTRA_SOURCES]
+
+
+def sync_xml_main() -> int:
+    return asyncio.run(sync_feeds(main_feeds()))
+
+
+def sync_api_blocks() -> int:
+    return asyncio.run(sync_feeds(api_feeds()))
+
+
+def sync_extra_sources() -> int:
+    return asyncio.run(sync_feeds(extra_feeds()))
 
 
 def sync_all_sources() -> int:
     logging.basicConfig(level=logging.INFO)
 
     logger.info("=== Запуск синхронизации законов (all sources) ===")
-    total = 0
+    started = time.perf_counter()
 
-    total += sync_xml_main()
-    total += sync_api_blocks()
-    total += sync_extra_sources()
+    feeds = main_feeds() + api_feeds() + extra_feeds()
+    total = asyncio.run(sync_feeds(feeds))
 
-    logger.info("=== Синхронизация завершена. Всего добавлено %d актов. ===", total)
+    logger.info(
+        "=== Синхронизация завершена за %.1f с (%d лент). Всего добавлено %d актов. ===",
+        time.perf_counter() - started,
+        len(feeds),
+        total,
+    )
     return total
 
 
@@ -2,6 +2,7 @@ import logging
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from .config import get_settings
 from .db import Base, engine
@@ -10,6 +11,7 @@ from .auth.routes import router as auth_router
 from .auth.reset.router import router as reset_router  # ✅ ИСПРАВЛЕНО: было .routes
 
 from routers.ai import router as ai_router
+from ai.metrics import render_metrics
 from routers.admin_laws import router as admin_laws_router
 from routers.cases_documents import router as cases_documents_router  # ✅ ДОБАВИЛИ
 
@@ -80,6 +82,19 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Гистограммы задержек конвейера ИИ в формате Prometheus
+    (этапы ConsultantCore, ветки поиска, запросы к GigaChat).
+    Sentry настроен без трейсинга, поэтому время смотрим здесь.
+    """
+    return PlainTextResponse(
+        render_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.get("/debug-sentry")
 async def debug_sentry():
     """
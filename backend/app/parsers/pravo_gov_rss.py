@@ -2,6 +2,12 @@ import requests
 import xml.etree.ElementTree as ET
 from typing import List, Dict, Any, Optional, Tuple
 
+from app.services.http_validators import (
+    Validators,
+    is_unchanged,
+    load_validators,
+    save_validators,
+)
 from app.services.laws_common import (
     get_or_create_legal_act,
     save_document_chunk,
@@ -13,10 +19,34 @@ def fetch_rss(url: str) -> List[Dict[str, str]]:
     Загружает RSS-ленту и возвращает список элементов:
     {title, link, pub_date}
     """
-    resp = requests.get(url, timeout=10)
+    items, _ = fetch_rss_conditional(url)
+    return items or []
+
+
+def fetch_rss_conditional(
+    url: str,
+    stored: Optional[Validators] = None,
+) -> Tuple[Optional[List[Dict[str, str]]], Validators]:
+    """
+    Условная загрузка ленты: (элементы, валидаторы ответа).
+    Элементы None, если лента не изменилась с загрузки stored
+    (ответ 304 или тот же хэш тела) — тогда она не разбирается.
+    """
+    headers = stored.request_headers() if stored is not None else {}
+    resp = requests.get(url, timeout=10, headers=headers)
+    if resp.status_code == 304 and stored is not None:
+        return None, stored
     resp.raise_for_status()
 
-    root = ET.fromstring(resp.text)
+    fresh = Validators.from_response(resp.headers, resp.content)
+    if is_unchanged(stored, fresh):
+        return None, fresh
+
+    return _parse_items(resp.text), fresh
+
+
+def _parse_items(body: str) -> List[Dict[str, str]]:
+    root = ET.fromstring(body)
 
     items: List[Dict[str, str]] = []
     for item in root.findall(".//item"):
@@ -58,13 +88,20 @@ def process_rss_source(db, source: Dict[str, Any]) -> Tuple[Dict[str, int], Opti
 
     print(f"[pravo_gov_rss] Fetching RSS for source {name} -> {url}")
 
+    stored = load_validators(db, [url]).get(url)
     try:
-        items = fetch_rss(url)
+        items, validators = fetch_rss_conditional(url, stored)
     except Exception as e:
         msg = f"Failed to fetch RSS for {name}: {e}"
         print(f"[pravo_gov_rss] {msg}")
         return stats, msg
 
+    if items is None:
+        print(f"[pravo_gov_rss] {name}: not modified since last run")
+        if validators != stored:
+            save_validators(db, url, validators)
+        return stats, None
+
     stats["total"] = len(items)
     print(f"[pravo_gov_rss] {name}: received {stats['total']} items")
 
@@ -126,5 +163,10 @@ def process_rss_source(db, source: Dict[str, Any]) -> Tuple[Dict[str, int], Opti
             stats["failed"] += 1
             continue
 
+    # Валидаторы запоминаем, только если вся лента обработана: иначе
+    # упавшие элементы не повторятся, пока лента не изменится.
+    if stats["failed"] == 0:
+        save_validators(db, url, validators)
+
     # Если всё прошло без глобальной ошибки — error_message = None
     return stats, None
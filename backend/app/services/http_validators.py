@@ -0,0 +1,116 @@
+"""
+HTTP-валидаторы лент законов для условной загрузки.
+
+Для каждого URL ленты в таблице http_validators хранятся ETag,
+Last-Modified и sha256 тела последнего успешно обработанного ответа.
+Следующий запрос уходит с If-None-Match / If-Modified-Since; если сервер
+ответил 304 или тело не изменилось (хэш совпал), лента не разбирается
+и в базу ничего не пишется.
+
+Валидаторы сохраняются только ПОСЛЕ успешной записи элементов ленты:
+иначе сбой записи «спрятал» бы новые акты до следующего изменения ленты.
+
+SQL общий для sqlite3 (app/parsers/pravo_gov_rss.py) и SQLAlchemy
+(app/laws/sync.py): параметры в виде :name понимают оба.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Mapping, Optional
+
+VALIDATORS_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS http_validators ("
+    "url TEXT PRIMARY KEY, "
+    "etag TEXT, "
+    "last_modified TEXT, "
+    "content_hash TEXT, "
+    "updated_at TEXT NOT NULL)"
+)
+VALIDATORS_SELECT_SQL = "SELECT url, etag, last_modified, content_hash FROM http_validators"
+VALIDATORS_UPSERT_SQL = (
+    "INSERT INTO http_validators (url, etag, last_modified, content_hash, updated_at) "
+    "VALUES (:url, :etag, :last_modified, :content_hash, :updated_at) "
+    "ON CONFLICT(url) DO UPDATE SET "
+    "etag = excluded.etag, "
+    "last_modified = excluded.last_modified, "
+    "content_hash = excluded.content_hash, "
+    "updated_at = excluded.updated_at"
+)
+
+
+def body_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+@dataclass(frozen=True)
+class Validators:
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+    def request_headers(self) -> Dict[str, str]:
+        """Заголовки условного GET."""
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    @classmethod
+    def from_response(cls, headers: Mapping[str, str], body: bytes) -> "Validators":
+        """Валидаторы из ответа 200 (заголовки requests / httpx)."""
+        return cls(
+            etag=headers.get("ETag") or None,
+            last_modified=headers.get("Last-Modified") or None,
+            content_hash=body_hash(body),
+        )
+
+    def params(self, url: str) -> Dict[str, Optional[str]]:
+        return {
+            "url": url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_hash": self.content_hash,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+
+
+def is_unchanged(stored: Optional[Validators], fresh: Validators) -> bool:
+    """Тело ответа 200 совпадает с уже обработанным."""
+    return (
+        stored is not None
+        and stored.content_hash is not None
+        and stored.content_hash == fresh.content_hash
+    )
+
+
+def rows_to_validators(rows: Iterable, urls: Iterable[str]) -> Dict[str, Validators]:
+    wanted = set(urls)
+    return {
+        row[0]: Validators(etag=row[1], last_modified=row[2], content_hash=row[3])
+        for row in rows
+        if row[0] in wanted
+    }
+
+
+def load_validators(conn: sqlite3.Connection, urls: Iterable[str]) -> Dict[str, Validators]:
+    """Сохранённые валидаторы для urls (sqlite3)."""
+    conn.execute(VALIDATORS_TABLE_SQL)
+    return rows_to_validators(conn.execute(VALIDATORS_SELECT_SQL).fetchall(), urls)
+
+
+def save_validators(
+    conn: sqlite3.Connection,
+    url: str,
+    validators: Validators,
+    commit: bool = True,
+) -> None:
+    conn.execute(VALIDATORS_TABLE_SQL)
+    conn.execute(VALIDATORS_UPSERT_SQL, validators.params(url))
+    if commit:
+        conn.commit()
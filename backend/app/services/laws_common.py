@@ -2,6 +2,9 @@ import sqlite3
 from datetime import datetime
 from typing import Optional
 
+from ai.rag.cache import bump_generation
+from ai.rag.ingest import html_to_text, index_document_passages, lemmatize_text
+
 
 def _get_row_id(row) -> int:
     """
@@ -74,7 +77,13 @@ def save_document_chunk(
     """
     Сохраняет текст закона в отдельную таблицу law_documents.
     НЕ трогаем таблицу documents, чтобы не зависеть от user_id и прочего.
+
+    Вместе с HTML один раз сохраняются нормализованный текст content_text
+    и его леммы content_lemmas, а для нового документа сразу строятся
+    фрагменты law_passages (схема RAG должна быть создана заранее: ai.rag.ingest.ensure_tables).
     """
+    plain_text = html_to_text(text)
+    lemmas = lemmatize_text(plain_text)
 
     # Пытаемся вставить, избегая дублей по external_id
     cur = db.execute(
@@ -84,9 +93,11 @@ def save_document_chunk(
             source_id,
             external_id,
             chunk_index,
-            content_html
+            content_html,
+            content_text,
+            content_lemmas
         )
-        VALUES (?, ?, ?, ?, ?)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
         """,
         (
             act_id,
@@ -94,6 +105,8 @@ def save_document_chunk(
             external_id,
             chunk_index,
             text,
+            plain_text,
+            lemmas,
         ),
     )
     db.commit()
@@ -107,5 +120,10 @@ def save_document_chunk(
         return _get_row_id(row)
 
     new_id_row = db.execute("SELECT last_insert_rowid()").fetchone()
-    return _get_row_id(new_id_row)
+    doc_id = _get_row_id(new_id_row)
+
+    index_document_passages(db, doc_id, plain_text)
+    # сбрасываем кэш результатов поиска во всех воркерах backend
+    bump_generation(db)
+    return doc_id
 
@@ -0,0 +1,103 @@
+"""
+High-water mark лент законов для инкрементальной синхронизации.
+
+Для каждой ленты (ключ — её базовый URL) в таблице law_sync_marks, рядом
+с law_sources, хранится самый свежий уже записанный акт: его pubDate
+и guid. Ленты отдают элементы от новых к старым, поэтому при следующем
+запуске разбор останавливается на первом известном элементе — guid
+совпал или pubDate старше отметки. Если вся страница оказалась новой
+(разрыв между отметкой и лентой), app/laws/sync.py листает дальше.
+
+Отметка двигается только после успешной записи элементов, как и
+валидаторы HTTP (app/services/http_validators.py). SQL общий для sqlite3
+и SQLAlchemy.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+MARKS_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS law_sync_marks ("
+    "feed_url TEXT PRIMARY KEY, "
+    "source TEXT, "
+    "last_published TEXT, "
+    "last_guid TEXT, "
+    "updated_at TEXT NOT NULL)"
+)
+MARKS_SELECT_SQL = "SELECT feed_url, last_published, last_guid FROM law_sync_marks"
+MARKS_UPSERT_SQL = (
+    "INSERT INTO law_sync_marks (feed_url, source, last_published, last_guid, updated_at) "
+    "VALUES (:feed_url, :source, :last_published, :last_guid, :updated_at) "
+    "ON CONFLICT(feed_url) DO UPDATE SET "
+    "source = excluded.source, "
+    "last_published = excluded.last_published, "
+    "last_guid = excluded.last_guid, "
+    "updated_at = excluded.updated_at"
+)
+
+Item = Dict[str, object]
+
+
+@dataclass(frozen=True)
+class HighWaterMark:
+    published: Optional[datetime] = None
+    guid: Optional[str] = None
+
+    def is_known(self, item: Item) -> bool:
+        """Элемент уже был записан (или старше записанных)."""
+        if self.guid is not None and item.get("external_id") == self.guid:
+            return True
+        published = item.get("date_published")
+        return (
+            self.published is not None
+            and isinstance(published, datetime)
+            and published < self.published
+        )
+
+    def split(self, items: Sequence[Item]) -> Tuple[List[Item], bool]:
+        """
+        (новые элементы до первого известного, дошли ли до известного).
+        Порядок ленты — от новых к старым.
+        """
+        for i, item in enumerate(items):
+            if self.is_known(item):
+                return list(items[:i]), True
+        return list(items), False
+
+    def advance(self, items: Sequence[Item]) -> "HighWaterMark":
+        """Отметка после записи items: самый свежий по pubDate элемент."""
+        dated = [item for item in items if isinstance(item.get("date_published"), datetime)]
+        if dated:
+            newest = max(dated, key=lambda item: item["date_published"])
+            published = newest["date_published"]
+            if self.published is not None and published < self.published:
+                return self
+            return HighWaterMark(published=published, guid=str(newest["external_id"]))
+        if items:
+            # лента без pubDate: отметка — первый (самый новый) guid
+            return HighWaterMark(published=self.published, guid=str(items[0]["external_id"]))
+        return self
+
+    def params(self, feed_url: str, source: str) -> Dict[str, Optional[str]]:
+        return {
+            "feed_url": feed_url,
+            "source": source,
+            "last_published": self.published.isoformat() if self.published else None,
+            "last_guid": self.guid,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+
+
+def rows_to_marks(rows: Iterable, urls: Iterable[str]) -> Dict[str, HighWaterMark]:
+    wanted = set(urls)
+    return {
+        row[0]: HighWaterMark(
+            published=datetime.fromisoformat(row[1]) if row[1] else None,
+            guid=row[2],
+        )
+        for row in rows
+        if row[0] in wanted
+    }
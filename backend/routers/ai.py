@@ -1,12 +1,16 @@
 from typing import Optional, List, Tuple
+import asyncio
+import json
 import logging
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, HttpUrl
 
 # Ядро ИИ-юриста Татьяны (по структуре проекта оно лежит в backend/ai/core.py)
 from ai.core import ConsultantCore
 from ai.nlp.rubert_intent import classify_intent
+from ai.answer_stream import AnswerStreamParser
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +20,8 @@ router = APIRouter(
 )
 
 MAX_QUESTION_LEN = 4000
+# Сколько вопросов можно прислать в одном /ai/ask/batch
+MAX_BATCH_QUESTIONS = 500
 
 # Инициализируем ядро Татьяны один раз.
 # Внутри ConsultantCore — LocalGenerator, который сам решает:
@@ -24,6 +30,12 @@ MAX_QUESTION_LEN = 4000
 consultant_core = ConsultantCore()
 
 
+@router.on_event("shutdown")
+async def _close_ai_clients() -> None:
+    """Закрываем пул HTTP-соединений GigaChat при остановке воркера."""
+    await consultant_core.generator.aclose()
+
+
 def _unwrap_answer(answer: str) -> Tuple[str, Optional[str]]:
     """
     Убирает служебные маркеры этапа 2.8 из answer и, если это EDIT-режим,
@@ -169,18 +181,20 @@ class AiResponse(BaseModel):
         ),
     )
 
+    debug: Optional[dict] = Field(
+        None,
+        description="Время этапов ядра (start_ms / ms по этапам, total_ms) для отладки",
+    )
 
-@router.post("/ask", response_model=AiResponse)
-async def ask_ai(payload: ChatRequest) -> AiResponse:
+
+def _prepare_request(payload: ChatRequest) -> Tuple[str, str, Optional[str], Optional[dict]]:
     """
-    Главный эндпоинт чата Татьяны.
+    Общая подготовка запроса для /ask и /ask/stream:
+    проверка текста, intent (принудительный от фронта или RuBERT / fallback
+    по исходному вопросу), вложения и правила работы с ними. Ядро получает
+    готовый intent и второй раз намерение не определяет.
 
-    Это тонкий слой над ConsultantCore:
-    - принимает текст вопроса;
-    - проверяет, что текст не пустой и не слишком длинный;
-    - определяет intent (RuBERT / fallback);
-    - передаёт запрос в ядро;
-    - возвращает структурированный ответ для фронтенда.
+    Возвращает (text, question, core_intent, core_context).
     """
     text = payload.normalized_text()
     if not text:
@@ -189,24 +203,22 @@ async def ask_ai(payload: ChatRequest) -> AiResponse:
     # Защита от слишком длинных запросов — не даём «убить» бэкенд
     if len(text) > MAX_QUESTION_LEN:
         text = text[:MAX_QUESTION_LEN]
-
-    # --- NLP слой (RuBERT / fallback) ---
-    nlp_info = classify_intent(text)
-    logger.info(
-        "NLP intent=%s confidence=%.2f engine=%s",
-        nlp_info.get("intent"),
-        nlp_info.get("confidence", 0.0),
-        nlp_info.get("engine"),
-    )
+    question = text
 
     # Приоритет intent:
     # 1) принудительный от фронта
-    # 2) RuBERT
+    # 2) RuBERT / fallback по вопросу (без вложений и служебных правил)
     forced_intent = (payload.intent or "").strip() or None
-    core_intent = (
-        forced_intent
-        or (nlp_info.get("intent") if isinstance(nlp_info, dict) else None)
-    )
+    core_intent = forced_intent
+    if core_intent is None:
+        nlp_info = classify_intent(question)
+        logger.info(
+            "NLP intent=%s confidence=%.2f engine=%s",
+            nlp_info.get("intent"),
+            nlp_info.get("confidence", 0.0),
+            nlp_info.get("engine"),
+        )
+        core_intent = nlp_info.get("intent") if isinstance(nlp_info, dict) else None
 
     core_context = (
         payload.context if isinstance(payload.context, dict) else None
@@ -237,7 +249,7 @@ async def ask_ai(payload: ChatRequest) -> AiResponse:
                     if extracted:
                         attachments_text += f"=== ВЛОЖЕНИЕ #{i}: {att_name} ===\n{extracted}\n\n"
                     else:
-                        attachments_text += f"=== ВЛОЖЕНИЕ #{i}: {att_name} (НЕ ИСПОЛЬЗОВАНО) ===\nПричина: {st.get("reason")}\nКак исправить: {st.get("how_to_fix")}\n\n"
+                        attachments_text += f"=== ВЛОЖЕНИЕ #{i}: {att_name} (НЕ ИСПОЛЬЗОВАНО) ===\nПричина: {st.get('reason')}\nКак исправить: {st.get('how_to_fix')}\n\n"
             except Exception as _e:
                 pass
     if attachments_text.strip():
@@ -245,27 +257,31 @@ async def ask_ai(payload: ChatRequest) -> AiResponse:
 
     text = ATTACHMENTS_RULES + "\n" + text
 
-    try:
-        # Вызов ядра Татьяны
-        core_result = await consultant_core.ask(
-            text,
-            intent=core_intent,
-            context=core_context,
-        )
-    except ValueError as exc:
-        # Ядро может вернуть ValueError для пустых/некорректных запросов
-        raise HTTPException(status_code=400, detail=str(exc))
-    except Exception as exc:
-        # Логируем внутрь, но не раскрываем детали наружу — безопасность
-        logger.exception("Ошибка при обработке запроса Татьяной: %s", exc)
-        raise HTTPException(
-            status_code=500,
-            detail=(
-                "Сервис ИИ-консультанта Татьяны временно недоступен. "
-                "Повторите попытку позже."
-            ),
-        )
+    return text, question, core_intent, core_context
 
+
+def _to_citations(raw_citations) -> List[Citation]:
+    """Цитаты законов из ядра: аккуратно приводим к нашей Pydantic-модели."""
+    citations: List[Citation] = []
+    if isinstance(raw_citations, list):
+        for item in raw_citations:
+            if not isinstance(item, dict):
+                continue
+            cid = str(item.get("id") or "").strip()
+            if not cid:
+                continue
+            citations.append(
+                Citation(
+                    id=cid,
+                    title=item.get("title"),
+                    url=item.get("url"),
+                )
+            )
+    return citations
+
+
+def _build_ai_response(core_result, text: str) -> AiResponse:
+    """Результат ядра -> AiResponse (чистый текст в чат, черновик в редактор)."""
     # Если ядро вернуло не словарь — спасаем ситуацию, приводим к строке
     if not isinstance(core_result, dict):
         answer_text = str(core_result)
@@ -284,6 +300,8 @@ async def ask_ai(payload: ChatRequest) -> AiResponse:
             "Попробуйте переформулировать вопрос."
         )
 
+    core_intent = core_result.get("intent")
+
     # ✅ Убираем мусор и вытаскиваем draft в редактор
     plain_answer, draft = _unwrap_answer(answer_text)
     # Fallback: если модель не вернула <<<DRAFT>>>, но запрос про создание документа — кладём текст в draft
@@ -305,26 +323,249 @@ async def ask_ai(payload: ChatRequest) -> AiResponse:
 
 
     # Цитаты законов: аккуратно приводим к нашей Pydantic-модели
-    raw_citations = core_result.get("citations") or []
-    citations: List[Citation] = []
-    if isinstance(raw_citations, list):
-        for item in raw_citations:
-            if not isinstance(item, dict):
-                continue
-            cid = str(item.get("id") or "").strip()
-            if not cid:
-                continue
-            citations.append(
-                Citation(
-                    id=cid,
-                    title=item.get("title"),
-                    url=item.get("url"),
-                )
-            )
+    citations = _to_citations(core_result.get("citations") or [])
 
     return AiResponse(
         answer=plain_answer,        # ✅ чистый текст в чат
         citations=citations,
         document_draft=draft,       # ✅ шаблон в редактор
+        debug=core_result.get("debug"),
     )
 
+
+@router.post("/ask", response_model=AiResponse)
+async def ask_ai(payload: ChatRequest) -> AiResponse:
+    """
+    Главный эндпоинт чата Татьяны.
+
+    Это тонкий слой над ConsultantCore:
+    - принимает текст вопроса;
+    - проверяет, что текст не пустой и не слишком длинный;
+    - определяет intent (RuBERT / fallback), если фронт его не задал;
+    - передаёт запрос в ядро;
+    - возвращает структурированный ответ для фронтенда.
+    """
+    text, question, core_intent, core_context = _prepare_request(payload)
+
+    try:
+        # Вызов ядра Татьяны
+        core_result = await consultant_core.ask(
+            text,
+            intent=core_intent,
+            context=core_context,
+            intent_text=question,
+        )
+    except ValueError as exc:
+        # Ядро может вернуть ValueError для пустых/некорректных запросов
+        raise HTTPException(status_code=400, detail=str(exc))
+    except Exception as exc:
+        # Логируем внутрь, но не раскрываем детали наружу — безопасность
+        logger.exception("Ошибка при обработке запроса Татьяной: %s", exc)
+        raise HTTPException(
+            status_code=500,
+            detail=(
+                "Сервис ИИ-консультанта Татьяны временно недоступен. "
+                "Повторите попытку позже."
+            ),
+        )
+
+    logger.info(
+        "AI intent=%s total_ms=%s",
+        core_result.get("intent") if isinstance(core_result, dict) else None,
+        (core_result.get("debug") or {}).get("total_ms") if isinstance(core_result, dict) else None,
+    )
+    return _build_ai_response(core_result, text)
+
+
+@router.post("/ask/stream")
+async def ask_ai_stream(payload: ChatRequest) -> StreamingResponse:
+    """
+    Потоковый вариант /ask (NDJSON: одно JSON-событие на строку).
+
+    События:
+      {"event": "citations", "citations": [...], "intent": ...} — сразу после поиска;
+      {"event": "answer", "text": ...} — очередной кусок текста для чата;
+      {"event": "draft", "text": ...} — очередной кусок черновика для редактора;
+      {"event": "done", "answer", "citations", "document_draft"} — итог, как ответ /ask;
+      {"event": "error", "detail": ..., "truncated": ...} — ошибка; уже показанный
+          текст надо убрать (truncated — ответ оборвался посреди генерации).
+    """
+    text, question, core_intent, core_context = _prepare_request(payload)
+
+    async def events():
+        parser = AnswerStreamParser()
+        try:
+            async for event in consultant_core.ask_stream(
+                text,
+                intent=core_intent,
+                context=core_context,
+                intent_text=question,
+            ):
+                kind = event.get("event")
+                if kind == "citations":
+                    yield _ndjson(
+                        {
+                            "event": "citations",
+                            "citations": [
+                                c.model_dump(mode="json")
+                                for c in _to_citations(event.get("citations"))
+                            ],
+                            "intent": event.get("intent"),
+                        }
+                    )
+                elif kind == "chunk":
+                    for channel, delta in parser.feed(event.get("text") or ""):
+                        yield _ndjson({"event": channel, "text": delta})
+                elif kind == "done":
+                    for channel, delta in parser.close():
+                        yield _ndjson({"event": channel, "text": delta})
+                    response = _build_ai_response(event, text)
+                    yield _ndjson({"event": "done", **response.model_dump(mode="json")})
+                elif kind == "error":
+                    yield _ndjson(
+                        {
+                            "event": "error",
+                            "detail": event.get("detail"),
+                            "truncated": bool(event.get("truncated")),
+                        }
+                    )
+        except ValueError as exc:
+            yield _ndjson({"event": "error", "detail": str(exc)})
+        except Exception as exc:
+            logger.exception("Ошибка при потоковой обработке запроса Татьяной: %s", exc)
+            yield _ndjson(
+                {
+                    "event": "error",
+                    "detail": (
+                        "Сервис ИИ-консультанта Татьяны временно недоступен. "
+                        "Повторите попытку позже."
+                    ),
+                }
+            )
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        # nginx не должен буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class AskBatchRequest(BaseModel):
+    """Пакет вопросов для /ai/ask/batch (ночной QA, массовый приём обращений)."""
+
+    questions: List[ChatRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_QUESTIONS,
+        description="Вопросы в формате /ai/ask; index в ответах — позиция в этом списке",
+    )
+
+
+@router.post("/ask/batch")
+async def ask_ai_batch(payload: AskBatchRequest) -> StreamingResponse:
+    """
+    Пакетный /ask (NDJSON, по мере готовности ответов, не по порядку).
+
+    События:
+      {"event": "result", "index": i, "answer", "citations", "document_draft", "debug"};
+      {"event": "error", "index": i, "detail": ...} — этот вопрос не обработан;
+      {"event": "done", "total": n, "errors": k} — пакет завершён.
+
+    Одинаковые вопросы обрабатываются один раз, поиск по всем вопросам
+    выполняется одним заданием, генерация — с ограниченной параллельностью.
+    """
+    def prepare_all() -> Tuple[List[Tuple[int, str, dict]], List[Tuple[int, str]]]:
+        prepared: List[Tuple[int, str, dict]] = []
+        invalid: List[Tuple[int, str]] = []
+        for index, question in enumerate(payload.questions):
+            try:
+                text, intent_text, core_intent, core_context = _prepare_request(question)
+            except HTTPException as exc:
+                invalid.append((index, str(exc.detail)))
+                continue
+            prepared.append(
+                (
+                    index,
+                    text,
+                    {
+                        "query": text,
+                        "intent": core_intent,
+                        "context": core_context,
+                        "intent_text": intent_text,
+                    },
+                )
+            )
+        return prepared, invalid
+
+    async def events():
+        # classify_intent (RuBERT) — синхронный; до 500 вопросов
+        # классифицируются в потоке, а не в event loop.
+        prepared, invalid = await asyncio.to_thread(prepare_all)
+        errors = 0
+        for index, detail in invalid:
+            errors += 1
+            yield _ndjson({"event": "error", "index": index, "detail": detail})
+        try:
+            async for n, result in consultant_core.ask_many([spec for _, _, spec in prepared]):
+                index, text, _ = prepared[n]
+                if isinstance(result, ValueError):
+                    errors += 1
+                    yield _ndjson({"event": "error", "index": index, "detail": str(result)})
+                elif isinstance(result, Exception):
+                    errors += 1
+                    logger.error("Ошибка в пакете вопросов (#%s): %s", index, result)
+                    yield _ndjson(
+                        {
+                            "event": "error",
+                            "index": index,
+                            "detail": "Не удалось обработать вопрос. Повторите попытку позже.",
+                        }
+                    )
+                else:
+                    response = _build_ai_response(result, text)
+                    yield _ndjson(
+                        {"event": "result", "index": index, **response.model_dump(mode="json")}
+                    )
+        except Exception as exc:
+            logger.exception("Ошибка при обработке пакета вопросов: %s", exc)
+            yield _ndjson(
+                {
+                    "event": "error",
+                    "detail": (
+                        "Сервис ИИ-консультанта Татьяны временно недоступен. "
+                        "Повторите попытку позже."
+                    ),
+                }
+            )
+            return
+        yield _ndjson({"event": "done", "total": len(payload.questions), "errors": errors})
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+@router.get("/retriever/stats")
+def retriever_stats() -> dict:
+    """
+    Служебная статистика RAG-ретривера: пул соединений SQLite,
+    кэш результатов поиска (hits / misses / hit_rate), среднее время
+    этапов нормализации запроса и ранжирования, очередь пула потоков поиска,
+    кэш готовых ответов (попадания и сэкономленное время генерации).
+    Используется для мониторинга, в UI не выводится.
+    """
+    return {
+        "pool": consultant_core.retriever.pool_stats(),
+        "cache": consultant_core.retriever.cache_stats(),
+        "normalizer": consultant_core.retriever.normalizer_stats(),
+        "ranker": consultant_core.ranker.stats(),
+        "executor": consultant_core.retriever.executor_stats(),
+        "answer_cache": consultant_core.answer_cache.stats(),
+    }
@@ -0,0 +1,22 @@
+-- Точный индекс ссылок на нормы: (кодекс, статья, часть, пункт) -> фрагмент.
+-- Заполняется на этапе ingest (ai/rag/ingest.py) вместе с law_passages.
+-- Отсутствующие часть / пункт хранятся как '' (равенство работает без IS NULL).
+-- Ретривер разрешает запросы вида «ч. 1 ст. 333 ГК» по этому индексу
+-- до полнотекстового поиска.
+
+CREATE TABLE IF NOT EXISTS law_article_index (
+    code TEXT NOT NULL,
+    article TEXT NOT NULL,
+    part TEXT NOT NULL DEFAULT '',
+    point TEXT NOT NULL DEFAULT '',
+    passage_id INTEGER NOT NULL,
+    document_id INTEGER NOT NULL,
+    FOREIGN KEY (passage_id) REFERENCES law_passages(id),
+    FOREIGN KEY (document_id) REFERENCES law_documents(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_law_article_index_ref
+    ON law_article_index(code, article, part, point, document_id);
+
+CREATE INDEX IF NOT EXISTS idx_law_article_index_document_id
+    ON law_article_index(document_id);
@@ -0,0 +1,27 @@
+-- Plain-text версия law_documents для поиска.
+-- Колонка content_text добавляется в ai/rag/ingest.py::ensure_schema
+-- (ALTER TABLE ADD COLUMN в SQLite не идемпотентен):
+--   ALTER TABLE law_documents ADD COLUMN content_text TEXT;
+-- Текст нормализуется один раз при записи: теги убраны, сущности
+-- раскодированы, ё -> е, пробелы схлопнуты (переносы строк сохраняются).
+
+CREATE VIRTUAL TABLE IF NOT EXISTS law_documents_text_fts USING fts5(
+    content_text,
+    content='law_documents',
+    content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS law_documents_text_ai AFTER INSERT ON law_documents BEGIN
+    INSERT INTO law_documents_text_fts(rowid, content_text) VALUES (new.id, new.content_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_documents_text_ad AFTER DELETE ON law_documents BEGIN
+    INSERT INTO law_documents_text_fts(law_documents_text_fts, rowid, content_text)
+    VALUES ('delete', old.id, old.content_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_documents_text_au AFTER UPDATE OF content_text ON law_documents BEGIN
+    INSERT INTO law_documents_text_fts(law_documents_text_fts, rowid, content_text)
+    VALUES ('delete', old.id, old.content_text);
+    INSERT INTO law_documents_text_fts(rowid, content_text) VALUES (new.id, new.content_text);
+END;
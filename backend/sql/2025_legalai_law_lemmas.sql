@@ -0,0 +1,48 @@
+-- Лемматизированные FTS5-индексы для RAG.
+-- Колонки с леммами добавляются в ai/rag/ingest.py::ensure_schema:
+--   ALTER TABLE law_documents ADD COLUMN content_lemmas TEXT;
+--   ALTER TABLE law_passages ADD COLUMN lemmas TEXT;
+-- Леммы считаются при ingest тем же lemmatize_tokens (pymorphy2), что и
+-- для запроса, поэтому «неустойки» в запросе находит «неустойкой» в законе.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS law_documents_lemma_fts USING fts5(
+    content_lemmas,
+    content='law_documents',
+    content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS law_documents_lemma_ai AFTER INSERT ON law_documents BEGIN
+    INSERT INTO law_documents_lemma_fts(rowid, content_lemmas) VALUES (new.id, new.content_lemmas);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_documents_lemma_ad AFTER DELETE ON law_documents BEGIN
+    INSERT INTO law_documents_lemma_fts(law_documents_lemma_fts, rowid, content_lemmas)
+    VALUES ('delete', old.id, old.content_lemmas);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_documents_lemma_au AFTER UPDATE OF content_lemmas ON law_documents BEGIN
+    INSERT INTO law_documents_lemma_fts(law_documents_lemma_fts, rowid, content_lemmas)
+    VALUES ('delete', old.id, old.content_lemmas);
+    INSERT INTO law_documents_lemma_fts(rowid, content_lemmas) VALUES (new.id, new.content_lemmas);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS law_passages_lemma_fts USING fts5(
+    lemmas,
+    content='law_passages',
+    content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS law_passages_lemma_ai AFTER INSERT ON law_passages BEGIN
+    INSERT INTO law_passages_lemma_fts(rowid, lemmas) VALUES (new.id, new.lemmas);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_passages_lemma_ad AFTER DELETE ON law_passages BEGIN
+    INSERT INTO law_passages_lemma_fts(law_passages_lemma_fts, rowid, lemmas)
+    VALUES ('delete', old.id, old.lemmas);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_passages_lemma_au AFTER UPDATE OF lemmas ON law_passages BEGIN
+    INSERT INTO law_passages_lemma_fts(law_passages_lemma_fts, rowid, lemmas)
+    VALUES ('delete', old.id, old.lemmas);
+    INSERT INTO law_passages_lemma_fts(rowid, lemmas) VALUES (new.id, new.lemmas);
+END;
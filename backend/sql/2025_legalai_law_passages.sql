@@ -0,0 +1,42 @@
+-- Фрагменты (passages) законов уровня статья / часть / пункт.
+-- Заполняются на этапе ingest (ai/rag/ingest.py) и tasks/reindex_laws.py.
+-- Смещения start_offset / end_offset — позиции в plain-text версии документа.
+
+CREATE TABLE IF NOT EXISTS law_passages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_id INTEGER NOT NULL,
+    passage_index INTEGER NOT NULL,
+    article TEXT,
+    part TEXT,
+    point TEXT,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    FOREIGN KEY (document_id) REFERENCES law_documents(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_law_passages_document_id
+    ON law_passages(document_id);
+
+-- Полнотекстовый индекс по фрагментам (external content)
+CREATE VIRTUAL TABLE IF NOT EXISTS law_passages_fts USING fts5(
+    text,
+    content='law_passages',
+    content_rowid='id'
+);
+
+-- Триггеры синхронизации FTS с таблицей law_passages
+CREATE TRIGGER IF NOT EXISTS law_passages_ai AFTER INSERT ON law_passages BEGIN
+    INSERT INTO law_passages_fts(rowid, text) VALUES (new.id, new.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_passages_ad AFTER DELETE ON law_passages BEGIN
+    INSERT INTO law_passages_fts(law_passages_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_passages_au AFTER UPDATE ON law_passages BEGIN
+    INSERT INTO law_passages_fts(law_passages_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+    INSERT INTO law_passages_fts(rowid, text) VALUES (new.id, new.text);
+END;
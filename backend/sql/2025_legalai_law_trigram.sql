@@ -0,0 +1,28 @@
+-- Триграммный индекс plain-text law_documents для запасного поиска.
+-- Когда обычный FTS (по словам / леммам) ничего не нашёл, ретривер ищет
+-- подстроки и слова с опечатками по этому индексу вместо полного
+-- сканирования content_html LIKE '%...%'. Токенизатор trigram есть
+-- в SQLite >= 3.34; регистр не учитывается (в том числе для кириллицы).
+-- Индекс занимает заметно больше места, чем словный FTS.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS law_documents_trigram_fts USING fts5(
+    content_text,
+    content='law_documents',
+    content_rowid='id',
+    tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS law_documents_trigram_ai AFTER INSERT ON law_documents BEGIN
+    INSERT INTO law_documents_trigram_fts(rowid, content_text) VALUES (new.id, new.content_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_documents_trigram_ad AFTER DELETE ON law_documents BEGIN
+    INSERT INTO law_documents_trigram_fts(law_documents_trigram_fts, rowid, content_text)
+    VALUES ('delete', old.id, old.content_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS law_documents_trigram_au AFTER UPDATE OF content_text ON law_documents BEGIN
+    INSERT INTO law_documents_trigram_fts(law_documents_trigram_fts, rowid, content_text)
+    VALUES ('delete', old.id, old.content_text);
+    INSERT INTO law_documents_trigram_fts(rowid, content_text) VALUES (new.id, new.content_text);
+END;
@@ -0,0 +1,444 @@
+"""
+Офлайн-бенчмарк RAG-поиска: качество и задержки на синтетической базе.
+
+Строит SQLite-базу law_documents заданного размера (статьи восьми
+кодексов со сгенерированными заголовками и текстом), вместе с ней —
+размеченный набор вопросов двух видов:
+
+  exact — явная ссылка «ст. 81 тк», правильный ответ — одна статья;
+  topic — вопрос по теме статьи в другой словоформе / с лишними словами,
+          правильные ответы — все статьи с таким заголовком.
+
+Затем прогоняет вопросы через DocumentRetriever.retrieve и
+ConsultantCore.check и печатает (и пишет в --out) JSON:
+p50 / p95 / p99 задержки, пропускную способность, recall@k и MRR
+по видам вопросов, а также сколько раз поиск ушёл в FTS, в LIKE-fallback
+и в точный индекс (по гистограмме legalai_rag_search_seconds).
+
+--baseline сравнивает результат с прошлым JSON и завершает процесс
+с кодом 1, если p95 вырос или recall упал сильнее --max-regression.
+
+Запуск:
+  cd /srv/legal-ai/backend
+  .venv/bin/python -m tasks.bench_rag --db /tmp/bench.db --size 100000 \\
+      --out bench.json [--baseline old.json] [--index full|html|none]
+
+Уровни индексации (--index):
+  full — reindex_laws: content_text, фрагменты, леммы, law_article_index;
+  html — только старый law_documents_fts по content_html;
+  none — без FTS, весь поиск через LIKE.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ai.core import ConsultantCore
+from ai.generators.local_gen import LocalGenerator
+from ai.metrics import RAG_SEARCH_SECONDS
+from ai.rag.cache import RetrievalCache
+from ai.rag.retriever import DocumentRetriever
+from tasks.reindex_laws import reindex_all
+
+# (ключ кодекса, сокращение в вопросе, название в тексте документа)
+CODES = (
+    ("гк", "гк", "Гражданский кодекс Российской Федерации"),
+    ("тк", "тк рф", "Трудовой кодекс Российской Федерации"),
+    ("нк", "нк", "Налоговый кодекс Российской Федерации"),
+    ("жк", "жк рф", "Жилищный кодекс Российской Федерации"),
+    ("ук", "ук рф", "Уголовный кодекс Российской Федерации"),
+    ("коап", "коап", "Кодекс Российской Федерации об административных правонарушениях"),
+    ("гпк", "гпк", "Гражданский процессуальный кодекс Российской Федерации"),
+    ("апк", "апк", "Арбитражный процессуальный кодекс Российской Федерации"),
+)
+
+# (именительный, родительный): заголовок в одной форме, вопрос — в другой.
+ACTIONS = (
+    ("расторжение", "расторжения"),
+    ("изменение", "изменения"),
+    ("заключение", "заключения"),
+    ("прекращение", "прекращения"),
+    ("исполнение", "исполнения"),
+    ("оспаривание", "оспаривания"),
+    ("уменьшение", "уменьшения"),
+    ("возмещение", "возмещения"),
+    ("взыскание", "взыскания"),
+    ("приостановление", "приостановления"),
+    ("продление", "продления"),
+    ("обжалование", "обжалования"),
+)
+OBJECTS = (
+    "трудового договора", "договора аренды", "неустойки", "алиментов",
+    "наследства", "налогового вычета", "штрафа", "ущерба",
+    "кредитного договора", "договора поставки", "права собственности",
+    "доверенности", "решения суда", "срока давности", "залога",
+    "поручительства", "дарения", "морального вреда", "заработной платы",
+    "отпуска", "сделки", "брака", "опеки", "лицензии", "пособия",
+)
+QUALIFIERS = (
+    "по инициативе работодателя", "в судебном порядке", "по соглашению сторон",
+    "в одностороннем порядке", "при банкротстве", "в пользу гражданина",
+    "по требованию кредитора", "в связи с нарушением условий",
+    "без согласия супруга", "до истечения срока",
+)
+# Префикс вопроса и нужная после него форма действия (0 — им., 1 — род.).
+QUESTION_PREFIXES = (
+    ("", 0),
+    ("как происходит ", 0),
+    ("порядок ", 1),
+    ("сроки ", 1),
+    ("возможно ли ", 0),
+    ("основания для ", 1),
+)
+BODY_SENTENCES = (
+    "Требование предъявляется в письменной форме с указанием оснований",
+    "Сторона вправе обратиться в суд в течение установленного срока",
+    "Порядок и сроки определяются соглашением сторон, если иное не предусмотрено законом",
+    "В случаях, предусмотренных статьей {ref} настоящего Кодекса, применяются особые правила",
+    "Уведомление направляется не позднее чем за тридцать дней",
+    "Расходы возмещаются за счет виновной стороны",
+    "Положения настоящей статьи не применяются к отношениям, указанным в статье {ref}",
+)
+
+INSERT_BATCH = 10_000
+
+
+def _title(index: int) -> str:
+    action = ACTIONS[index % len(ACTIONS)][0]
+    obj = OBJECTS[(index // len(ACTIONS)) % len(OBJECTS)]
+    qualifier = QUALIFIERS[(index // (len(ACTIONS) * len(OBJECTS))) % len(QUALIFIERS)]
+    return f"{action.capitalize()} {obj} {qualifier}"
+
+
+def _title_parts(index: int) -> Tuple[int, int, int]:
+    return (
+        index % len(ACTIONS),
+        (index // len(ACTIONS)) % len(OBJECTS),
+        (index // (len(ACTIONS) * len(OBJECTS))) % len(QUALIFIERS),
+    )
+
+
+def _document(rng: random.Random, code_name: str, article: int, title: str) -> str:
+    parts = [f"<p>{code_name}</p>", f"<p>Статья {article}. {title}</p>"]
+    for n in range(1, rng.randint(2, 4) + 1):
+        sentence = rng.choice(BODY_SENTENCES).format(ref=rng.randint(1, 500))
+        parts.append(f"<p>{n}. {sentence}.</p>")
+    return "".join(parts)
+
+
+def build_corpus(
+    db_path: str,
+    size: int,
+    *,
+    index: str = "full",
+    queries: int = 500,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """
+    Создаёт базу с size статьями и таблицу bench_queries с размеченными
+    вопросами. Документ i — статья i // 8 + 1 кодекса i % 8, его заголовок
+    определяется i (одинаковые заголовки повторяются в разных кодексах).
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(
+        """
+        CREATE TABLE law_documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            act_id INTEGER,
+            source_id INTEGER,
+            external_id TEXT,
+            chunk_index INTEGER,
+            content_html TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+        CREATE TABLE bench_queries (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            query TEXT NOT NULL,
+            relevant TEXT NOT NULL
+        );
+        """
+    )
+
+    batch: List[Tuple[str, str]] = []
+    for i in range(size):
+        _, _, code_name = CODES[i % len(CODES)]
+        batch.append((f"bench-{i}", _document(rng, code_name, i // len(CODES) + 1, _title(i))))
+        if len(batch) >= INSERT_BATCH:
+            conn.executemany(
+                "INSERT INTO law_documents (external_id, chunk_index, content_html) VALUES (?, 0, ?)",
+                batch,
+            )
+            batch.clear()
+    if batch:
+        conn.executemany(
+            "INSERT INTO law_documents (external_id, chunk_index, content_html) VALUES (?, 0, ?)",
+            batch,
+        )
+
+    # Документы с одинаковым заголовком — все правильные ответы на topic-вопрос.
+    title_period = len(ACTIONS) * len(OBJECTS) * len(QUALIFIERS)
+    rows = []
+    for n in range(queries):
+        i = rng.randrange(size)
+        doc_id = i + 1
+        if n % 2 == 0:
+            _, abbr, _ = CODES[i % len(CODES)]
+            rows.append((n, "exact", f"ст. {i // len(CODES) + 1} {abbr}", [doc_id]))
+        else:
+            action, obj, qualifier = _title_parts(i)
+            prefix, form = rng.choice(QUESTION_PREFIXES)
+            query = f"{prefix}{ACTIONS[action][form]} {OBJECTS[obj]} {QUALIFIERS[qualifier]}"
+            relevant = list(range(i % title_period + 1, size + 1, title_period))
+            rows.append((n, "topic", query, relevant))
+    conn.executemany(
+        "INSERT INTO bench_queries (id, kind, query, relevant) VALUES (?, ?, ?, ?)",
+        [(n, kind, query, json.dumps(relevant)) for n, kind, query, relevant in rows],
+    )
+    conn.commit()
+
+    if index == "html":
+        conn.executescript(
+            """
+            CREATE VIRTUAL TABLE law_documents_fts USING fts5(
+                content_html, content='law_documents', content_rowid='id'
+            );
+            INSERT INTO law_documents_fts(law_documents_fts) VALUES ('rebuild');
+            """
+        )
+        conn.commit()
+    conn.close()
+
+    if index == "full":
+        reindex_all(db_path)
+
+    return {
+        "documents": size,
+        "index": index,
+        "queries": queries,
+        "seed": seed,
+        "build_s": round(time.perf_counter() - started, 2),
+        "db_mb": round(os.path.getsize(db_path) / 2**20, 1),
+    }
+
+
+def load_queries(db_path: str) -> List[Dict[str, Any]]:
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT kind, query, relevant FROM bench_queries ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    return [{"kind": kind, "query": query, "relevant": json.loads(relevant)} for kind, query, relevant in rows]
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[pos]
+
+
+def latency_summary(latencies_ms: Sequence[float], wall_s: float) -> Dict[str, float]:
+    return {
+        "p50_ms": round(_percentile(latencies_ms, 50), 3),
+        "p95_ms": round(_percentile(latencies_ms, 95), 3),
+        "p99_ms": round(_percentile(latencies_ms, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies_ms), 3) if latencies_ms else 0.0,
+        "qps": round(len(latencies_ms) / wall_s, 1) if wall_s > 0 else 0.0,
+    }
+
+
+def quality_summary(results: Sequence[Tuple[List[Any], List[int]]], k: int) -> Dict[str, float]:
+    """recall@k — доля вопросов с правильным ответом в top-k; MRR — по первому правильному."""
+    hits = 0
+    reciprocal = 0.0
+    for found, relevant in results:
+        relevant_set = set(relevant)
+        for rank, doc_id in enumerate(found[:k], start=1):
+            if doc_id in relevant_set:
+                hits += 1
+                reciprocal += 1.0 / rank
+                break
+    total = len(results) or 1
+    return {f"recall@{k}": round(hits / total, 4), "mrr": round(reciprocal / total, 4)}
+
+
+def _branch_counts() -> Dict[str, int]:
+    return {key[0]: count for key, count in RAG_SEARCH_SECONDS.counts().items()}
+
+
+def bench_retrieve(
+    retriever: DocumentRetriever,
+    queries: List[Dict[str, Any]],
+    *,
+    top_k: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    before = _branch_counts()
+
+    def run(item: Dict[str, Any]) -> Tuple[float, List[Any]]:
+        t0 = time.perf_counter()
+        docs = retriever.retrieve(item["query"], top_k=top_k)
+        return (time.perf_counter() - t0) * 1000, [doc_id for doc_id, _ in docs]
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            measured = list(pool.map(run, queries))
+    else:
+        measured = [run(item) for item in queries]
+    wall = time.perf_counter() - started
+
+    after = _branch_counts()
+    branches = {name: after.get(name, 0) - before.get(name, 0) for name in after}
+
+    report: Dict[str, Any] = latency_summary([ms for ms, _ in measured], wall)
+    report.update(quality_summary([(found, q["relevant"]) for (_, found), q in zip(measured, queries)], top_k))
+    report["by_kind"] = {}
+    for kind in sorted({q["kind"] for q in queries}):
+        subset = [(m, q) for m, q in zip(measured, queries) if q["kind"] == kind]
+        report["by_kind"][kind] = {
+            **latency_summary([ms for (ms, _), _ in subset], 0.0),
+            **quality_summary([(found, q["relevant"]) for (_, found), q in subset], top_k),
+        }
+        report["by_kind"][kind].pop("qps")
+    report["branches"] = branches
+    # Каждый поиск по документам сначала пробует FTS (ветка fts), trigram
+    # или LIKE выполняются только после промаха — доля таких откатов.
+    fts_attempts = branches.get("fts", 0)
+    for branch in ("trigram", "like"):
+        report[f"{branch}_fallback_rate"] = (
+            round(branches.get(branch, 0) / fts_attempts, 4) if fts_attempts else 0.0
+        )
+    return report
+
+
+def bench_check(
+    core: ConsultantCore,
+    queries: List[Dict[str, Any]],
+    *,
+    concurrency: int,
+) -> Dict[str, Any]:
+    async def run_all() -> Tuple[List[float], float]:
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(item: Dict[str, Any]) -> float:
+            async with semaphore:
+                t0 = time.perf_counter()
+                await core.check(item["query"])
+                return (time.perf_counter() - t0) * 1000
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one(item) for item in queries))
+        return list(latencies), time.perf_counter() - started
+
+    latencies, wall = asyncio.run(run_all())
+    return latency_summary(latencies, wall)
+
+
+def run_benchmark(
+    db_path: str,
+    *,
+    top_k: int = 8,
+    concurrency: int = 1,
+    mode: Optional[str] = None,
+    warmup: int = 20,
+) -> Dict[str, Any]:
+    """Прогон набора bench_queries по готовой базе."""
+    queries = load_queries(db_path)
+    # Кэш результатов выключен: меряем сам поиск, а не попадания в память.
+    retriever = DocumentRetriever(db_path=db_path, mode=mode, cache=RetrievalCache(maxsize=0))
+    for item in queries[:warmup]:
+        retriever.retrieve(item["query"], top_k=top_k)
+
+    core = ConsultantCore(retriever=retriever, generator=LocalGenerator(use_gigachat=False))
+    try:
+        return {
+            "mode": retriever.mode,
+            "top_k": top_k,
+            "concurrency": concurrency,
+            "retrieve": bench_retrieve(retriever, queries, top_k=top_k, concurrency=concurrency),
+            "check": bench_check(core, queries, concurrency=concurrency),
+        }
+    finally:
+        retriever.executor.shutdown()
+        retriever.pool.close_all()
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Регрессии относительно baseline: рост p95 и падение recall / MRR."""
+    problems: List[str] = []
+    for section in ("retrieve", "check"):
+        old = baseline.get(section, {}).get("p95_ms")
+        new = report.get(section, {}).get("p95_ms")
+        if old and new and new > old * (1 + max_regression):
+            problems.append(f"{section}.p95_ms: {old} -> {new}")
+    for metric in (f"recall@{report['top_k']}", "mrr"):
+        old = baseline.get("retrieve", {}).get(metric)
+        new = report["retrieve"].get(metric)
+        if old is not None and new is not None and new < old - max_regression * old:
+            problems.append(f"retrieve.{metric}: {old} -> {new}")
+    return problems
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк RAG-поиска на синтетической базе законов")
+    parser.add_argument("--db", default="/tmp/legalai_bench.db", help="путь к базе бенчмарка")
+    parser.add_argument("--size", type=int, default=10_000, help="число документов (10k–1M)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--index", choices=("full", "html", "none"), default="full")
+    parser.add_argument("--reuse", action="store_true", help="не пересоздавать базу, если она есть")
+    parser.add_argument("--mode", default=None, help="режим ретривера (documents / passages / ...)")
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="куда записать JSON-отчёт")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="допустимое ухудшение (доля)")
+    args = parser.parse_args(argv)
+
+    corpus: Dict[str, Any] = {"documents": None, "reused": True}
+    if not (args.reuse and os.path.exists(args.db)):
+        corpus = build_corpus(
+            args.db, args.size, index=args.index, queries=args.queries, seed=args.seed
+        )
+
+    report = {"corpus": corpus, **run_benchmark(
+        args.db, top_k=args.top_k, concurrency=args.concurrency, mode=args.mode
+    )}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            problems = compare(report, json.load(fh), args.max_regression)
+        for problem in problems:
+            print(f"[bench_rag] REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Построение dense-индекса (эмбеддинги RuBERT) для фрагментов law_passages.
+
+Индекс пишется в LEGALAI_RAG_DENSE_DIR (vectors.npy / ids.npy / meta.json)
+и используется ретривером в режиме LEGALAI_RAG_MODE=dense. Перед первым
+запуском нужны фрагменты: python -m tasks.reindex_laws.
+Воркеры подхватывают новый индекс после перезапуска backend.
+
+Запуск НА СЕРВЕРЕ (CPU, долго — запускать по cron ночью):
+  cd /srv/legal-ai/backend
+  .venv/bin/python -m tasks.build_dense_index [--dtype int8] [--batch-size 64]
+"""
+
+import argparse
+import sqlite3
+
+from ai.rag.dense import DENSE_INDEX_DIR, RuBERTEmbedder, build_dense_index
+from tasks.update_laws import DB_PATH
+
+
+def main() -> None:
+    """CLI-точка входа."""
+    parser = argparse.ArgumentParser(description="Построение dense-индекса фрагментов законов")
+    parser.add_argument("--db", default=DB_PATH, help="путь к SQLite-базе законов")
+    parser.add_argument("--out", default=DENSE_INDEX_DIR, help="каталог индекса")
+    parser.add_argument("--dtype", choices=("float16", "int8"), default="float16")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"[build_dense_index] Using DB: {args.db} -> {args.out} ({args.dtype})")
+    db = sqlite3.connect(args.db)
+    try:
+        count = build_dense_index(
+            db,
+            RuBERTEmbedder(),
+            args.out,
+            dtype=args.dtype,
+            batch_size=args.batch_size,
+        )
+    finally:
+        db.close()
+    print(f"[build_dense_index] Done: {count} passages.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Полная переиндексация базы законов для RAG.
+
+Пересчитывает law_documents.content_text / content_lemmas и фрагменты
+law_passages (с леммами и точным индексом law_article_index) для всех
+документов, затем полностью перестраивает FTS5-индексы, включая
+лемматизированные *_lemma_fts и триграммный law_documents_trigram_fts.
+Нужна после изменения правил нормализации / разбиения / лемматизации
+(например, после установки pymorphy2), при первом
+включении режима LEGALAI_RAG_MODE=passages и после миграции схемы.
+Перестроенные индексы отмечаются в rag_index_state (reindexed:<таблица>),
+и ретривер переключается на них после смены generation, без перезапуска
+backend. Пока идёт переиндексация, отметок нет и поиск работает по
+старому индексу law_documents_fts / LIKE-fallback.
+
+Запуск НА СЕРВЕРЕ:
+  cd /srv/legal-ai/backend
+  .venv/bin/python -m tasks.reindex_laws [--db PATH] [--batch-size N]
+"""
+
+import argparse
+import sqlite3
+
+from ai.rag.cache import bump_generation
+from ai.rag.ingest import drop_fts, ensure_schema, index_document, rebuild_fts
+from tasks.update_laws import DB_PATH
+
+BATCH_SIZE = 500
+
+
+def reindex_all(db_path: str = DB_PATH, batch_size: int = BATCH_SIZE) -> int:
+    """Переиндексирует все документы. Возвращает число фрагментов."""
+    print(f"[reindex_laws] Using DB: {db_path}")
+    db = sqlite3.connect(db_path)
+
+    try:
+        ensure_schema(db)
+        drop_fts(db)
+        # Воркеры перестают искать по удалённым индексам.
+        bump_generation(db)
+
+        last_id = 0
+        documents = 0
+        passages = 0
+        while True:
+            rows = db.execute(
+                """
+                SELECT id, content_html
+                FROM law_documents
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+
+            for doc_id, html in rows:
+                passages += index_document(db, doc_id, html or "", commit=False)
+            db.commit()
+
+            documents += len(rows)
+            last_id = rows[-1][0]
+            print(f"[reindex_laws] documents={documents} passages={passages}")
+
+        ensure_schema(db)
+        rebuild_fts(db)
+        bump_generation(db)
+    finally:
+        db.close()
+
+    print("[reindex_laws] Done.")
+    return passages
+
+
+def main() -> None:
+    """CLI-точка входа."""
+    parser = argparse.ArgumentParser(description="Переиндексация базы законов для RAG")
+    parser.add_argument("--db", default=DB_PATH, help="путь к SQLite-базе законов")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    reindex_all(args.db, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
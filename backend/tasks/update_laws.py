@@ -5,6 +5,7 @@ from datetime import datetime
 from typing import Dict, Any, Tuple, Optional
 
 from app.parsers.pravo_gov_rss import process_rss_source
+from ai.rag.ingest import ensure_tables
 
 
 DEFAULT_DB_PATH = "/srv/legal-ai/data/legalai.db"
@@ -86,6 +87,8 @@ def update_all_sources() -> None:
     print(f"[update_laws] Using DB: {DB_PATH}")
     db = sqlite3.connect(DB_PATH)
     db.row_factory = sqlite3.Row
+    # Только таблицы: FTS-индексы создаёт и заполняет tasks/reindex_laws.py.
+    ensure_tables(db)
 
     try:
         sources = db.execute(
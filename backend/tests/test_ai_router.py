@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import routers.ai as ai_router
+from ai.core import ConsultantCore
+from ai.generators.local_gen import LocalGenerator
+from ai.router_rubert import RuBERTIntentClassifier
+from routers.ai import ChatRequest
+
+
+class _Retriever:
+    class _Executor:
+        async def run(self, fn, *args):
+            return fn(*args)
+
+    executor = _Executor()
+
+    async def aretrieve(self, query, top_k=8):
+        return [(1, "Статья 81. Расторжение трудового договора по инициативе работодателя")]
+
+
+class _RecordingClassifier(RuBERTIntentClassifier):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def classify(self, text):
+        self.texts.append(text)
+        return super().classify(text)
+
+
+class _RecordingCore(ConsultantCore):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.results = []
+
+    async def ask(self, *args, **kwargs):
+        result = await super().ask(*args, **kwargs)
+        self.results.append(result)
+        return result
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Какие риски при увольнении по ст. 81 ТК?",
+        "Какой срок исковой давности?",
+        "Исключение из ЕГРЮЛ — что делать?",
+    ],
+)
+def test_consultation_questions_are_not_routed_to_template(question, monkeypatch):
+    """«иск» внутри слова не делает вопрос шаблоном: intent только из classify_intent."""
+    classifier = _RecordingClassifier()
+    core = _RecordingCore(
+        retriever=_Retriever(),
+        generator=LocalGenerator(use_gigachat=False),
+        intent_classifier=classifier,
+    )
+    monkeypatch.setattr(ai_router, "consultant_core", core)
+
+    _, _, intent, _ = ai_router._prepare_request(ChatRequest(message=question))
+    assert intent == "consultation"
+
+    response = asyncio.run(ai_router.ask_ai(ChatRequest(message=question)))
+
+    assert classifier.texts == []
+    assert core.results[0]["intent"] == "consultation"
+    assert core.results[0]["answer"].startswith("<<<MODE:ANSWER>>>")
+    assert response.document_draft is None
@@ -0,0 +1,194 @@
+import asyncio
+
+from ai.answer_stream import AnswerStreamParser
+from ai.core import ConsultantCore, wrap_ai_response
+from ai.generators.local_gen import LocalGenerator
+
+
+def _parse(text, size):
+    parser = AnswerStreamParser()
+    out = {"answer": "", "draft": ""}
+    for i in range(0, len(text), size):
+        for channel, delta in parser.feed(text[i:i + size]):
+            out[channel] += delta
+    for channel, delta in parser.close():
+        out[channel] += delta
+    return parser.mode, out
+
+
+def test_parser_splits_channels_for_any_chunking():
+    """Маркеры распознаются, даже если разрезаны между кусками."""
+    edit = wrap_ai_response("EDIT", "ДОГОВОР\n\n1. Предмет", comment="Проверьте реквизиты")
+    answer = wrap_ai_response("ANSWER", "Ответ <<< не маркер\n  со строками")
+    for size in (1, 2, 5, 1000):
+        assert _parse(edit, size) == (
+            "EDIT",
+            {"answer": "Проверьте реквизиты", "draft": "ДОГОВОР\n\n1. Предмет"},
+        )
+        assert _parse(answer, size) == (
+            "ANSWER",
+            {"answer": "Ответ <<< не маркер\n  со строками", "draft": ""},
+        )
+        assert _parse("Ответ без маркеров", size)[1]["answer"] == "Ответ без маркеров"
+
+
+class _Retriever:
+    class _Executor:
+        async def run(self, fn, *args):
+            return fn(*args)
+
+    executor = _Executor()
+
+    async def aretrieve(self, query, top_k=8):
+        return [(7, "Статья 333. Уменьшение неустойки")]
+
+
+class _StreamingGenerator(LocalGenerator):
+    async def generate_stream(self, query, context_docs=None, intent=None):
+        for word in ("Суд ", "может ", "снизить ", "неустойку."):
+            yield word
+
+
+def test_ask_stream_emits_citations_before_answer():
+    """Цитаты приходят до текста, поток собирается в тот же ответ, что и ask."""
+    core = ConsultantCore(
+        retriever=_Retriever(),
+        generator=_StreamingGenerator(use_gigachat=False),
+    )
+
+    async def collect():
+        return [e async for e in core.ask_stream("неустойка", intent="analysis")]
+
+    events = asyncio.run(collect())
+    kinds = [e["event"] for e in events]
+    assert kinds[0] == "citations" and kinds[-1] == "done"
+    assert [c["id"] for c in events[0]["citations"]] == ["7"]
+
+    streamed = "".join(e["text"] for e in events if e["event"] == "chunk")
+    assert streamed == events[-1]["answer"]
+    assert events[-1]["answer"] == wrap_ai_response("ANALYSIS", "Суд может снизить неустойку.")
+
+
+class _LeakingGenerator(LocalGenerator):
+    async def generate_stream(self, query, context_docs=None, intent=None):
+        for part in ("Суд может снизить неустойку. ", "Паспорт 45", "0612", "3456. ", "Конец."):
+            yield part
+
+
+def test_unsafe_text_is_not_streamed():
+    """Проверка безопасности идёт до отправки: число, разрезанное между кусками, не уходит клиенту."""
+    core = ConsultantCore(retriever=_Retriever(), generator=_LeakingGenerator(use_gigachat=False))
+
+    async def collect():
+        return [e async for e in core.ask_stream("неустойка", intent="analysis")]
+
+    events = asyncio.run(collect())
+    streamed = "".join(e["text"] for e in events if e["event"] == "chunk")
+    assert events[-1]["event"] == "error"
+    assert streamed == "<<<MODE:ANALYSIS>>>\nСуд может снизить неустойку."
+    assert "45" not in streamed
+
+
+class _BrokenGigaChat:
+    async def chat_stream(self, messages):
+        yield "Суд может снизить неустойку. "
+        yield "Но "
+        raise ConnectionError("stream reset")
+
+
+def test_interrupted_stream_is_reported_and_not_cached():
+    """Обрыв GigaChat посреди ответа — явная ошибка, обрывок не кэшируется."""
+    from ai.answer_cache import AnswerCache
+
+    generator = LocalGenerator(use_gigachat=False)
+    generator.gigachat = _BrokenGigaChat()
+    cache = AnswerCache(maxsize=8)
+    core = ConsultantCore(retriever=_Retriever(), generator=generator, answer_cache=cache)
+
+    async def collect():
+        return [e async for e in core.ask_stream("неустойка", intent="analysis")]
+
+    events = asyncio.run(collect())
+    assert [e["event"] for e in events] == ["citations", "chunk", "chunk", "error"]
+    assert events[2]["text"] == "Суд может снизить неустойку."
+    assert events[-1]["truncated"] is True
+    assert cache.stats()["size"] == 0
+
+
+class _CountingGenerator(LocalGenerator):
+    calls = 0
+
+    async def generate(self, query, documents=None, context_docs=None, intent=None):
+        self.calls += 1
+        return f"Ответ по {len(context_docs)} нормам"
+
+
+class _Embedder:
+    name = "stub"
+
+    def embed(self, texts):
+        import numpy as np
+
+        # «неустойка» и «пеня» — один и тот же вопрос, остальное — другой.
+        return np.array([[1.0, 0.0] if "неустойк" in t.lower() or "пен" in t.lower() else [0.0, 1.0] for t in texts])
+
+
+def test_answer_cache_exact_semantic_and_invalidation():
+    """Повтор вопроса не идёт в генератор; смена текста нормы сбрасывает запись."""
+    from ai.answer_cache import AnswerCache
+
+    retriever = _Retriever()
+    generator = _CountingGenerator(use_gigachat=False)
+    cache = AnswerCache(maxsize=8, embedder=_Embedder())
+    core = ConsultantCore(retriever=retriever, generator=generator, answer_cache=cache)
+
+    async def ask(query):
+        return (await core.ask(query, intent="analysis"))["answer"]
+
+    first = asyncio.run(ask("Неустойка по ГК"))
+    assert asyncio.run(ask("НЕУСТОЙКА  по гк рф")) == first
+    assert asyncio.run(ask("Можно ли снизить пеню?")) == first
+    assert generator.calls == 1
+
+    retriever.aretrieve = _changed_retrieve
+    asyncio.run(ask("Неустойка по ГК"))
+    assert generator.calls == 2
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["semantic_hits"], stats["invalidations"]) == (2, 1, 1)
+
+
+async def _changed_retrieve(query, top_k=8):
+    return [(7, "Статья 333. Уменьшение неустойки (в новой редакции)")]
+
+
+class _PrefixDominatedEmbedder(_Embedder):
+    """Как реальная модель: длинный общий префикс делает тексты «одинаковыми»."""
+
+    def embed(self, texts):
+        import numpy as np
+
+        if any("ВАЖНО!" in t for t in texts):
+            return np.array([[1.0, 0.0] for _ in texts])
+        return np.array([[0.0, 1.0] if "неустойк" in t.lower() or "пен" in t.lower() else [0.6, 0.8] for t in texts])
+
+
+def test_semantic_cache_embeds_only_the_question():
+    """Разные вопросы с общими служебными правилами не получают чужой ответ."""
+    from ai.answer_cache import AnswerCache
+
+    generator = _CountingGenerator(use_gigachat=False)
+    cache = AnswerCache(maxsize=8, embedder=_PrefixDominatedEmbedder())
+    core = ConsultantCore(retriever=_Retriever(), generator=generator, answer_cache=cache)
+    rules = "ВАЖНО! Если в запросе присутствует блок ТЕКСТ ВЛОЖЕНИЙ, используй его.\n\n"
+
+    async def ask(question):
+        return await core.ask(rules + question, intent="analysis", intent_text=question)
+
+    asyncio.run(ask("Неустойка по ГК"))
+    asyncio.run(ask("Как уволиться по собственному желанию?"))
+    assert generator.calls == 2
+
+    asyncio.run(ask("Можно ли снизить пеню?"))
+    assert generator.calls == 2
+    assert cache.stats()["semantic_hits"] == 1
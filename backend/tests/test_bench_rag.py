@@ -0,0 +1,20 @@
+from tasks.bench_rag import build_corpus, compare, run_benchmark
+
+
+def test_bench_rag_reports_latency_quality_and_branches(tmp_path):
+    """Маленький прогон бенчмарка: точные ссылки находятся, отчёт полный."""
+    db = str(tmp_path / "bench.db")
+    corpus = build_corpus(db, 400, index="full", queries=40)
+    assert corpus["documents"] == 400
+
+    report = run_benchmark(db, top_k=5, warmup=0)
+    retrieve = report["retrieve"]
+    assert retrieve["by_kind"]["exact"]["recall@5"] == 1.0
+    assert retrieve["branches"]["exact"] == 20
+    assert retrieve["like_fallback_rate"] == 0.0
+    assert {"p50_ms", "p95_ms", "p99_ms", "qps", "mrr"} <= set(retrieve)
+    assert report["check"]["qps"] > 0
+
+    worse = {**report, "retrieve": {**retrieve, "mrr": retrieve["mrr"] / 2}}
+    assert compare(worse, report, 0.1) == [f"retrieve.mrr: {retrieve['mrr']} -> {retrieve['mrr'] / 2}"]
+    assert compare(report, report, 0.1) == []
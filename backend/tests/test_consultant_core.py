@@ -0,0 +1,150 @@
+import asyncio
+
+from ai.core import ConsultantCore
+from ai.generators.local_gen import LocalGenerator
+from ai.rag.ranker import DocumentRanker
+from ai.router_rubert import RuBERTIntentClassifier
+
+
+class _SlowRetriever:
+    class _Executor:
+        async def run(self, fn, *args):
+            return fn(*args)
+
+    executor = _Executor()
+
+    async def aretrieve(self, query, top_k=8):
+        await asyncio.sleep(0.05)
+        return [(1, "Статья 81. Расторжение трудового договора")]
+
+
+class _RecordingClassifier(RuBERTIntentClassifier):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def classify(self, text):
+        self.texts.append(text)
+        return super().classify(text)
+
+
+class _RecordingRanker(DocumentRanker):
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def rank(self, query, documents):
+        self.queries.append(query)
+        return super().rank(query, documents)
+
+
+def test_ask_runs_intent_alongside_retrieval_and_reports_stages():
+    """Намерение и ранжирование — по вопросу; намерение считается, пока идёт поиск."""
+    classifier = _RecordingClassifier()
+    ranker = _RecordingRanker()
+    core = ConsultantCore(
+        retriever=_SlowRetriever(),
+        generator=LocalGenerator(use_gigachat=False),
+        intent_classifier=classifier,
+        ranker=ranker,
+    )
+
+    result = asyncio.run(
+        core.ask(
+            "ВАЖНО! Проанализируй договор во вложении.\nКакие последствия увольнения?",
+            intent_text="Какие последствия увольнения?",
+        )
+    )
+
+    assert classifier.texts == ["Какие последствия увольнения?"]
+    assert ranker.queries == ["Какие последствия увольнения?"]
+    assert result["intent"] == "risk_check"
+
+    stages = result["debug"]["stages"]
+    assert set(stages) == {
+        "retrieve", "intent", "rank", "citations", "law_guard", "generate", "safety", "risk",
+    }
+    retrieve_done = stages["retrieve"]["start_ms"] + stages["retrieve"]["ms"]
+    assert stages["intent"]["start_ms"] < retrieve_done
+    assert stages["retrieve"]["ms"] >= 50
+    assert stages["safety"]["start_ms"] >= stages["generate"]["start_ms"] + stages["generate"]["ms"]
+    assert result["debug"]["total_ms"] >= retrieve_done
+
+
+def test_ask_exports_stage_histograms():
+    """Этапы попадают в /metrics с метками intent и engine."""
+    from ai.metrics import render_metrics
+
+    core = ConsultantCore(
+        retriever=_SlowRetriever(),
+        generator=LocalGenerator(use_gigachat=False),
+    )
+    asyncio.run(core.ask("Как оспорить увольнение?", intent="analysis"))
+
+    text = render_metrics()
+    assert (
+        'legalai_ai_stage_seconds_bucket{stage="retrieve",intent="analysis",'
+        'engine="fallback",le="0.1"}'
+    ) in text
+    assert 'legalai_ai_request_seconds_count{intent="analysis",engine="fallback"}' in text
+
+
+class _BatchRetriever(_SlowRetriever):
+    def __init__(self):
+        self.batches = []
+
+    def retrieve_many(self, queries, top_k=8):
+        self.batches.append(list(queries))
+        return [[(n, f"Статья {n}. {q}")] for n, q in enumerate(queries, start=1)]
+
+
+class _TrackingGenerator(LocalGenerator):
+    def __init__(self):
+        super().__init__(use_gigachat=False)
+        self.active = self.peak = self.calls = 0
+
+    async def generate(self, query, documents=None, context_docs=None, intent=None):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return f"Ответ: {query}"
+
+
+def test_ask_many_dedupes_batches_retrieval_and_bounds_generation():
+    retriever = _BatchRetriever()
+    generator = _TrackingGenerator()
+    core = ConsultantCore(retriever=retriever, generator=generator)
+    questions = [f"Вопрос номер {n % 5}" for n in range(12)] + [" ", {"query": "Вопрос номер 1"}]
+
+    async def collect():
+        return [item async for item in core.ask_many(questions, concurrency=2)]
+
+    results = dict(asyncio.run(collect()))
+
+    assert sorted(results) == list(range(len(questions)))
+    assert retriever.batches == [[f"Вопрос номер {n}" for n in range(5)] + [""]]
+    assert generator.calls == 5
+    assert generator.peak == 2
+    assert isinstance(results[12], ValueError)
+    assert results[13] is results[1]
+    assert "Вопрос номер 3" in results[8]["answer"]
+
+
+def test_ask_many_retrieves_by_bare_question():
+    """Поиск идёт по intent_text, а не по тексту со служебными инструкциями."""
+    retriever = _BatchRetriever()
+    core = ConsultantCore(retriever=retriever, generator=_TrackingGenerator())
+    specs = [
+        {"query": "ПРАВИЛА\nВложение А\nСрок исковой давности?", "intent_text": "Срок исковой давности?"},
+        {"query": "ПРАВИЛА\nВложение Б\nСрок исковой давности?", "intent_text": "Срок исковой давности?"},
+    ]
+
+    async def collect():
+        return [item async for item in core.ask_many(specs)]
+
+    results = dict(asyncio.run(collect()))
+
+    assert retriever.batches == [["Срок исковой давности?"]]
+    assert "Вложение А" in results[0]["answer"] and "Вложение Б" in results[1]["answer"]
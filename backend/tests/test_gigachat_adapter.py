@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import httpx
+
+from ai.generators.gigachat_adapter import GigaChatAdapter
+from ai.generators.local_gen import LocalGenerator
+from ai.generators.token_store import TokenStore
+
+
+class _StubGigaChat:
+    """Локальная заглушка OAuth + chat/completions с задержкой ответа."""
+
+    def __init__(self, delay: float = 0.2, expires_in: float = 1800) -> None:
+        self.delay = delay
+        self.expires_in = expires_in
+        self.auth_calls = 0
+        self.chat_calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/oauth"):
+            self.auth_calls += 1
+            await asyncio.sleep(0.01)
+            return httpx.Response(
+                200, json={"access_token": "t", "expires_in": self.expires_in}
+            )
+        self.chat_calls += 1
+        assert request.headers["Authorization"] == "Bearer t"
+        await asyncio.sleep(self.delay)
+        return httpx.Response(
+            200, json={"choices": [{"message": {"content": " ответ "}}]}
+        )
+
+
+def _adapter(stub: _StubGigaChat, **kwargs) -> GigaChatAdapter:
+    kwargs.setdefault("renew_jitter", 0)
+    return GigaChatAdapter(
+        client_id="id",
+        client_secret="secret",
+        auth_url="https://auth.test/api/v2/oauth",
+        chat_url="https://chat.test/api/v1/chat/completions",
+        transport=httpx.MockTransport(stub),
+        **kwargs,
+    )
+
+
+def test_chat_calls_run_concurrently_on_shared_client():
+    """Медленные ответы модели не выстраиваются в очередь на event loop."""
+    stub = _StubGigaChat(delay=0.2)
+    adapter = _adapter(stub)
+
+    async def main():
+        await adapter.chat([{"role": "user", "content": "прогрев"}])
+        client = adapter._client
+        started = time.perf_counter()
+        answers = await asyncio.gather(
+            *(adapter.chat([{"role": "user", "content": "вопрос"}]) for _ in range(5))
+        )
+        elapsed = time.perf_counter() - started
+        assert adapter._client is client
+        await adapter.aclose()
+        return answers, elapsed
+
+    answers, elapsed = asyncio.run(main())
+    assert answers == ["ответ"] * 5
+    assert elapsed < 0.6
+    assert stub.chat_calls == 6
+    assert stub.auth_calls == 1
+
+
+def test_local_generator_generate_is_awaitable():
+    """LocalGenerator.generate — корутина; ошибки GigaChat дают fallback."""
+    generator = LocalGenerator(use_gigachat=False)
+    generator.gigachat = _adapter(_StubGigaChat(delay=0))
+
+    docs = [(1, "Статья 333. Уменьшение неустойки")]
+    assert asyncio.run(generator.generate("неустойка", context_docs=docs)) == "ответ"
+
+    generator.gigachat.transport = httpx.MockTransport(lambda request: httpx.Response(500))
+    generator.gigachat._client = None
+    answer = asyncio.run(generator.generate("неустойка", context_docs=docs))
+    assert "Статья 333" in answer
+
+
+def test_token_refresh_is_single_flight_and_shared(tmp_path):
+    """Одновременные запросы делают один OAuth-вызов; второй «процесс»
+    берёт токен из общего кэша."""
+    stub = _StubGigaChat(delay=0)
+    store = TokenStore(str(tmp_path / "token.db"))
+    first = _adapter(stub, token_store=store)
+    second = _adapter(stub, token_store=store)
+
+    async def main():
+        await asyncio.gather(
+            *(first.chat([{"role": "user", "content": "вопрос"}]) for _ in range(20))
+        )
+        await second.chat([{"role": "user", "content": "вопрос"}])
+        await first.aclose()
+        await second.aclose()
+
+    asyncio.run(main())
+    assert stub.auth_calls == 1
+    assert second.token_stats == {"oauth_requests": 0, "from_store": 1, "renewals": 0}
+
+
+def test_token_renewed_in_background():
+    """Токен обновляется до истечения без участия запросов."""
+    stub = _StubGigaChat(delay=0, expires_in=1.0)
+    adapter = _adapter(stub, renew_before=0.7)
+    adapter.token_margin = 0
+
+    async def main():
+        await adapter.chat([{"role": "user", "content": "вопрос"}])
+        await asyncio.sleep(0.75)
+        await adapter.aclose()
+
+    asyncio.run(main())
+    assert stub.auth_calls == 2
+    assert adapter.token_stats["renewals"] == 1
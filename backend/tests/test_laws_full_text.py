@@ -0,0 +1,124 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+
+from app.laws import fetch_full_text as full_text_module
+from app.laws.fetch_full_text import fetch_full_text_async
+from app.laws.models import Law
+
+
+@pytest.fixture()
+def laws_engine(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'laws.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Law.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            Law.__table__.insert(),
+            [
+                {
+                    "source": "test",
+                    "external_id": f"g{i}",
+                    "title": f"Закон {i}",
+                    "link": f"https://{'a' if i % 2 else 'b'}.test/doc/{i}",
+                    "country": "RU",
+                    "language": "ru",
+                }
+                for i in range(1, 31)
+            ],
+        )
+    monkeypatch.setattr(full_text_module, "SessionLocal", sessionmaker(bind=engine))
+    return engine
+
+
+class _StubPages:
+    """Страницы законов: doc/7 сначала отвечает 503, doc/9 — 404."""
+
+    def __init__(self) -> None:
+        self.requested = []
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.flaky = {7: 1}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        law_id = int(request.url.path.rsplit("/", 1)[1])
+        self.requested.append(law_id)
+        self.in_flight[host] = self.in_flight.get(host, 0) + 1
+        self.max_in_flight[host] = max(self.max_in_flight.get(host, 0), self.in_flight[host])
+        try:
+            await asyncio.sleep(0.01)
+            if self.flaky.get(law_id):
+                self.flaky[law_id] -= 1
+                return httpx.Response(503)
+            if law_id == 9:
+                return httpx.Response(404)
+            return httpx.Response(200, text=f"<html><body><p>Текст закона {law_id}</p></body></html>")
+        finally:
+            self.in_flight[host] -= 1
+
+
+def _run(stub, limit):
+    return asyncio.run(
+        fetch_full_text_async(
+            limit,
+            transport=httpx.MockTransport(stub),
+            concurrency=6,
+            per_host=2,
+            delay=0,
+            commit_every=10,
+            backoff=0.01,
+        )
+    )
+
+
+def test_full_text_fetch_is_parallel_resumable_and_retries(laws_engine):
+    stub = _StubPages()
+
+    first = _run(stub, limit=12)
+    assert first["processed"] + first["retried"] >= 12
+    with laws_engine.connect() as conn:
+        cursor = conn.execute(text("SELECT last_id FROM law_fetch_cursor")).scalar()
+    assert cursor == 12
+
+    second = _run(stub, limit=None)
+
+    with laws_engine.connect() as conn:
+        rows = dict(conn.execute(select(Law.id, Law.full_text)).all())
+        cursor = conn.execute(text("SELECT last_id FROM law_fetch_cursor")).scalar()
+
+    assert rows[1] == "Текст закона 1"
+    assert rows[7] == "Текст закона 7"  # повтор после 503
+    assert rows[9] is None  # 404 — пропуск без повторов
+    assert sum(1 for value in rows.values() if value) == 29
+    assert first["updated"] + second["updated"] == 29
+    # второй запуск продолжил с курсора, а не начал сначала
+    assert sorted(stub.requested) == sorted(list(range(1, 31)) + [7])
+    # очередь разобрана — следующий проход начнётся сначала
+    assert cursor == 0
+    assert max(stub.max_in_flight.values()) <= 2
+
+
+def test_overlapping_runs_are_skipped(tmp_path, monkeypatch):
+    lock = str(tmp_path / "full_text.lock")
+    monkeypatch.setattr(full_text_module, "LAWS_FULLTEXT_LOCK", lock)
+    started = []
+
+    async def fake_fetch(limit):
+        started.append(limit)
+        return {"processed": 0}
+
+    monkeypatch.setattr(full_text_module, "fetch_full_text_async", fake_fetch)
+
+    with full_text_module._run_lock(lock) as locked:
+        assert locked
+        full_text_module.fetch_full_text_batch(None)  # cron --all при идущем запуске
+    assert started == []
+
+    full_text_module.fetch_full_text_batch(None)
+    assert started == [None]
@@ -0,0 +1,305 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+from app.laws import sync as sync_module
+from app.laws.models import Law
+from app.laws.sync import Feed, sync_feeds
+
+
+@pytest.fixture()
+def laws_engine(tmp_path, monkeypatch):
+    """Отдельная SQLite с таблицей laws вместо базы приложения."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'laws.db'}")
+    Law.__table__.create(engine)
+    monkeypatch.setattr(sync_module, "SessionLocal", sessionmaker(bind=engine))
+    return engine
+
+
+def _rss(guid: str) -> bytes:
+    return (
+        "<rss><channel><item>"
+        f"<title>Федеральный закон № {guid}-ФЗ</title>"
+        f"<link>https://publication.pravo.gov.ru/document/{guid}</link>"
+        f"<guid>{guid}</guid>"
+        "<pubDate>Mon, 06 Jan 2025 10:00:00 +0300</pubDate>"
+        "</item></channel></rss>"
+    ).encode("utf-8")
+
+
+class _StubFeeds:
+    """Ленты с задержкой; считает одновременные запросы по хостам."""
+
+    def __init__(self, delay: float = 0.2, failures: int = 0) -> None:
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+        self.in_flight = {}
+        self.max_in_flight = {}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.calls += 1
+        self.in_flight[host] = self.in_flight.get(host, 0) + 1
+        self.max_in_flight[host] = max(self.max_in_flight.get(host, 0), self.in_flight[host])
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                self.failures -= 1
+                return httpx.Response(503)
+            return httpx.Response(200, content=_rss(request.url.params.get("block", "main")))
+        finally:
+            self.in_flight[host] -= 1
+
+
+def _record_saves(monkeypatch):
+    saved = []
+    writers = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def save(items, law_type, source=sync_module.DEFAULT_SOURCE):
+        with lock:
+            writers["now"] += 1
+            writers["max"] = max(writers["max"], writers["now"])
+        time.sleep(0.01)
+        saved.append((law_type, source, [item["external_id"] for item in items]))
+        with lock:
+            writers["now"] -= 1
+        return len(items)
+
+    monkeypatch.setattr(sync_module, "_save_items_to_db", save)
+    return saved, writers
+
+
+def test_feeds_download_concurrently_with_per_host_cap(laws_engine, monkeypatch):
+    """Ленты качаются параллельно, но не больше лимита на хост; пишет один писатель."""
+    saved, writers = _record_saves(monkeypatch)
+    stub = _StubFeeds(delay=0.2)
+    feeds = [Feed(f"https://api.test/rss?block=b{i}", law_type="general") for i in range(6)]
+    feeds.append(Feed("https://extra.test/rss", law_type="extra", source="https://extra.test/rss"))
+
+    started = time.perf_counter()
+    total = asyncio.run(
+        sync_feeds(
+            feeds,
+            transport=httpx.MockTransport(stub),
+            per_host_concurrency=3,
+            politeness_delay=0,
+        )
+    )
+    elapsed = time.perf_counter() - started
+
+    assert total == 7
+    assert stub.max_in_flight == {"api.test": 3, "extra.test": 1}
+    # 6 лент одного хоста по 3 за раз — два «раунда», а не 7 последовательных
+    assert elapsed < 0.2 * 4
+    assert sorted(ids[0] for _, _, ids in saved) == sorted([f"b{i}" for i in range(6)] + ["main"])
+    assert ("extra", "https://extra.test/rss", ["main"]) in saved
+    assert writers["max"] == 1
+
+
+def test_feed_retries_transient_errors_and_skips_dead_feed(laws_engine, monkeypatch):
+    """503 повторяется с задержкой; упавшая лента не мешает остальным."""
+    saved, _ = _record_saves(monkeypatch)
+    stub = _StubFeeds(delay=0, failures=2)
+
+    def handler(request: httpx.Request):
+        if request.url.host == "dead.test":
+            raise httpx.ConnectError("refused", request=request)
+        return stub(request)
+
+    total = asyncio.run(
+        sync_feeds(
+            [Feed("https://api.test/rss", law_type="general"), Feed("https://dead.test/rss", law_type="extra")],
+            transport=httpx.MockTransport(handler),
+            politeness_delay=0,
+            retries=2,
+            backoff=0.01,
+        )
+    )
+
+    assert total == 1
+    assert stub.calls == 3
+    assert saved == [("general", sync_module.DEFAULT_SOURCE, ["main"])]
+
+
+def test_save_items_bulk_inserts_and_skips_known(laws_engine, monkeypatch):
+    """Страница из 200 элементов — несколько запросов, а не SELECT+INSERT на каждый."""
+    engine = laws_engine
+    monkeypatch.setattr(sync_module, "LAWS_BULK_CHUNK_SIZE", 150)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def items(ids):
+        return [
+            {
+                "external_id": f"g{i}",
+                "title": f"Федеральный закон № {i}-ФЗ",
+                "link": f"https://publication.pravo.gov.ru/document/{i}",
+                "date_published": None,
+                "number": f"№ {i}-ФЗ",
+            }
+            for i in ids
+        ]
+
+    assert sync_module._save_items_to_db(items(range(50)), law_type="general") == 50
+
+    statements.clear()
+    # 50 уже в базе, g199 повторяется внутри страницы
+    page = items(range(200)) + items([199])
+    assert sync_module._save_items_to_db(page, law_type="general") == 150
+    assert len(statements) <= 6
+
+    with engine.connect() as conn:
+        ids = conn.scalars(select(Law.external_id)).all()
+        created_at = conn.scalar(select(Law.created_at).limit(1))
+    assert len(ids) == len(set(ids)) == 200
+    assert created_at is not None
+
+
+def test_unchanged_feeds_are_not_parsed_again(laws_engine, monkeypatch):
+    """Повторный запуск: 304 по ETag и совпавший хэш тела не доходят до записи."""
+    saved, _ = _record_saves(monkeypatch)
+    requests_seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_seen.append((request.url.host, request.headers.get("If-None-Match")))
+        if request.url.host == "etag.test":
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, content=_rss("e1"), headers={"ETag": '"v1"'})
+        # без валидаторов — остаётся сравнение хэша тела
+        return httpx.Response(200, content=_rss("p1"))
+
+    feeds = [Feed("https://etag.test/rss", law_type="general"), Feed("https://plain.test/rss", law_type="extra")]
+
+    def run(**kwargs):
+        return asyncio.run(
+            sync_feeds(feeds, transport=httpx.MockTransport(handler), politeness_delay=0, **kwargs)
+        )
+
+    assert run() == 2
+    assert len(saved) == 2
+
+    requests_seen.clear()
+    assert run() == 0
+    assert len(saved) == 2
+    assert sorted(requests_seen) == [("etag.test", '"v1"'), ("plain.test", None)]
+
+    # force — безусловные запросы и повторный разбор
+    assert run(force=True) == 2
+    assert len(saved) == 4
+
+
+def test_unexpected_304_means_no_changes(laws_engine, monkeypatch, caplog):
+    """304 на безусловный запрос (кэш/прокси) не роняет источник."""
+    saved, _ = _record_saves(monkeypatch)
+    status = {"code": 304}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers.get("If-None-Match") is None
+        if status["code"] == 304:
+            return httpx.Response(304)
+        return httpx.Response(200, content=_rss("c1"))
+
+    def run():
+        return asyncio.run(
+            sync_feeds(
+                [Feed("https://cache.test/rss", law_type="general")],
+                transport=httpx.MockTransport(handler),
+                politeness_delay=0,
+            )
+        )
+
+    with caplog.at_level("WARNING"):
+        assert run() == 0
+    assert saved == []
+    assert not [r for r in caplog.records if r.levelname == "ERROR"]
+
+    status["code"] = 200
+    assert run() == 1
+
+
+class _PagedFeed:
+    """Блок API: элементы от новых к старым, pageSize + page."""
+
+    def __init__(self, count: int) -> None:
+        self.items = [f"a{i}" for i in range(count, 0, -1)]
+        self.pages = []
+        self.ignore_page = False
+
+    def add(self, count: int) -> None:
+        start = len(self.items)
+        self.items = [f"a{i}" for i in range(start + count, start, -1)] + self.items
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        size = int(request.url.params["pageSize"])
+        page = 1 if self.ignore_page else int(request.url.params.get("page", "1"))
+        self.pages.append((size, page))
+        chunk = self.items[(page - 1) * size:page * size]
+        body = "".join(
+            f"<item><title>{guid}</title><link>https://p.test/{guid}</link><guid>{guid}</guid>"
+            f"<pubDate>Mon, 06 Jan 2025 10:{int(guid[1:]) % 60:02d}:00 +0000</pubDate></item>"
+            for guid in chunk
+        )
+        return httpx.Response(200, content=f"<rss><channel>{body}</channel></rss>".encode("utf-8"))
+
+
+def test_api_blocks_sync_incrementally_from_high_water_mark(laws_engine, monkeypatch):
+    """После первой загрузки читаются только новые акты; при разрыве — следующие страницы."""
+    saved, _ = _record_saves(monkeypatch)
+    monkeypatch.setattr(sync_module, "LAWS_SYNC_PAGE_SIZE", 5)
+    stub = _PagedFeed(30)
+    feed = Feed("https://p.test/api/rss?block=court&pageSize=200", law_type="court_ruling", paged=True)
+
+    def run():
+        stub.pages.clear()
+        return asyncio.run(sync_feeds([feed], transport=httpx.MockTransport(stub), politeness_delay=0))
+
+    # первая синхронизация — полная лента одним запросом
+    assert run() == 30
+    assert stub.pages == [(200, 1)]
+
+    # два новых акта: одна страница, разбор до первого известного
+    stub.add(2)
+    assert run() == 2
+    assert stub.pages == [(5, 1)]
+    assert saved[-1][2] == ["a32", "a31"]
+
+    # 12 новых — больше страницы: листаем, пока не встретится a32
+    stub.add(12)
+    assert run() == 12
+    assert stub.pages == [(5, 1), (5, 2), (5, 3)]
+    assert saved[-1][2] == [f"a{i}" for i in range(44, 32, -1)]
+
+    # ничего нового: тело первой страницы не изменилось
+    assert run() == 0
+    assert len(saved) == 3
+
+
+def test_paging_stops_when_portal_ignores_page_parameter(laws_engine, monkeypatch):
+    """Портал без поддержки page отдаёт одну и ту же страницу — листание прекращается."""
+    saved, _ = _record_saves(monkeypatch)
+    monkeypatch.setattr(sync_module, "LAWS_SYNC_PAGE_SIZE", 5)
+    stub = _PagedFeed(10)
+    feed = Feed("https://p.test/api/rss?block=court&pageSize=200", law_type="court_ruling", paged=True)
+
+    def run():
+        stub.pages.clear()
+        return asyncio.run(sync_feeds([feed], transport=httpx.MockTransport(stub), politeness_delay=0))
+
+    assert run() == 10
+
+    stub.add(12)
+    stub.ignore_page = True
+    # вторая «страница» совпала с первой: вместо LAWS_SYNC_MAX_PAGES одинаковых
+    # запросов — остановка и один запрос полной ленты, разрыв не теряется
+    assert run() == 12
+    assert stub.pages == [(5, 1), (5, 1), (200, 1)]
+    assert saved[-1][2] == [f"a{i}" for i in range(22, 10, -1)]
@@ -0,0 +1,39 @@
+from ai.rag.ingest import html_to_text, split_into_passages
+
+
+def test_split_into_passages_by_article_part_point():
+    """Закон режется на статьи / части / пункты, ссылки внутри абзаца не режут текст."""
+    html = (
+        "<h1>Трудовой кодекс</h1>"
+        "<p>Статья 81. Расторжение трудового договора по инициативе работодателя</p>"
+        "<p>1. Трудовой договор может быть расторгнут работодателем в случаях:</p>"
+        "<p>1) ликвидации организации;</p>"
+        "<p>2) сокращения численности, см. ст. 180;</p>"
+        "<p>2. Увольнение по основанию пункта 2 части первой</p>"
+        "<p>Статья 82. Обязательное участие выборного органа</p>"
+    )
+    text = html_to_text(html)
+    passages = split_into_passages(text)
+
+    refs = [(p.article, p.part, p.point) for p in passages]
+    assert refs == [
+        (None, None, None),
+        ("81", "1", "1"),
+        ("81", "1", "2"),
+        ("81", "2", None),
+        ("82", None, None),
+    ]
+    # заголовок статьи остаётся в первом фрагменте статьи
+    assert passages[1].text.startswith("Статья 81.")
+    for p in passages:
+        assert text[p.start:p.end] == p.text
+
+
+def test_long_passage_is_windowed():
+    """Слишком длинная статья делится на окна не длиннее max_chars."""
+    text = "Статья 1. Общие положения\n" + "\n".join(["строка текста закона"] * 50)
+    passages = split_into_passages(text, max_chars=200)
+    assert len(passages) > 1
+    assert all(len(p.text) <= 200 for p in passages)
+    assert all(p.article == "1" for p in passages)
+
@@ -0,0 +1,499 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from ai.rag import ingest as ingest_module
+from ai.rag import retriever as retriever_module
+from ai.rag.cache import RetrievalCache, bump_generation
+from ai.rag.dense import DenseIndex, build_dense_index
+from ai.rag.executor import RetrievalExecutor
+from ai.rag.hybrid import HybridRetriever
+from ai.rag.ingest import ensure_schema, index_document
+from ai.rag.pool import SQLiteConnectionPool
+from ai.rag.ranker import DocumentRanker
+from ai.rag.retriever import DocumentRetriever, QueryNormalizer
+from tasks.reindex_laws import reindex_all
+
+
+@pytest.fixture()
+def laws_db(tmp_path):
+    """Минимальная база законов: law_documents + law_documents_fts."""
+    path = tmp_path / "legalai.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE law_documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            act_id INTEGER,
+            source_id INTEGER,
+            external_id TEXT,
+            chunk_index INTEGER,
+            content_html TEXT
+        );
+        CREATE VIRTUAL TABLE law_documents_fts USING fts5(
+            content_html, content='law_documents', content_rowid='id'
+        );
+        """
+    )
+    docs = [
+        "<p>Статья 81. Расторжение трудового договора по инициативе работодателя</p>",
+        "<p>Статья 333. Уменьшение неустойки</p>",
+        "<p>Статья 10. Пределы осуществления гражданских прав</p>",
+    ]
+    for i, html in enumerate(docs, start=1):
+        conn.execute(
+            "INSERT INTO law_documents (external_id, chunk_index, content_html) VALUES (?, 0, ?)",
+            (f"doc-{i}", html),
+        )
+    conn.execute("INSERT INTO law_documents_fts(law_documents_fts) VALUES ('rebuild')")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def test_retrieve_fts_and_like(laws_db):
+    """FTS находит документ по слову, LIKE-fallback — по подстроке."""
+    retriever = DocumentRetriever(db_path=laws_db)
+
+    docs = retriever.retrieve("неустойки")
+    assert [doc_id for doc_id, _ in docs] == [2]
+
+    # "трудов" не является целым словом -> FTS пуст, срабатывает LIKE
+    docs = retriever.retrieve("трудов")
+    assert [doc_id for doc_id, _ in docs] == [1]
+
+    # LIKE не зависит от регистра кириллицы: «Уменьшение» в тексте
+    docs = retriever.retrieve("уменьшени")
+    assert [doc_id for doc_id, _ in docs] == [2]
+
+
+def test_pool_reuses_connection_per_thread(laws_db):
+    """Повторные запросы в одном потоке используют одно соединение."""
+    pool = SQLiteConnectionPool(laws_db, health_check_interval=0)
+    retriever = DocumentRetriever(db_path=laws_db, pool=pool)
+
+    for _ in range(5):
+        retriever.retrieve("неустойки")
+
+    thread = threading.Thread(target=retriever.retrieve, args=("неустойки",))
+    thread.start()
+    thread.join()
+
+    stats = retriever.pool_stats()
+    assert stats["created"] == 2
+    assert stats["reused"] > 0
+    assert stats["health_failures"] == 0
+
+    pool.close_all()
+    assert pool.stats()["open_connections"] == 0
+
+
+def test_pool_is_read_only(laws_db):
+    """Соединения пула не могут писать в базу законов."""
+    pool = SQLiteConnectionPool(laws_db)
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection() as conn:
+            conn.execute("DELETE FROM law_documents")
+
+
+def test_pool_fails_on_missing_db_and_closes_dead_thread_connections(laws_db, tmp_path):
+    """Неверный путь — ошибка без создания файла; соединения ушедших потоков закрываются."""
+    missing = tmp_path / "missing.db"
+    with pytest.raises(sqlite3.OperationalError):
+        with SQLiteConnectionPool(str(missing)).connection():
+            pass
+    assert not missing.exists()
+
+    pool = SQLiteConnectionPool(laws_db)
+    workers = [threading.Thread(target=pool.acquire) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+        worker.join()
+    # каждый новый поток закрывает соединения уже завершившихся
+    assert pool.stats()["open_connections"] == 1
+
+    pool.acquire()
+    stats = pool.stats()
+    assert stats["open_connections"] == 1
+    assert stats["closed"] == 3
+
+
+def test_retrieve_passages_with_offsets(laws_db):
+    """Режим passages возвращает фрагмент статьи, а не весь документ."""
+    conn = sqlite3.connect(laws_db)
+    ensure_schema(conn)
+    html = (
+        "<h1>Гражданский кодекс</h1>"
+        "<p>Статья 330. Понятие неустойки</p><p>1. Неустойкой признается денежная сумма.</p>"
+        "<p>Статья 333. Уменьшение неустойки</p><p>1. Если подлежащая уплате неустойка явно несоразмерна.</p>"
+    )
+    cur = conn.execute(
+        "INSERT INTO law_documents (external_id, chunk_index, content_html) VALUES ('gk', 0, ?)",
+        (html,),
+    )
+    doc_id = cur.lastrowid
+    assert index_document(conn, doc_id, html) == 3
+    conn.close()
+    reindex_all(laws_db)
+
+    retriever = DocumentRetriever(db_path=laws_db, mode="passages")
+    passages = retriever.retrieve_passages("несоразмерна", top_k=3)
+    assert len(passages) == 1
+    best = passages[0]
+    assert best["document_id"] == doc_id
+    assert best["article"] == "333"
+    assert best["text"].startswith("Статья 333.")
+    assert best["end"] - best["start"] == len(best["text"])
+
+    assert retriever.retrieve("несоразмерна") == [(doc_id, best["text"])]
+
+
+def test_unpopulated_indexes_are_ignored_until_reindex(laws_db):
+    """Пустые индексы после миграции схемы не прячут результаты; reindex подхватывается без рестарта."""
+    conn = sqlite3.connect(laws_db)
+    ensure_schema(conn)
+    conn.close()
+
+    cache = RetrievalCache(maxsize=8, ttl=60, check_interval=0)
+    retriever = DocumentRetriever(db_path=laws_db, cache=cache)
+    # старый индекс по HTML и LIKE по content_html (content_text ещё NULL)
+    assert [d for d, _ in retriever.retrieve("неустойки")] == [2]
+    assert [d for d, _ in retriever.retrieve("трудов")] == [1]
+    passages = DocumentRetriever(db_path=laws_db, mode="passages")
+    assert [d for d, _ in passages.retrieve("трудов")] == [1]
+
+    reindex_all(laws_db)
+    assert retriever.retrieve("неустойки") == [(2, "Статья 333. Уменьшение неустойки")]
+
+
+def test_reindex_fills_plain_text(laws_db):
+    """После переиндексации поиск идёт по content_text без HTML-тегов."""
+    reindex_all(laws_db)
+
+    conn = sqlite3.connect(laws_db)
+    text = conn.execute("SELECT content_text FROM law_documents WHERE id = 2").fetchone()[0]
+    conn.close()
+    assert text == "Статья 333. Уменьшение неустойки"
+
+    retriever = DocumentRetriever(db_path=laws_db)
+    assert retriever.retrieve("неустойки") == [(2, text)]
+    # запасной поиск по триграммам тоже читает только content_text
+    assert retriever.retrieve("трудов")[0][1].startswith("Статья 81.")
+
+
+def test_trigram_fallback_substring_and_typo(laws_db):
+    """После промаха FTS подстроки и опечатки ищутся по триграммам, без LIKE."""
+    reindex_all(laws_db)
+    retriever = DocumentRetriever(db_path=laws_db, cache=RetrievalCache(maxsize=0))
+
+    like_before = retriever_module.RAG_SEARCH_SECONDS.counts().get(("like",), 0)
+    # часть слова: «гражданск» -> «гражданских»
+    assert [doc_id for doc_id, _ in retriever.retrieve("гражданск")] == [3]
+    # опечатка: «неустоки» не встречается как подстрока
+    assert retriever.retrieve("неустоки")[0][0] == 2
+    assert retriever_module.RAG_SEARCH_SECONDS.counts().get(("like",), 0) == like_before
+
+    # слова короче триграммы индекс не ищет — решает LIKE, а не пустой ответ
+    assert [doc_id for doc_id, _ in retriever.retrieve("тр")] == [1]
+    assert retriever_module.RAG_SEARCH_SECONDS.counts().get(("like",), 0) == like_before + 1
+
+
+class _FakeParse:
+    def __init__(self, normal_form):
+        self.normal_form = normal_form
+
+
+class _FakeMorph:
+    """Подмена pymorphy2: сводит словоформы «неустойк*» к одной лемме."""
+
+    def parse(self, word):
+        if word.startswith("неустойк"):
+            return [_FakeParse("неустойка")]
+        return [_FakeParse(word)]
+
+
+def test_lemma_index_matches_inflected_forms(laws_db, monkeypatch):
+    """Запрос и документ совпадают по леммам, а не по словоформам."""
+    monkeypatch.setattr(retriever_module, "MORPH", _FakeMorph())
+    ingest_module._lemma.cache_clear()
+    retriever_module.lemmatize_word.cache_clear()
+    try:
+        conn = sqlite3.connect(laws_db)
+        ensure_schema(conn)
+        html = "<p>Статья 330. Неустойкой признается денежная сумма</p>"
+        doc_id = conn.execute(
+            "INSERT INTO law_documents (external_id, chunk_index, content_html) VALUES ('gk', 0, ?)",
+            (html,),
+        ).lastrowid
+        index_document(conn, doc_id, html)
+        conn.close()
+        reindex_all(laws_db)
+
+        retriever = DocumentRetriever(db_path=laws_db)
+        # «неустойку» / «неустойки» / «Неустойкой» — одна лемма
+        docs = retriever.retrieve("неустойку")
+        assert sorted(d for d, _ in docs) == [2, doc_id]
+
+        passages = retriever.retrieve_passages("неустойку")
+        assert sorted(p["document_id"] for p in passages) == [2, doc_id]
+    finally:
+        ingest_module._lemma.cache_clear()
+        retriever_module.lemmatize_word.cache_clear()
+
+
+def test_result_cache_hits_and_invalidation(laws_db):
+    """Повторный запрос берётся из кэша; bump_generation сбрасывает кэш."""
+    cache = RetrievalCache(maxsize=8, ttl=60, check_interval=0)
+    retriever = DocumentRetriever(db_path=laws_db, cache=cache)
+
+    first = retriever.retrieve("неустойки")
+    # другой порядок / регистр — тот же набор термов
+    assert retriever.retrieve("НЕУСТОЙКИ") == first
+    stats = retriever.cache_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    conn = sqlite3.connect(laws_db)
+    conn.execute("UPDATE law_documents SET content_html = '<p>Статья 333. Снижение</p>' WHERE id = 2")
+    conn.execute("INSERT INTO law_documents_fts(law_documents_fts) VALUES ('rebuild')")
+    bump_generation(conn)
+    conn.close()
+
+    assert retriever.retrieve("неустойки") == []
+    assert retriever.cache_stats()["invalidations"] == 1
+
+
+def test_retrieve_normalizes_query_once(laws_db):
+    """Точный поиск и ветки passages -> documents получают один NormalizedQuery."""
+    retriever = DocumentRetriever(db_path=laws_db, mode="passages")
+    retriever.retrieve("неустойки ст. 333 ГК")
+    assert retriever.normalizer_stats()["queries"] == 1
+
+
+def test_query_normalizer_abbreviations_and_timings():
+    """Сокращения раскрываются одной регуляркой, этапы замеряются."""
+    normalizer = QueryNormalizer()
+    result = normalizer.normalize("Неустойка по ГК РФ, ст. 333 и КоАП")
+
+    assert result.text == (
+        "неустойка по гражданский кодекс, ст. 333 и "
+        "кодекс об административных правонарушениях"
+    )
+    assert result.refs["articles"] == ["333"]
+    assert result.tokens[0] == "333"
+    assert set(result.timings) == set(QueryNormalizer.STAGES)
+
+    stats = normalizer.stats()
+    assert stats["queries"] == 1
+    assert set(stats["avg_us"]) == set(QueryNormalizer.STAGES)
+
+
+class _BagOfWordsEmbedder:
+    """Детерминированный «эмбеддер» для тестов: мешок слов по хэшу."""
+
+    name = "test-bow"
+
+    def embed(self, texts):
+        np = pytest.importorskip("numpy")
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, hash(word.strip(".,")) % 64] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_dense_retrieval_from_mmap_index(laws_db, tmp_path, dtype):
+    """Dense-индекс строится офлайн и ищет фрагменты по косинусу."""
+    pytest.importorskip("numpy")
+    reindex_all(laws_db)
+
+    index_dir = tmp_path / "dense"
+    conn = sqlite3.connect(laws_db)
+    count = build_dense_index(conn, _BagOfWordsEmbedder(), str(index_dir), dtype=dtype, batch_size=2)
+    conn.close()
+    assert count == 3
+
+    retriever = DocumentRetriever(
+        db_path=laws_db,
+        mode="dense",
+        dense_index=DenseIndex(str(index_dir)),
+        embedder=_BagOfWordsEmbedder(),
+    )
+    passages = retriever.retrieve_dense("уменьшение неустойки", top_k=2)
+    assert passages[0]["document_id"] == 2
+    assert passages[0]["score"] > passages[1]["score"]
+    assert retriever.retrieve("уменьшение неустойки", top_k=1)[0][0] == 2
+
+
+@pytest.mark.parametrize("fusion", ["rrf", "weighted"])
+def test_hybrid_fuses_lexical_and_dense(laws_db, tmp_path, fusion):
+    """Hybrid объединяет bm25 и dense без дублей фрагментов."""
+    pytest.importorskip("numpy")
+    reindex_all(laws_db)
+
+    index_dir = tmp_path / "dense"
+    conn = sqlite3.connect(laws_db)
+    build_dense_index(conn, _BagOfWordsEmbedder(), str(index_dir))
+    conn.close()
+
+    retriever = HybridRetriever(
+        db_path=laws_db,
+        dense_index=DenseIndex(str(index_dir)),
+        embedder=_BagOfWordsEmbedder(),
+        fusion=fusion,
+        lexical_depth=5,
+        dense_depth=5,
+    )
+    passages = retriever.retrieve_hybrid("уменьшение неустойки", top_k=3)
+    ids = [p["passage_id"] for p in passages]
+    assert len(ids) == len(set(ids)) == 3
+    assert passages[0]["document_id"] == 2
+    assert set(passages[0]["ranks"]) == {"lexical", "dense"}
+    assert retriever.retrieve("уменьшение неустойки", top_k=1)[0][0] == 2
+
+
+class _SlowScorer:
+    """Кросс-энкодер, который не укладывается в бюджет."""
+
+    def score(self, query, texts):
+        time.sleep(0.2)
+        return [float(i) for i in range(len(texts))]
+
+
+class _ReverseScorer:
+    """Кросс-энкодер, который предпочитает последний кандидат."""
+
+    def score(self, query, texts):
+        return [float(i) for i in range(len(texts))]
+
+
+def test_ranker_features_and_budget(laws_db):
+    """Совпадение номера статьи поднимает кандидата; медленный
+    кросс-энкодер отбрасывается по бюджету."""
+    docs = [
+        (1, "Статья 81. Расторжение трудового договора, см. ст. 333"),
+        (3, "Статья 10. Пределы осуществления гражданских прав"),
+        (2, "Статья 333. Уменьшение неустойки"),
+    ]
+    pool = SQLiteConnectionPool(laws_db)
+
+    ranker = DocumentRanker(pool=pool)
+    ranked = ranker.rank("ст. 333 ГК", docs)
+    assert [d for d, _ in ranked] == [2, 1, 3]
+
+    slow = DocumentRanker(pool=pool, cross_encoder=_SlowScorer(), budget_ms=20)
+    assert slow.rank("ст. 333 ГК", docs) == ranked
+    assert slow.stats()["budget_exceeded"] == 1
+
+    reverse = DocumentRanker(
+        pool=pool, cross_encoder=_ReverseScorer(), budget_ms=1000,
+        weights={"cross_encoder": 10.0},
+    )
+    assert reverse.rank("ст. 333 ГК", docs)[0][0] == 2
+    assert reverse.rank("пределы прав", docs)[0][0] == 2
+    assert reverse.stats()["cross_encoder"] == 2
+
+    # вид акта и дата — из legal_acts по law_documents.act_id
+    conn = sqlite3.connect(laws_db)
+    conn.execute("CREATE TABLE legal_acts (id INTEGER PRIMARY KEY, kind TEXT, date_adopted TEXT)")
+    conn.execute("INSERT INTO legal_acts VALUES (1, 'code', '2020-01-01')")
+    conn.execute("UPDATE law_documents SET act_id = 1 WHERE id = 2")
+    conn.commit()
+    conn.close()
+    feats = DocumentRanker(pool=pool).features("неустойка", docs)
+    assert feats[2]["law_type"] > 0 and feats[2]["recency"] > 0
+    assert feats[0]["law_type"] == 0.0
+
+
+def test_ranker_bm25_uses_stored_lemmas_within_budget(laws_db, monkeypatch):
+    """Леммы кандидатов берутся из базы; лемматизация на лету — только в пределах бюджета."""
+    from ai.rag import ranker as ranker_module
+
+    reindex_all(laws_db)
+    pool = SQLiteConnectionPool(laws_db)
+    docs = DocumentRetriever(db_path=laws_db, pool=pool, mode="passages").retrieve("статья", top_k=3)
+    assert len(docs) == 3
+
+    calls = []
+    monkeypatch.setattr(ranker_module, "lemmatize_text", lambda text: calls.append(text) or text.lower())
+    ranker = DocumentRanker(pool=pool)
+    assert ranker.rank("уменьшение неустойки", docs)[0][0] == 2
+    assert calls == []
+
+    # текста нет в базе, бюджет исчерпан — bm25 пропускается, ранжирование не ждёт
+    unknown = [(1, "Расторжение договора"), (2, "Неустойка")]
+    tight = DocumentRanker(pool=pool, budget_ms=0)
+    assert [d for d, _ in tight.rank("неустойка", unknown)] == [1, 2]
+    assert calls == []
+    assert tight.stats()["bm25_skipped"] == 2
+
+
+def test_exact_article_lookup(laws_db):
+    """«ст. 333 ГК» разрешается по law_article_index, а не через FTS."""
+    conn = sqlite3.connect(laws_db)
+    ensure_schema(conn)
+    docs = {
+        "gk": (
+            "<h1>Гражданский кодекс Российской Федерации</h1>"
+            "<p>Статья 333. Уменьшение неустойки</p>"
+            "<p>1. Если подлежащая уплате неустойка явно несоразмерна.</p>"
+            "<p>2. Уменьшение неустойки не допускается.</p>"
+        ),
+        "tk": (
+            "<h1>Трудовой кодекс Российской Федерации</h1>"
+            "<p>Статья 333. Продолжительность отпуска</p>"
+        ),
+    }
+    ids = {}
+    for key, html in docs.items():
+        ids[key] = conn.execute(
+            "INSERT INTO law_documents (external_id, chunk_index, content_html) VALUES (?, 0, ?)",
+            (key, html),
+        ).lastrowid
+    conn.commit()
+    conn.close()
+    reindex_all(laws_db)
+
+    retriever = DocumentRetriever(db_path=laws_db)
+
+    exact, rest = retriever.resolve_refs("ч. 2 ст. 333 ГК РФ")
+    assert [(p["document_id"], p["part"]) for p in exact] == [(ids["gk"], "2")]
+    assert rest == ""
+
+    exact, _ = retriever.resolve_refs("ст. 333 ТК")
+    assert {p["document_id"] for p in exact} == {ids["tk"]}
+
+    # Без кодекса номер статьи неоднозначен — точного поиска нет.
+    assert retriever.resolve_refs("ст. 333")[0] == []
+
+    docs = retriever.retrieve("ч. 2 ст. 333 ГК", top_k=3)
+    assert docs == [(ids["gk"], "2. Уменьшение неустойки не допускается.")]
+
+    # Остаток запроса ищется обычным FTS после точного совпадения.
+    docs = retriever.retrieve("пределы осуществления ст. 333 ГК", top_k=4)
+    assert [d for d, _ in docs] == [ids["gk"], ids["gk"], 3]
+
+
+def test_aretrieve_runs_in_bounded_executor(laws_db):
+    """aretrieve не блокирует loop; лишние запросы ждут в очереди пула."""
+    executor = RetrievalExecutor(max_workers=2)
+    retriever = DocumentRetriever(db_path=laws_db, executor=executor)
+
+    async def main():
+        return await asyncio.gather(
+            *(retriever.aretrieve("неустойки") for _ in range(6))
+        )
+
+    results = asyncio.run(main())
+    assert all([d for d, _ in docs] == [2] for docs in results)
+
+    stats = retriever.executor_stats()
+    assert stats["completed"] == 6
+    assert stats["queue_depth"] == 0 and stats["active"] == 0
+    assert stats["max_queue_depth"] >= 1
+    assert retriever.pool_stats()["created"] <= 2
@@ -22,7 +22,8 @@ PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
 0 3 * * * root cd ${BACKEND_DIR} && ${PYTHON_BIN} -m app.laws.sync >> ${LOG_DIR}/laws_sync.log 2>&1
 
 # 2) Ежедневно в 04:00 — дозагрузка полного текста для актов без full_text
-0 4 * * * root cd ${BACKEND_DIR} && ${PYTHON_BIN} -m app.laws.fetch_full_text >> ${LOG_DIR}/laws_full_text.log 2>&1
+#    (до конца очереди; прерванный запуск продолжится с курсора)
+0 4 * * * root cd ${BACKEND_DIR} && ${PYTHON_BIN} -m app.laws.fetch_full_text --all >> ${LOG_DIR}/laws_full_text.log 2>&1
 EOF
 
 # Права и владелец